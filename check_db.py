@@ -7,15 +7,15 @@ db_path = 'C:/Users/ASUS/Documents/Application/ParcelApp/prebuilt/parcelapp.db'
 conn = sqlite3.connect(db_path)
 cursor = conn.cursor()
 
-# Get counts
-cursor.execute("SELECT COUNT(*) FROM parcels WHERE parcel_type = 'individuel'")
-ind = cursor.fetchone()[0]
-
-cursor.execute("SELECT COUNT(*) FROM parcels WHERE parcel_type = 'collectif'")
-col = cursor.fetchone()[0]
-
-cursor.execute("SELECT COUNT(*) FROM parcels")
-total = cursor.fetchone()[0]
+# Get counts (materialized in parcel_stats by generate_prebuilt_db.py; counted on older DBs)
+try:
+    cursor.execute("SELECT parcel_type, parcel_count FROM parcel_stats WHERE dimension = 'type'")
+except sqlite3.OperationalError:
+    cursor.execute("SELECT parcel_type, COUNT(*) FROM parcels GROUP BY parcel_type")
+counts = dict(cursor.fetchall())
+ind = counts.get('individuel', 0)
+col = counts.get('collectif', 0)
+total = sum(counts.values())
 
 print(f'Database Stats:')
 print(f'  Total: {total}')
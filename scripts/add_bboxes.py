@@ -1,83 +1,49 @@
-import sqlite3, json, math
-
-DB='prebuilt/parcelapp.db'
-
-def parse_geom(raw):
-    if not raw: return None
-    if isinstance(raw, (dict, list)): return raw
-    try: return json.loads(raw)
-    except: return None
-
-def extract_points(geom):
-    if not geom: return []
-    t = geom.get('type')
-    c = geom.get('coordinates')
-    pts = []
-    try:
-        if t == 'Polygon' and isinstance(c, list) and len(c)>0:
-            for p in c[0]:
-                if isinstance(p, (list,tuple)) and len(p)>=2:
-                    pts.append((float(p[0]), float(p[1])))
-        elif t == 'MultiPolygon' and isinstance(c, list) and len(c)>0:
-            for poly in c:
-                if isinstance(poly, list) and len(poly)>0 and isinstance(poly[0], list):
-                    for p in poly[0]:
-                        if isinstance(p, (list,tuple)) and len(p)>=2:
-                            pts.append((float(p[0]), float(p[1])))
-    except Exception as e:
-        return []
-    return pts
+import sqlite3
 
+from geometry_codec import has_compact_geometry, load_geometry
+from spatial_index import geometry_bbox, populate_rtree
+try:
+    from geometry_metrics import BBOX_COLUMNS, METRIC_COLUMNS, write_metrics
+except ImportError:  # numpy not installed: bbox columns only, metric columns stay NULL
+    BBOX_COLUMNS, METRIC_COLUMNS, write_metrics = ('min_lat', 'min_lng', 'max_lat', 'max_lng'), (), None
 
-def compute_bbox(pts):
-    # pts are pairs (a,b) where order ambiguous (lon,lat) or (lat,lon)
-    if not pts: return None
-    # try assume lon,lat
-    lats = [p[1] for p in pts]
-    lngs = [p[0] for p in pts]
-    minLat = min(lats); maxLat = max(lats); minLng = min(lngs); maxLng = max(lngs)
-    if 4.0 <= minLat <= 20.0 and 4.0 <= maxLat <= 20.0 and -20.0 <= minLng <= -4.0 and -20.0 <= maxLng <= -4.0:
-        return (minLat, minLng, maxLat, maxLng)
-    # try swapped (lat,lon)
-    lats2 = [p[0] for p in pts]
-    lngs2 = [p[1] for p in pts]
-    minLat2=min(lats2); maxLat2=max(lats2); minLng2=min(lngs2); maxLng2=max(lngs2)
-    if 4.0 <= minLat2 <= 20.0 and 4.0 <= maxLat2 <= 20.0 and -20.0 <= minLng2 <= -4.0 and -20.0 <= maxLng2 <= -4.0:
-        return (minLat2, minLng2, maxLat2, maxLng2)
-    # fallback to first assumption
-    return (minLat, minLng, maxLat, maxLng)
+# Backfill for databases built before generate_prebuilt_db.py computed bboxes
+# and metrics itself. New builds already ship these columns and parcels_rtree.
+DB='prebuilt/parcelapp.db'
 
 conn = sqlite3.connect(DB)
 cur = conn.cursor()
-# add columns if missing
-try:
-    cur.execute('ALTER TABLE parcels ADD COLUMN min_lat REAL')
-    cur.execute('ALTER TABLE parcels ADD COLUMN min_lng REAL')
-    cur.execute('ALTER TABLE parcels ADD COLUMN max_lat REAL')
-    cur.execute('ALTER TABLE parcels ADD COLUMN max_lng REAL')
-    conn.commit()
-    print('Added bbox columns')
-except Exception as e:
-    print('Columns may already exist or alter failed:', e)
-
-cur.execute('SELECT id, num_parcel, geometry FROM parcels')
-rows = cur.fetchall()
-print('Rows to process:', len(rows))
-count=0
-for r in rows:
-    pid, num, raw = r
-    geom = parse_geom(raw)
-    pts = extract_points(geom)
-    bbox = compute_bbox(pts)
-    if not bbox:
-        continue
-    minLat,minLng,maxLat,maxLng = bbox
-    try:
-        cur.execute('UPDATE parcels SET min_lat=?, min_lng=?, max_lat=?, max_lng=? WHERE id=?', (minLat,minLng,maxLat,maxLng,pid))
-        count+=1
-    except Exception as e:
-        print('update failed for', pid, e)
-
+if write_metrics is None:
+    print('numpy is not installed; filling bbox columns only')
+fill = BBOX_COLUMNS + METRIC_COLUMNS
+columns = {r[1] for r in cur.execute('PRAGMA table_info(parcels)')}
+missing = [c for c in fill if c not in columns]
+if missing:
+    print('Adding columns', ', '.join(missing))
+
+# Rows missing any bbox or metric value (all rows when a column is new)
+if missing:
+    ids = None
+else:
+    ids = [r[0] for r in cur.execute(f"SELECT id FROM parcels WHERE {' OR '.join(c + ' IS NULL' for c in fill)}")]
+print('Rows to update:', 'all' if ids is None else len(ids))
+
+if write_metrics is not None:
+    # One vectorized pass over every ring and part (holes included), one executemany
+    updated = write_metrics(conn, ids, fill)
+    print('Updated', updated, 'rows with bbox, centroid, area and perimeter')
+else:
+    for col in missing:
+        cur.execute(f'ALTER TABLE parcels ADD COLUMN {col} REAL')
+    geom_cols = 'geometry, geometry_bin' if has_compact_geometry(conn) else 'geometry, NULL'
+    rows = cur.execute(f'SELECT id, {geom_cols} FROM parcels' + (' WHERE min_lat IS NULL' if ids is not None else '')).fetchall()
+    updates = []
+    for pid, text, blob in rows:
+        bbox = geometry_bbox(load_geometry(text, blob))
+        if bbox:
+            updates.append(bbox + (pid,))
+    cur.executemany('UPDATE parcels SET min_lat=?, min_lng=?, max_lat=?, max_lng=? WHERE id=?', updates)
+    print('Updated', len(updates), 'rows with bbox')
+print('Indexed', populate_rtree(conn), 'rows in parcels_rtree')
 conn.commit()
-print('Updated', count, 'rows with bbox')
 conn.close()
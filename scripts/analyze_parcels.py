@@ -1,26 +1,28 @@
 import sqlite3
 from pathlib import Path
-from collections import Counter
+
+from dataset_stats import parcel_counts
+from parcel_numbers import has_parcel_numbers, prefix_counts
+
 root=Path(__file__).resolve().parents[1]
 db=root/'prebuilt'/'parcelapp.db'
 con=sqlite3.connect(str(db))
 cur=con.cursor()
-cur.execute("SELECT count(*) FROM parcels")
-total=cur.fetchone()[0]
-print(f'Total parcels: {total}')
+counts=parcel_counts(con)
+print(f"Total parcels: {counts['total']} (individuel {counts['individuel']}, collectif {counts['collectif']})")
 cur.execute("SELECT num_parcel FROM parcels ORDER BY id LIMIT 20")
 rows=cur.fetchall()
 print('\nFirst 20 parcel numbers:')
 for r in rows:
     print(' ', r[0])
-# Count by first 2 digits
-cur.execute("SELECT num_parcel FROM parcels")
-all_parcels = cur.fetchall()
-prefixes = Counter()
-for (num,) in all_parcels:
-    if num and len(num) >= 2:
-        prefixes[num[:2]] += 1
+# Region prefix (first 2 digits) counts from parcel_prefix_stats / the decoded columns
 print(f'\nParcel number prefixes (first 2 digits):')
-for prefix, count in prefixes.most_common(10):
+for prefix, count in prefix_counts(con, 'region')[:10]:
+    print(f'  {prefix}*: {count} parcels')
+if has_parcel_numbers(con):
+    cur.execute("SELECT count(*) FROM parcels WHERE num_region IS NULL")
+    print(f'  not 13-digit numbers: {cur.fetchone()[0]} parcels')
+print('\nTop departments (first 4 digits):')
+for prefix, count in prefix_counts(con, 'department')[:10]:
     print(f'  {prefix}*: {count} parcels')
 con.close()
@@ -0,0 +1,120 @@
+"""
+Page reads of typical app search / list queries, wide vs split parcels layout.
+
+Each query runs on a fresh read-only connection (empty page cache), and the
+pages it reads are counted from the process's read() bytes (/proc/self/io
+rchar, Linux) divided by the page size; elsewhere only latencies are shown.
+The wide DB is run as the app runs it (SELECT * FROM parcels); the split copy
+(table_layout.split_parcels, made in a temporary directory unless --split is
+given) answers the same query from the slim parcels table, and detail
+lookups through parcels_wide.
+
+Usage:
+    python scripts/bench_layout.py [wide.db] [--split split.db] [--repeat 5]
+"""
+
+import argparse
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from table_layout import COMPAT_VIEW, split_parcels
+
+_PROC_IO = Path('/proc/self/io')
+
+
+def _bytes_read():
+    if not _PROC_IO.exists():
+        return None
+    for line in _PROC_IO.read_text().splitlines():
+        if line.startswith('rchar:'):
+            return int(line.split()[1])
+    return None
+
+
+def measure(path, sql, params, repeat=5):
+    """(pages read on a cold connection or None, best latency in ms) for one query."""
+    pages, best = None, float('inf')
+    for i in range(repeat):
+        con = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        page_size = con.execute('PRAGMA page_size').fetchone()[0]
+        con.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()  # schema load is not the query's
+        before = _bytes_read()
+        t0 = time.perf_counter()
+        con.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - t0)
+        after = _bytes_read()
+        if i == 0 and before is not None:
+            pages = (after - before) // page_size
+        con.close()
+    return pages, best * 1000
+
+
+def sample_params(path):
+    con = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    n = con.execute('SELECT COUNT(*) FROM parcels').fetchone()[0]
+    num = con.execute('SELECT num_parcel FROM parcels WHERE num_parcel IS NOT NULL ORDER BY id LIMIT 1 OFFSET ?',
+                      (n // 2,)).fetchone()[0]
+    village = con.execute('''SELECT village FROM parcels WHERE village IS NOT NULL
+        GROUP BY village ORDER BY COUNT(*) DESC LIMIT 1''').fetchone()[0]
+    con.close()
+    return {'num': num, 'prefix': num[:8], 'village': village, 'offset': n // 2}
+
+
+def queries(params):
+    """[(name, wide SQL, split SQL, params)] shaped like the app's DatabaseManager queries."""
+    return [
+        ('exact number', 'SELECT * FROM parcels WHERE num_parcel = ?', None, (params['num'],)),
+        ('number prefix, 50', 'SELECT * FROM parcels WHERE num_parcel LIKE ? LIMIT 50', None,
+         (params['prefix'] + '%',)),
+        ('name search (scan), 50', '''SELECT * FROM parcels WHERE nom LIKE ? OR prenom LIKE ? OR nom_m LIKE ?
+            OR prenom_m LIKE ? OR denominat LIKE ? OR village LIKE ? ORDER BY id LIMIT 50''', None,
+         ('%zzqx%',) * 6),
+        ('list page, 50', 'SELECT * FROM parcels ORDER BY id LIMIT 50 OFFSET ?', None, (params['offset'],)),
+        ('village list', 'SELECT * FROM parcels WHERE village = ?', None, (params['village'],)),
+        ('count by type', "SELECT parcel_type, COUNT(*) FROM parcels GROUP BY parcel_type", None, ()),
+        ('detail by number', 'SELECT * FROM parcels WHERE num_parcel = ?',
+         f'SELECT * FROM {COMPAT_VIEW} WHERE num_parcel = ?', (params['num'],)),
+    ]
+
+
+def make_split_copy(wide, dest):
+    shutil.copyfile(wide, dest)
+    con = sqlite3.connect(str(dest))
+    split_parcels(con)
+    con.commit()
+    con.execute('VACUUM')
+    con.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Page reads of search / list queries, wide vs split layout.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db', help='wide-layout DB')
+    parser.add_argument('--split', help='split-layout copy of the same data (default: made in a temp dir)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        split = args.split
+        if not split:
+            split = str(Path(tmp) / 'split.db')
+            make_split_copy(args.db, split)
+        for label, path in (('wide', args.db), ('split', split)):
+            print(f'{label}: {path} ({Path(path).stat().st_size} bytes)')
+        params = sample_params(args.db)
+        print(f"\n{'query':<24} {'wide pages':>10} {'split pages':>11} {'saved':>6} {'wide ms':>8} {'split ms':>9}")
+        for name, wide_sql, split_sql, qparams in queries(params):
+            wide_pages, wide_ms = measure(args.db, wide_sql, qparams, args.repeat)
+            split_pages, split_ms = measure(split, split_sql or wide_sql, qparams, args.repeat)
+            if wide_pages is None:
+                pages = f"{'-':>10} {'-':>11} {'-':>6}"
+            else:
+                saved = 100.0 * (wide_pages - split_pages) / wide_pages if wide_pages else 0.0
+                pages = f'{wide_pages:>10} {split_pages:>11} {saved:5.0f}%'
+            print(f'{name:<24} {pages} {wide_ms:8.2f} {split_ms:9.2f}')
+
+
+if __name__ == '__main__':
+    main()
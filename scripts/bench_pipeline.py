@@ -0,0 +1,250 @@
+"""
+Benchmarks of the Python DB pipeline on synthetic datasets, with JSON results.
+
+For each scale (a multiple of the current 2,056 parcels) a dataset is made
+with synthetic_parcels.py, then
+    normalize             normalize_geojsonl.py: GeoJSONL -> FeatureCollection JSON
+    generate_prebuilt_db  generate_prebuilt_db.py --stream (per-stage figures from its
+                          build report, see build_report.py)
+    add_bboxes            add_bboxes.py backfill on a copy of the DB with the bbox columns cleared
+    neighbor_lookups      parcel_neighbors() and the app's bbox fallback query
+                          (parcels_rtree, +/- BBOX_DELTA) for a sample of parcels
+are timed. The first three run as child processes, so their peak RSS is
+reported too (Linux / macOS; None elsewhere). Results are written as JSON
+with the environment (Python, SQLite, CPU count) for comparing runs.
+
+Usage:
+    python scripts/bench_pipeline.py [--scales 1,10,100] [--json bench_pipeline.json]
+                                     [--workers N] [--lookups 1000] [--work-dir DIR] [--skip normalize,...]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from build_report import report_path
+from geometry_metrics import BBOX_COLUMNS
+from neighbor_graph import has_neighbor_table, parcel_neighbors
+from spatial_index import bbox_candidates, parcel_bbox
+from synthetic_parcels import BASELINE_PARCELS, generate_dataset
+
+SCRIPTS = Path(__file__).resolve().parent
+STEPS = ('normalize', 'generate_prebuilt_db', 'add_bboxes', 'neighbor_lookups')
+DEFAULT_SCALES = (1.0, 10.0)
+DEFAULT_LOOKUPS = 1000
+# Same as BBOX_DELTA in src/data/database.ts (~1.1 km)
+BBOX_DELTA = 0.01
+
+_NORMALIZE = '''
+import sys
+from pathlib import Path
+from normalize_geojsonl import create_feature_collection, read_geojsonl, write_feature_collection
+for src, dst in zip(sys.argv[1::2], sys.argv[2::2]):
+    write_feature_collection(create_feature_collection(read_geojsonl(Path(src))), Path(dst))
+'''
+
+
+def run_child(argv, cwd=None):
+    """Run a Python child process; return {'seconds', 'max_rss_kb', 'returncode'} and its stdout."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(SCRIPTS), os.environ.get('PYTHONPATH')])))
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable] + argv, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True)
+    output = proc.stdout.read()
+    max_rss = None
+    if hasattr(os, 'wait4'):
+        _pid, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        max_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    else:
+        proc.wait()
+    seconds = time.perf_counter() - t0
+    proc.stdout.close()
+    return {'seconds': round(seconds, 4), 'max_rss_kb': max_rss, 'returncode': proc.returncode}, output
+
+
+def bench_normalize(paths, work):
+    argv = ['-c', _NORMALIZE]
+    for parcel_type, path in paths.items():
+        argv += [str(path), str(work / f'{parcel_type}.json')]
+    result, output = run_child(argv)
+    result['output_bytes'] = sum((work / f'{t}.json').stat().st_size for t in paths if (work / f'{t}.json').exists())
+    for parcel_type in paths:
+        (work / f'{parcel_type}.json').unlink(missing_ok=True)
+    return result, output
+
+
+def bench_generate(paths, db, workers=None, extra_args=()):
+    argv = [str(SCRIPTS / 'generate_prebuilt_db.py'), '--stream', '--no-assets',
+            '--individuels', str(paths['individuel']), '--collectives', str(paths['collectif']), '--out', str(db)]
+    if workers:
+        argv += ['--workers', str(workers)]
+    result, output = run_child(argv + list(extra_args))
+    build_report = report_path(db)
+    if build_report.exists():
+        report = json.loads(build_report.read_text(encoding='utf-8'))
+        result['stages'] = report['stages']
+        result['statements'] = report['statements']
+    result['db_bytes'] = db.stat().st_size if db.exists() else None
+    return result, output
+
+
+def bench_add_bboxes(db, work):
+    """add_bboxes.py reads prebuilt/parcelapp.db under its working directory: run it on a cleared copy."""
+    target = work / 'add_bboxes' / 'prebuilt' / 'parcelapp.db'
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(db, target)
+    con = sqlite3.connect(str(target))
+    con.execute(f"UPDATE parcels SET {', '.join(f'{c} = NULL' for c in BBOX_COLUMNS)}")
+    con.commit()
+    con.close()
+    result, output = run_child([str(SCRIPTS / 'add_bboxes.py')], cwd=str(target.parents[1]))
+    shutil.rmtree(target.parents[1])
+    return result, output
+
+
+def _latency_summary(samples_ms, results):
+    ordered = sorted(samples_ms)
+    return {
+        'lookups': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered), 4) if ordered else None,
+        'p50_ms': round(ordered[len(ordered) // 2], 4) if ordered else None,
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4) if ordered else None,
+        'max_ms': round(ordered[-1], 4) if ordered else None,
+        'mean_results': round(statistics.fmean(results), 2) if results else None,
+    }
+
+
+def bench_neighbor_lookups(db, lookups=DEFAULT_LOOKUPS):
+    """Latency of the precomputed-graph lookup and of the bbox fallback, for parcels spread over the id range."""
+    con = sqlite3.connect(f'file:{Path(db).as_posix()}?mode=ro', uri=True)
+    total = con.execute('SELECT COUNT(*) FROM parcels').fetchone()[0]
+    step = max(1, total // max(1, lookups))
+    nums = [r[0] for r in con.execute('SELECT num_parcel FROM parcels WHERE id % ? = 0 AND num_parcel IS NOT NULL '
+                                      'ORDER BY id LIMIT ?', (step, lookups))]
+    out = {}
+    if has_neighbor_table(con):
+        times, counts = [], []
+        for num in nums:
+            t0 = time.perf_counter()
+            rows = parcel_neighbors(con, num)
+            times.append((time.perf_counter() - t0) * 1000)
+            counts.append(len(rows))
+        out['graph'] = _latency_summary(times, counts)
+    times, counts = [], []
+    for num in nums:
+        t0 = time.perf_counter()
+        bbox = parcel_bbox(con, num)
+        if bbox:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            ids = bbox_candidates(con, min_lat - BBOX_DELTA, min_lng - BBOX_DELTA,
+                                  max_lat + BBOX_DELTA, max_lng + BBOX_DELTA)
+            counts.append(len(ids))
+        times.append((time.perf_counter() - t0) * 1000)
+    out['bbox'] = _latency_summary(times, counts)
+    con.close()
+    return out
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_scale(scale, work, args):
+    count = round(scale * BASELINE_PARCELS)
+    print(f'== scale {scale:g}: {count} parcels')
+    data = generate_dataset(count, work / 'data', seed=args.seed)
+    run = {
+        'scale': scale, 'parcels': count, 'counts': data['counts'],
+        'input_bytes': sum(data['bytes'].values()),
+        'steps': {'synthetic_data': {'seconds': round(data['seconds'], 4)}},
+    }
+    print(f"  synthetic_data        {data['seconds']:8.2f}s  {run['input_bytes']} bytes")
+    db = work / 'parcelapp.db'
+    for step in STEPS:
+        if step in args.skip:
+            continue
+        if step == 'normalize':
+            result, output = bench_normalize(data['paths'], work)
+        elif step == 'generate_prebuilt_db':
+            result, output = bench_generate(data['paths'], db, args.workers, args.build_args.split())
+        elif step == 'add_bboxes':
+            if not db.exists():
+                continue
+            result, output = bench_add_bboxes(db, work)
+        else:
+            if not db.exists():
+                continue
+            result, output = bench_neighbor_lookups(db, args.lookups), ''
+        run['steps'][step] = result
+        if result.get('returncode'):
+            print(f'  {step} failed (exit {result["returncode"]}):\n{output[-2000:]}')
+        elif 'seconds' in result:
+            rss = f"  peak RSS {result['max_rss_kb'] / 1024:.0f} MB" if result.get('max_rss_kb') else ''
+            print(f"  {step:<21} {result['seconds']:8.2f}s{rss}")
+        else:
+            for kind, summary in result.items():
+                print(f"  {step} ({kind}): p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms "
+                      f"over {summary['lookups']} lookups")
+    shutil.rmtree(work / 'data', ignore_errors=True)
+    db.unlink(missing_ok=True)
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Python DB pipeline on synthetic datasets.')
+    parser.add_argument('--scales', default=','.join(f'{s:g}' for s in DEFAULT_SCALES),
+                        help=f'comma-separated dataset sizes as multiples of {BASELINE_PARCELS} parcels')
+    parser.add_argument('--json', default='bench_pipeline.json', help='results file')
+    parser.add_argument('--workers', type=int, default=None, help='generate_prebuilt_db.py --workers')
+    parser.add_argument('--build-args', default='', help='extra generate_prebuilt_db.py arguments, e.g. "--geometry both"')
+    parser.add_argument('--lookups', type=int, default=DEFAULT_LOOKUPS, help='neighbor lookups per scale')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--skip', default='', help=f"comma-separated steps to skip ({', '.join(STEPS)})")
+    parser.add_argument('--work-dir', help='directory for the datasets and DBs (default: a temporary directory)')
+    args = parser.parse_args()
+    try:
+        scales = [float(s) for s in args.scales.split(',') if s.strip()]
+    except ValueError:
+        parser.error(f'invalid --scales: {args.scales}')
+    args.skip = {s.strip() for s in args.skip.split(',') if s.strip()}
+    unknown = args.skip - set(STEPS)
+    if unknown:
+        parser.error(f"unknown steps in --skip: {', '.join(sorted(unknown))}")
+
+    results = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'config': {'scales': scales, 'workers': args.workers, 'build_args': args.build_args,
+                   'lookups': args.lookups, 'seed': args.seed, 'skip': sorted(args.skip)},
+        'runs': [],
+    }
+    if args.work_dir:
+        Path(args.work_dir).mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as tmp:
+        for scale in scales:
+            results['runs'].append(run_scale(scale, Path(tmp), args))
+            # Written after every scale so a long run leaves partial results
+            Path(args.json).write_text(json.dumps(results, indent=2), encoding='utf-8')
+    print(f'Wrote {args.json}')
+
+
+if __name__ == '__main__':
+    main()
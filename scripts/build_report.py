@@ -0,0 +1,182 @@
+"""
+Per-stage instrumentation for generate_prebuilt_db.py.
+
+StageStats accumulates, for every build stage (read, decode, canonicalize,
+serialize, hash, write, promote, ..., finalize, assets):
+  - rows, seconds, calls and rows/sec;
+  - SQLite statements run on the build connection (a trace callback counts
+    them; the ones since the previous add() are charged to the stage);
+  - resident memory when the stage ended and the process peak so far (Linux /
+    macOS; pool workers are in the children peak of the report);
+  - with trace_memory, the tracemalloc peak of Python allocations during the
+    stage, and after every non-streamed stage a snapshot of the allocation
+    sites that grew the most.
+The streamed stages (read ... write) are added chunk by chunk and interleave,
+so their memory figures cover the whole pipeline.
+
+The build writes the report as JSON next to the DB (<db stem>.build.json);
+with --profile a cProfile dump of the main process (<db stem>.build.prof)
+goes next to it.
+
+Usage:
+    python scripts/build_report.py [prebuilt/parcelapp.build.json]   # print a saved report
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage, RSS figures are None
+    resource = None
+
+# Stages added once per chunk by run_pipeline, interleaved with each other
+PIPELINE_STAGES = ('read', 'decode', 'canonicalize', 'serialize', 'hash', 'write')
+SNAPSHOT_TOP = 5
+
+_STATM = Path('/proc/self/statm')
+
+
+def peak_rss_kb(children=False):
+    """High-water resident set size in KB of this process (or of its waited-for children), None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, KB on Linux
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def current_rss_kb():
+    """Current resident set size in KB (Linux), None elsewhere."""
+    try:
+        return int(_STATM.read_text().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def report_path(out, suffix='.build.json'):
+    out = Path(out)
+    return out.with_name(out.stem + suffix)
+
+
+class StageStats:
+    """Accumulates rows, seconds and resource use per pipeline stage (see the module docstring)."""
+
+    def __init__(self, trace_memory=False):
+        self.stages = {}
+        self.plan_hits = 0
+        self.plan_misses = 0
+        self.statements = 0
+        self._charged_statements = 0
+        self.snapshots = []
+        self._snapshot = None
+        self.started = time.perf_counter()
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def watch(self, con):
+        """Count the SQL statements run on `con`."""
+        con.set_trace_callback(self._count_statement)
+
+    def _count_statement(self, _sql):
+        self.statements += 1
+
+    def add(self, stage, rows, seconds):
+        entry = self.stages.setdefault(stage, {'rows': 0, 'seconds': 0.0, 'calls': 0, 'statements': 0,
+                                               'rss_kb': None, 'peak_rss_kb': None, 'traced_peak_bytes': None})
+        entry['rows'] += rows
+        entry['seconds'] += seconds
+        entry['calls'] += 1
+        entry['statements'] += self.statements - self._charged_statements
+        self._charged_statements = self.statements
+        entry['rss_kb'] = current_rss_kb()
+        entry['peak_rss_kb'] = peak_rss_kb()
+        if self.trace_memory:
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            entry['traced_peak_bytes'] = max(entry['traced_peak_bytes'] or 0, peak)
+            if stage not in PIPELINE_STAGES:
+                self.snapshot(stage)
+
+    def snapshot(self, label, limit=SNAPSHOT_TOP):
+        """Record the allocation sites that grew most since the previous snapshot (trace_memory only)."""
+        if not self.trace_memory:
+            return
+        snap = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        top = snap.compare_to(self._snapshot, 'lineno') if self._snapshot else snap.statistics('lineno')
+        self.snapshots.append({
+            'after': label,
+            'traced_bytes': tracemalloc.get_traced_memory()[0],
+            'top': [{'where': f'{s.traceback[0].filename}:{s.traceback[0].lineno}',
+                     'size_bytes': s.size, 'size_diff_bytes': getattr(s, 'size_diff', s.size), 'count': s.count}
+                    for s in top[:limit]],
+        })
+        self._snapshot = snap
+
+    def report(self, workers):
+        print("Pipeline stage throughput:")
+        for stage, entry in self.stages.items():
+            rows, seconds = entry['rows'], entry['seconds']
+            rate = rows / seconds if seconds > 0 else float('inf')
+            note = f' (summed over {workers} workers)' if stage in PIPELINE_STAGES[1:5] and workers > 1 else ''
+            rss = f", RSS {entry['rss_kb'] / 1024:.0f} MB" if entry['rss_kb'] else ''
+            traced = (f", traced peak {entry['traced_peak_bytes'] / 1048576:.1f} MB"
+                      if entry['traced_peak_bytes'] is not None else '')
+            print(f"  {stage:<12} {rows:>9} rows in {seconds:7.2f}s -> {rate:10.0f} rows/sec"
+                  f"{note} [{entry['statements']} statements{rss}{traced}]")
+        lookups = self.plan_hits + self.plan_misses
+        if lookups:
+            print(f"Key plan cache: {self.plan_hits} hits, {self.plan_misses} misses "
+                  f"({100.0 * self.plan_hits / lookups:.1f}% hit rate)")
+
+    def to_dict(self, workers):
+        stages = {}
+        for stage, entry in self.stages.items():
+            seconds = entry['seconds']
+            stages[stage] = dict(entry, seconds=round(seconds, 4),
+                                 rows_per_sec=round(entry['rows'] / seconds, 1) if seconds > 0 else None,
+                                 summed_over_workers=stage in PIPELINE_STAGES[1:5] and workers > 1)
+        return {
+            'wall_seconds': round(time.perf_counter() - self.started, 4),
+            'workers': workers,
+            'stages': stages,
+            'statements': self.statements,
+            'peak_rss_kb': peak_rss_kb(),
+            'peak_rss_children_kb': peak_rss_kb(children=True),
+            'key_plan_cache': {'hits': self.plan_hits, 'misses': self.plan_misses},
+            'memory_snapshots': self.snapshots,
+        }
+
+
+def write_build_report(path, stats, workers, **build):
+    """Write the JSON build report: `build` fields (inputs, options, counts...) plus stats.to_dict()."""
+    report = {'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'), **build, **stats.to_dict(workers)}
+    Path(path).write_text(json.dumps(report, indent=2, default=str), encoding='utf-8')
+    return report
+
+
+def print_report(path):
+    report = json.loads(Path(path).read_text(encoding='utf-8'))
+    print(f"{path}: {report.get('out')} built {report.get('created_at')} in {report['wall_seconds']:.2f}s "
+          f"({report['workers']} workers, {report['statements']} statements)")
+    total = sum(e['seconds'] for s, e in report['stages'].items() if not e.get('summed_over_workers')) or 1.0
+    print(f"  {'stage':<12} {'rows':>9} {'seconds':>8} {'share':>6} {'rows/sec':>10} {'stmts':>8} {'RSS MB':>7} {'peak MB':>7}")
+    for stage, e in sorted(report['stages'].items(), key=lambda item: -item[1]['seconds']):
+        share = '' if e.get('summed_over_workers') else f"{100.0 * e['seconds'] / total:5.1f}%"
+        rss = ' '.join(f"{e[k] / 1024:7.0f}" if e.get(k) else f"{'-':>7}" for k in ('rss_kb', 'peak_rss_kb'))
+        rate = f"{e['rows_per_sec']:10.0f}" if e.get('rows_per_sec') else f"{'-':>10}"
+        print(f"  {stage:<12} {e['rows']:>9} {e['seconds']:8.2f} {share:>6} {rate} {e['statements']:>8} {rss}")
+    for snap in report.get('memory_snapshots', []):
+        print(f"  after {snap['after']}: {snap['traced_bytes'] / 1048576:.1f} MB traced")
+        for site in snap['top'][:3]:
+            print(f"    {site['size_diff_bytes'] / 1024:+10.0f} KB  {site['where']}")
+
+
+if __name__ == '__main__':
+    print_report(sys.argv[1] if len(sys.argv) > 1 else 'prebuilt/parcelapp.build.json')
@@ -0,0 +1,204 @@
+"""
+Bulk parcel number lookup against parcelapp.db (or any SQLite DB with a
+num_parcel-like column).
+
+The parcel numbers are read from a file or stdin (one per line; only the first
+CSV/whitespace field is used, blank lines, '#' comments and a num_parcel
+header are skipped), loaded into a TEMP table and resolved with one join per
+table, so 10k numbers cost one indexed join instead of 10k queries. Results are
+streamed in input order as CSV or JSONL; numbers with no match get one row with
+found = 0.
+
+Usage:
+    python scripts/bulk_lookup.py [db] --ids numbers.txt [--format csv|jsonl] [--out FILE]
+    cat numbers.txt | python scripts/bulk_lookup.py prebuilt/parcelapp.db --missing-only
+    python scripts/bulk_lookup.py [db] --ids numbers.txt --tables   # per-table match counts
+"""
+
+import argparse
+import csv
+import json
+import re
+import sqlite3
+import sys
+import time
+
+from geometry_codec import load_geometry
+from property_codec import load_properties, load_schemas
+from table_layout import COMPAT_VIEW, is_split, side_joins
+
+LOOKUP_TABLE = 'lookup_ids'
+PARCEL_NUMBER_COLUMNS = ('num_parcel', 'num_parcelle', 'parcel_num', 'parcel_number')
+DEFAULT_COLUMNS = ('id', 'num_parcel', 'parcel_type', 'village')
+
+_FIELD_SPLIT = re.compile(r'[,;\t ]')
+
+
+def read_ids(fh):
+    """Yield parcel numbers from a text stream (first field of each line)."""
+    for line in fh:
+        value = _FIELD_SPLIT.split(line.strip(), 1)[0].strip('"\'')
+        if not value or value.startswith('#') or value.lower() in PARCEL_NUMBER_COLUMNS:
+            continue
+        yield value
+
+
+def load_lookup_ids(con, ids):
+    """(Re)fill the TEMP lookup table with ids in input order; returns the number loaded."""
+    con.execute(f'DROP TABLE IF EXISTS temp.{LOOKUP_TABLE}')
+    con.execute(f'CREATE TEMP TABLE {LOOKUP_TABLE} (pos INTEGER PRIMARY KEY, num_parcel TEXT NOT NULL)')
+    con.executemany(f'INSERT INTO temp.{LOOKUP_TABLE} (num_parcel) VALUES (?)', ((i,) for i in ids))
+    # Lets the planner scan an unindexed table once and probe the ids instead
+    con.execute(f'CREATE INDEX temp.idx_{LOOKUP_TABLE}_num ON {LOOKUP_TABLE}(num_parcel)')
+    return con.execute(f'SELECT COUNT(*) FROM temp.{LOOKUP_TABLE}').fetchone()[0]
+
+
+def parcel_number_columns(con):
+    """[(table, column)] for every table column that holds parcel numbers."""
+    tables = [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE 'CREATE VIRTUAL%'")]
+    found = []
+    for t in tables:
+        for r in con.execute(f'PRAGMA table_info("{t}")'):
+            if r[1].lower() in PARCEL_NUMBER_COLUMNS:
+                found.append((t, r[1]))
+    return found
+
+
+def count_matches(con):
+    """{(table, column): {num_parcel: row count}} for the loaded ids, one join per table column."""
+    hits = {}
+    for table, col in parcel_number_columns(con):
+        sql = f'''SELECT l.num_parcel, COUNT(*) FROM temp.{LOOKUP_TABLE} l
+            JOIN "{table}" t ON t."{col}" = l.num_parcel
+            GROUP BY l.num_parcel'''
+        try:
+            hits[(table, col)] = dict(con.execute(sql).fetchall())
+        except sqlite3.Error:
+            continue
+    return hits
+
+
+def lookup_parcels(con, columns=DEFAULT_COLUMNS, geometry=False, properties=False):
+    """Yield dicts (query, found, columns...) for the loaded ids in input order, in one LEFT JOIN.
+
+    A number present several times in parcels (e.g. in both layers) yields
+    one dict per row.
+    """
+    # Split layout (table_layout): geometry / properties come from their side tables, joined by id
+    available = {r[1] for r in con.execute(f"PRAGMA table_info({COMPAT_VIEW if is_split(con) else 'parcels'})")}
+    cols = [c for c in columns if c in available]
+    wanted = list(cols)
+    if geometry:
+        wanted += ['geometry'] + (['geometry_bin'] if 'geometry_bin' in available else [])
+    schemas = None
+    if properties:
+        wanted.append('properties')
+        if 'properties_values' in available:
+            wanted += ['properties_schema', 'properties_values']
+            schemas = load_schemas(con)
+    exprs, joins = side_joins(con, wanted)
+    select = [exprs[c] for c in cols]
+    if geometry:
+        select += [exprs['geometry'], exprs.get('geometry_bin', 'NULL')]
+    if properties:
+        select.append(exprs['properties'])
+        if schemas is not None:
+            select += [exprs['properties_schema'], exprs['properties_values']]
+    sql = f'''SELECT l.num_parcel, p.id IS NOT NULL{''.join(', ' + s for s in select)}
+        FROM temp.{LOOKUP_TABLE} l
+        LEFT JOIN parcels p ON p.num_parcel = l.num_parcel{joins}
+        ORDER BY l.pos, p.id'''
+    for row in con.execute(sql):
+        out = {'query': row[0], 'found': int(row[1])}
+        out.update(zip(cols, row[2:2 + len(cols)]))
+        rest = row[2 + len(cols):]
+        if geometry:
+            try:
+                out['geometry'] = load_geometry(rest[0], rest[1])
+            except (ValueError, KeyError):
+                out['geometry'] = None
+            rest = rest[2:]
+        if properties:
+            # Schema-encoded rows are decoded here; JSON text is passed through as stored
+            out['properties'] = rest[0]
+            if rest[0] is None and schemas is not None and rest[2] is not None:
+                out['properties'] = json.dumps(load_properties(None, rest[1], rest[2], schemas), ensure_ascii=False)
+        yield out
+
+
+def write_jsonl(rows, fh):
+    n = 0
+    for row in rows:
+        if row.get('properties') is not None:
+            try:
+                row['properties'] = json.loads(row['properties'])
+            except ValueError:
+                pass
+        fh.write(json.dumps(row, ensure_ascii=False) + '\n')
+        n += 1
+    return n
+
+
+def write_csv(rows, fh, fieldnames):
+    writer = csv.DictWriter(fh, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    n = 0
+    for row in rows:
+        if row.get('geometry') is not None:
+            row['geometry'] = json.dumps(row['geometry'])
+        writer.writerow(row)
+        n += 1
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Resolve many parcel numbers at once (CSV/JSONL output).')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('--ids', default='-', help='file with one parcel number per line (default: stdin)')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    parser.add_argument('--out', help='output file (default: stdout)')
+    parser.add_argument('--columns', default=','.join(DEFAULT_COLUMNS), help='parcels columns to output')
+    parser.add_argument('--geometry', action='store_true', help='include the decoded geometry')
+    parser.add_argument('--properties', action='store_true', help='include the properties')
+    parser.add_argument('--missing-only', action='store_true', help='only output numbers with no match')
+    parser.add_argument('--tables', action='store_true',
+                        help='count matches in every table with a parcel number column instead')
+    args = parser.parse_args(argv)
+
+    if args.ids == '-':
+        ids = list(read_ids(sys.stdin))
+    else:
+        with open(args.ids, 'r', encoding='utf-8-sig') as fh:
+            ids = list(read_ids(fh))
+
+    con = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    t0 = time.perf_counter()
+    loaded = load_lookup_ids(con, ids)
+    out = open(args.out, 'w', encoding='utf-8', newline='') if args.out else sys.stdout
+    try:
+        if args.tables:
+            hits = count_matches(con)
+            keys = sorted(hits)
+            fieldnames = ['query'] + [f'{t}.{c}' for t, c in keys]
+            rows = ({'query': i, **{f'{t}.{c}': hits[(t, c)].get(i, 0) for t, c in keys}} for i in ids)
+        else:
+            columns = [c.strip() for c in args.columns.split(',') if c.strip()]
+            rows = lookup_parcels(con, columns, args.geometry, args.properties)
+            fieldnames = ['query', 'found'] + columns + (['geometry'] if args.geometry else []) + \
+                (['properties'] if args.properties else [])
+        if args.missing_only:
+            rows = (r for r in rows if not r.get('found', any(v for k, v in r.items() if k != 'query')))
+        if args.format == 'jsonl':
+            written = write_jsonl(rows, out)
+        else:
+            written = write_csv(rows, out, fieldnames)
+    finally:
+        if args.out:
+            out.close()
+    elapsed = time.perf_counter() - t0
+    print(f'{loaded} numbers, {written} rows in {elapsed:.3f} s', file=sys.stderr)
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,9 @@
-import sqlite3
-import json
 import sys
 from math import radians, cos, sin, asin, sqrt
 
+from parcelstore import ParcelStore
+from property_codec import load_properties
+
 DB = 'prebuilt/parcelapp.db'
 
 # haversine distance
@@ -78,20 +79,39 @@ def geometry_is_2d(geom):
         return False, f'error: {e}'
 
 
+# Only the centroid keys of the properties are needed: extract them in SQL
+CENTROID_KEYS = ('Centroide', '_Centroide_latitude', '_Centroide_longitude')
+CENTROID_COLUMNS = tuple(f"json_extract(properties, '$.{k}')" for k in CENTROID_KEYS)
+COMPACT_COLUMNS = ('properties_schema', 'properties_values')
+
+
+def centroid_values(store):
+    """(id, num_parcel, centroid key values) for every parcel.
+
+    Rows without JSON properties text (--properties compact) are decoded
+    through load_properties instead of json_extract.
+    """
+    compact = 'properties_values' in store.columns
+    columns = ('id', 'num_parcel') + CENTROID_COLUMNS + (COMPACT_COLUMNS if compact else ())
+    for rid, rnum, *values in store.values(columns):
+        if compact:
+            schema_id, packed = values[-2:]
+            values = values[:-2]
+            if packed is not None and all(v is None for v in values):
+                props = load_properties(None, schema_id, packed, store.schemas)
+                values = [props.get(k) for k in CENTROID_KEYS]
+        yield rid, rnum, values
+
+
 def main(num_parcel):
-    con = sqlite3.connect(DB)
-    cur = con.cursor()
-    cur.execute('SELECT id, num_parcel, geometry, properties FROM parcels WHERE num_parcel = ?', (num_parcel,))
-    row = cur.fetchone()
-    if not row:
+    store = ParcelStore(DB)
+    parcel = store.get_by_num(num_parcel, columns=('id', 'num_parcel'))
+    if not parcel:
         print('parcel not found')
         return
-    pid, n, geom_json, props_json = row
-    geom = json.loads(geom_json)
-    props = json.loads(props_json)
-    centroid = extract_centroid(props)
+    centroid = extract_centroid(parcel.properties)
     print('centroid:', centroid)
-    ok, reason = geometry_is_2d(geom)
+    ok, reason = geometry_is_2d(parcel.geometry)
     print('parcel geometry ok?', ok, reason)
 
     # find neighbors within 2km of centroid
@@ -99,28 +119,28 @@ def main(num_parcel):
         print('no centroid to find neighbors')
         return
     lat, lon = centroid
-    cur.execute('SELECT id, num_parcel, geometry, properties FROM parcels')
     bad_neighbors = []
     count = 0
-    for r in cur.fetchall():
-        rid, rnum, rgeom_json, rprops_json = r
-        rgeom = json.loads(rgeom_json)
-        rprops = json.loads(rprops_json)
-        ok2, reason2 = geometry_is_2d(rgeom)
+    near_ids = {}
+    for rid, rnum, values in centroid_values(store):
         # compute neighbor centroid
-        rc = extract_centroid(rprops)
+        rc = extract_centroid(dict(zip(CENTROID_KEYS, values)))
         if not rc:
             continue
         rlat, rlon = rc
         d = haversine(lat, lon, rlat, rlon)
         if d <= 2.0:  # within 2 km
             count += 1
-            if not ok2:
-                bad_neighbors.append((rnum, reason2, rc))
+            near_ids[rid] = rc
+    # only neighbors need their geometry decoded
+    for neighbor in store.get_many(near_ids, columns=('id', 'num_parcel')):
+        ok2, reason2 = geometry_is_2d(neighbor.geometry)
+        if not ok2:
+            bad_neighbors.append((neighbor.num_parcel, reason2, near_ids[neighbor.id]))
     print(f'found {count} neighbors within 2km, {len(bad_neighbors)} bad')
     for bn in bad_neighbors[:50]:
         print(bn)
-    con.close()
+    store.close()
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
@@ -0,0 +1,317 @@
+"""
+Replay the app's SQL against a built parcelapp.db and check plans and latency.
+
+CATALOG holds the queries src/data/database.ts runs against the shipped DB
+(searchParcels, getParcelByNum / getParcelById, the list queries and the
+candidate queries of getNeighborParcels), with the same SQL text and
+parameter shapes. Parameters are drawn from the DB itself: parcels spread
+over the id range give the numbers, names, villages, communes, departments
+and bboxes.
+
+For every query and sample, EXPLAIN QUERY PLAN runs with the bound values (a
+LIKE prefix can use the NOCASE num_parcel index only when the pattern is
+known), then the query is timed (best of --repeat). A query fails when
+  - its plan scans a table or index while the catalog expects a 'seek', or
+    scans the table while it expects an 'index' path (unless sqlite_stat1
+    shows the index it relies on would not narrow the data, e.g. a DB with
+    a single department);
+  - its plan uses a temp B-tree (ORDER BY / DISTINCT / GROUP BY sort) that
+    the catalog does not allow;
+  - its p95 latency is above its budget (times --budget-scale);
+  - it errors (e.g. a split-layout DB, which the app cannot read).
+Queries the app runs as full scans by design (the multi-LIKE search, the
+properties LIKE fallbacks, the bbox candidate query) are marked 'scan' and
+only held to their budget. The exit status is 1 if any query fails.
+
+Usage:
+    python scripts/check_query_plans.py [db] [--samples 20] [--repeat 3] [--budget-scale 1.0]
+                                        [--only name,...] [--json report.json]
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_SAMPLES = 20
+DEFAULT_REPEAT = 3
+# Same as DEFAULT_NEIGHBOR_LIMIT / BBOX_DELTA in src/data/database.ts
+NEIGHBOR_LIMIT = 6
+BBOX_DELTA = 0.01
+SEARCH_PAGE = 50
+
+# Latency budgets (ms, p95 over the samples) per expected access path
+BUDGET_MS = {'seek': 5.0, 'index': 50.0, 'scan': 250.0}
+
+_SEARCH_WHERE = '''num_parcel = ? OR
+        num_parcel LIKE ? OR
+        num_parcel LIKE ? OR
+        nom LIKE ? OR
+        prenom LIKE ? OR
+        prenom_m LIKE ? OR
+        nom_m LIKE ? OR
+        denominat LIKE ? OR
+        village LIKE ? OR
+        properties LIKE ?'''
+_SEARCH_SELECT = f'''SELECT *,
+          CASE
+            WHEN num_parcel = ? THEN 0
+            WHEN num_parcel LIKE ? THEN 1
+            WHEN num_parcel LIKE ? THEN 2
+            WHEN nom LIKE ? OR prenom LIKE ? OR prenom_m LIKE ? OR nom_m LIKE ? THEN 3
+            ELSE 4
+          END as relevance_rank
+        FROM parcels WHERE
+        {_SEARCH_WHERE}
+        ORDER BY relevance_rank, id
+        LIMIT ? OFFSET ?'''
+
+
+def _search_params(term):
+    q = f'%{term}%'
+    return (term, f'{term}%', q, q, q, q, q, q, q, q)
+
+
+def _bbox_params(s):
+    min_lat, min_lng, max_lat, max_lng = s['bbox']
+    return (s['num'], min_lat - BBOX_DELTA, max_lat + BBOX_DELTA, min_lng - BBOX_DELTA, max_lng + BBOX_DELTA)
+
+
+def _query(name, method, sql, params, expect, fetch='all', temp_btree=False, requires=(), index=None,
+           budget_ms=None):
+    """A catalog entry. params(sample) gives the bound values, or None when the sample has nothing to bind;
+    expect is the access path ('seek', 'index' or 'scan'); fetch is 'one' for the app's getFirstSync
+    calls; index is the index a seek relies on (its sqlite_stat1 row can excuse a scan)."""
+    return {'name': name, 'method': method, 'sql': sql, 'params': params, 'expect': expect, 'fetch': fetch,
+            'temp_btree': temp_btree, 'requires': requires, 'index': index,
+            'budget_ms': budget_ms if budget_ms is not None else BUDGET_MS[expect]}
+
+
+def _search_select(term):
+    return _search_params(term)[:7] + _search_params(term) + (SEARCH_PAGE, 0)
+
+
+CATALOG = (
+    _query('search_exact_num', 'searchParcels', 'SELECT * FROM parcels WHERE num_parcel = ?',
+           lambda s: (s['num'],), 'seek', 'one', index='idx_num_parcel'),
+    _query('search_like_num', 'searchParcels', 'SELECT * FROM parcels WHERE num_parcel LIKE ?',
+           lambda s: (s['num'],), 'seek', 'one', index='idx_num_parcel'),
+    _query('search_properties_num', 'searchParcels', 'SELECT * FROM parcels WHERE properties LIKE ?',
+           lambda s: (f"%{s['num']}%",), 'scan', 'one'),
+    _query('search_count_name', 'searchParcels', f'SELECT COUNT(*) as total FROM parcels WHERE\n        {_SEARCH_WHERE}',
+           lambda s: _search_params(s['name']) if s['name'] else None, 'scan', 'one'),
+    _query('search_select_name', 'searchParcels', _SEARCH_SELECT,
+           lambda s: _search_select(s['name']) if s['name'] else None, 'scan', temp_btree=True),
+    _query('search_select_prefix', 'searchParcels', _SEARCH_SELECT,
+           lambda s: _search_select(s['prefix']), 'scan', temp_btree=True),
+    _query('parcel_by_num', 'getParcelByNum', 'SELECT * FROM parcels WHERE num_parcel = ? LIMIT 1',
+           lambda s: (s['num'],), 'seek', 'one', index='idx_num_parcel'),
+    _query('parcel_by_id', 'getParcelById', 'SELECT * FROM parcels WHERE id = ?',
+           lambda s: (s['id'],), 'seek', 'one'),
+    # List reads: an index seek, but they return every matching row
+    _query('parcels_by_village', 'getParcelsByVillage', 'SELECT * FROM parcels WHERE village = ?',
+           lambda s: (s['village'],) if s['village'] else None, 'seek', index='idx_village', budget_ms=50.0),
+    _query('parcels_by_type', 'getParcelsByType', 'SELECT * FROM parcels WHERE parcel_type = ?',
+           lambda s: (s['type'],), 'seek', index='idx_parcel_type', budget_ms=BUDGET_MS['scan']),
+    _query('stats_type_count', 'getStats', "SELECT COUNT(*) as count FROM parcels WHERE parcel_type = 'individuel'",
+           lambda s: (), 'seek', 'one', index='idx_parcel_type'),
+    _query('stats_villages', 'getStats', 'SELECT DISTINCT village FROM parcels WHERE village IS NOT NULL ORDER BY village',
+           lambda s: (), 'index'),
+    _query('neighbors_parcel', 'getNeighborParcels',
+           'SELECT geometry, properties, min_lat, min_lng, max_lat, max_lng FROM parcels WHERE num_parcel = ?',
+           lambda s: (s['num'],), 'seek', 'one', index='idx_num_parcel'),
+    _query('neighbors_commune', 'getNeighborParcels',
+           f'SELECT * FROM parcels WHERE num_parcel != ? AND commune = ? LIMIT {NEIGHBOR_LIMIT}',
+           lambda s: (s['num'], s['commune']) if s['commune'] else None, 'seek',
+           requires=('commune',), index='idx_commune'),
+    _query('neighbors_commune_like', 'getNeighborParcels',
+           f'SELECT * FROM parcels WHERE num_parcel != ? AND properties LIKE ? LIMIT {NEIGHBOR_LIMIT}',
+           lambda s: (s['num'], f"%{s['commune']}%") if s['commune'] else None, 'scan'),
+    _query('neighbors_department', 'getNeighborParcels',
+           f'SELECT * FROM parcels WHERE num_parcel != ? AND department = ? LIMIT {NEIGHBOR_LIMIT * 5}',
+           lambda s: (s['num'], s['department']) if s['department'] else None, 'seek',
+           requires=('department',), index='idx_department'),
+    _query('neighbors_department_like', 'getNeighborParcels',
+           f'SELECT * FROM parcels WHERE num_parcel != ? AND properties LIKE ? LIMIT {NEIGHBOR_LIMIT * 5}',
+           lambda s: (s['num'], f"%{s['department']}%") if s['department'] else None, 'scan'),
+    _query('neighbors_bbox', 'getNeighborParcels',
+           'SELECT * FROM parcels WHERE num_parcel != ? AND min_lat IS NOT NULL AND min_lng IS NOT NULL '
+           'AND max_lat IS NOT NULL AND max_lng IS NOT NULL AND NOT (max_lat < ? OR min_lat > ? OR max_lng < ? '
+           'OR min_lng > ?)',
+           lambda s: _bbox_params(s) if s['bbox'] else None, 'scan', requires=('min_lat',)),
+    _query('neighbors_fallback', 'getNeighborParcels',
+           'SELECT * FROM parcels WHERE num_parcel != ? AND geometry IS NOT NULL LIMIT 2000',
+           lambda s: (s['num'],), 'scan'),
+)
+
+
+def parcel_columns(con):
+    return {r[1] for r in con.execute('PRAGMA table_info(parcels)')}
+
+
+def draw_samples(con, count=DEFAULT_SAMPLES):
+    """Parameter samples from parcels spread over the id range."""
+    columns = parcel_columns(con)
+
+    def col(name, fallback='NULL'):
+        return name if name in columns else fallback
+
+    props = 'properties' in columns
+    commune = col('commune', "json_extract(properties, '$.communeSenegal')" if props else 'NULL')
+    department = col('department', "json_extract(properties, '$.departmentSenegal')" if props else 'NULL')
+    bbox = ', '.join(col(c) for c in ('min_lat', 'min_lng', 'max_lat', 'max_lng'))
+    names = ', '.join(col(c) for c in ('nom', 'prenom', 'nom_m', 'prenom_m', 'denominat'))
+    total = con.execute('SELECT MAX(id) FROM parcels').fetchone()[0] or 0
+    step = max(1, total // max(1, count))
+    sql = f'''SELECT id, num_parcel, parcel_type, {col('village')}, {commune}, {department}, {bbox}, COALESCE({names})
+        FROM parcels WHERE id % ? = 0 AND num_parcel IS NOT NULL ORDER BY id LIMIT ?'''
+    samples = []
+    for row in con.execute(sql, (step, count)):
+        pid, num, ptype, village, comm, dept = row[:6]
+        box = row[6:10]
+        samples.append({
+            'id': pid, 'num': num, 'prefix': num[:8], 'type': ptype, 'village': village,
+            'commune': comm, 'department': dept, 'bbox': box if None not in box else None,
+            'name': row[10] or village,
+        })
+    return samples
+
+
+def plan_lines(con, sql, params):
+    return [r[3] for r in con.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def unselective_index(con, index):
+    """True when ANALYZE found `index` to match half the table or more per key, so a scan is the right plan."""
+    try:
+        row = con.execute('SELECT stat FROM sqlite_stat1 WHERE idx = ?', (index,)).fetchone()
+    except sqlite3.OperationalError:  # never analyzed
+        return False
+    stat = row[0].split() if row else []
+    return len(stat) > 1 and stat[0].isdigit() and stat[1].isdigit() and 2 * int(stat[1]) >= int(stat[0])
+
+
+def plan_problems(lines, expect, temp_btree_ok):
+    """Reasons the plan does not match the expected access path."""
+    problems = []
+    for line in lines:
+        if line.startswith('SCAN '):
+            uses_index = ' USING ' in line and 'INDEX' in line
+            if expect == 'seek' or (expect == 'index' and not uses_index):
+                problems.append(f'unexpected {line}')
+        elif 'TEMP B-TREE' in line and not temp_btree_ok:
+            problems.append(f'unexpected {line}')
+    return problems
+
+
+def time_query(con, sql, params, fetch, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        cur = con.execute(sql, params)
+        cur.fetchone() if fetch == 'one' else cur.fetchall()
+        cur.close()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else None
+
+
+def check_query(con, entry, samples, repeat, budget_scale):
+    sql, expect = entry['sql'], entry['expect']
+    result = {'name': entry['name'], 'method': entry['method'], 'expect': expect,
+              'budget_ms': entry['budget_ms'] * budget_scale, 'plan': [], 'notes': [], 'problems': [], 'status': 'ok'}
+    missing = [c for c in entry['requires'] if c not in parcel_columns(con)]
+    if missing:
+        # The app checks for the column and uses the properties LIKE fallback instead
+        result['status'] = 'skipped'
+        result['notes'].append(f"no {', '.join(missing)} column")
+        return result
+    times = []
+    for sample in samples:
+        params = entry['params'](sample)
+        if params is None:
+            continue
+        try:
+            lines = plan_lines(con, sql, params)
+            times.append(time_query(con, sql, params, entry['fetch'], repeat))
+        except sqlite3.Error as e:
+            result['problems'].append(f'error: {e}')
+            break
+        for line in lines:
+            if line not in result['plan']:
+                result['plan'].append(line)
+    problems = plan_problems(result['plan'], expect, entry['temp_btree'])
+    if problems and expect == 'seek' and entry['index'] and unselective_index(con, entry['index']):
+        # The planner skipped the index on purpose (e.g. a single department): not a regression
+        result['notes'] += [f"{p} ({entry['index']} does not narrow this data)" for p in problems]
+    else:
+        result['problems'] += problems
+    ordered = sorted(times)
+    result.update({k: round(v, 4) if v is not None else None for k, v in
+                   (('p50_ms', _percentile(ordered, 0.5)), ('p95_ms', _percentile(ordered, 0.95)),
+                    ('max_ms', ordered[-1] if ordered else None))}, samples=len(ordered))
+    if result['p95_ms'] is not None and result['p95_ms'] > result['budget_ms']:
+        result['problems'].append(f"p95 {result['p95_ms']:.2f} ms over the {result['budget_ms']:.0f} ms budget")
+    if not ordered and not result['problems']:
+        result['status'] = 'skipped'
+        result['notes'].append('no usable parameter sample')
+    elif result['problems']:
+        result['status'] = 'fail'
+    return result
+
+
+def check_db(path, samples=DEFAULT_SAMPLES, repeat=DEFAULT_REPEAT, budget_scale=1.0, only=None):
+    con = sqlite3.connect(f'file:{Path(path).as_posix()}?mode=ro', uri=True)
+    drawn = draw_samples(con, samples)
+    results = [check_query(con, entry, drawn, repeat, budget_scale)
+               for entry in CATALOG if not only or entry['name'] in only]
+    con.close()
+    return results
+
+
+def print_results(results):
+    print(f"{'query':<26} {'expect':<6} {'p50 ms':>8} {'p95 ms':>8} {'budget':>7}  status")
+    for r in results:
+        p50 = f"{r['p50_ms']:8.2f}" if r.get('p50_ms') is not None else f"{'-':>8}"
+        p95 = f"{r['p95_ms']:8.2f}" if r.get('p95_ms') is not None else f"{'-':>8}"
+        print(f"{r['name']:<26} {r['expect']:<6} {p50} {p95} {r['budget_ms']:7.0f}  {r['status'].upper()}")
+        for problem in r['problems'] + r['notes']:
+            print(f'    {problem}')
+        if r['status'] == 'fail':
+            for line in r['plan']:
+                print(f'    plan: {line}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query plans and latency of the app's SQL on a built DB.")
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='parameter samples per query')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='timed runs per sample (best is kept)')
+    parser.add_argument('--budget-scale', type=float, default=1.0, help='multiply every latency budget')
+    parser.add_argument('--only', help='comma-separated query names')
+    parser.add_argument('--json', help='write the results as JSON')
+    args = parser.parse_args()
+    only = {n.strip() for n in args.only.split(',')} if args.only else None
+    if only and only - {entry['name'] for entry in CATALOG}:
+        parser.error(f"unknown queries: {', '.join(sorted(only - {entry['name'] for entry in CATALOG}))}")
+    if not Path(args.db).exists():
+        parser.error(f'{args.db} not found')
+
+    results = check_db(args.db, args.samples, max(1, args.repeat), args.budget_scale, only)
+    print_results(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps({'db': args.db, 'results': results}, indent=2), encoding='utf-8')
+    failed = [r['name'] for r in results if r['status'] == 'fail']
+    if failed:
+        print(f"{len(failed)} of {len(results)} queries regressed: {', '.join(failed)}")
+        sys.exit(1)
+    print(f'All {len(results)} queries within their plan and latency budgets')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,19 @@
 #!/usr/bin/env python3
-import sqlite3
 import json
 import sys
 
+from parcelstore import ParcelStore
+
 DB_PATH = 'prebuilt/parcelapp.db'
 VILLAGES = ['Netteboulou', 'Sinthiou Maleme', 'Sinthiou_Maleme', 'Sinthiou', 'Netteboulou']
+SUMMARY_COLUMNS = ('id', 'num_parcel', 'village', 'min_lat', 'min_lng', 'max_lat', 'max_lng')
 
-def inspect_village(conn, name):
-    cur = conn.cursor()
-    # Search both village column and properties JSON text (case-insensitive)
+def inspect_village(store, name):
+    # Search both village column and properties JSON text (case-insensitive);
+    # geometry / properties are only read for the sampled rows
     pattern = f"%{name}%"
-    rows = cur.execute("SELECT id, num_parcel, village, geometry, properties, min_lat, min_lng, max_lat, max_lng FROM parcels WHERE (village LIKE ? OR properties LIKE ?) COLLATE NOCASE", (pattern, pattern)).fetchall()
-    return rows
+    return list(store.select("(village LIKE ? OR properties LIKE ?) COLLATE NOCASE", (pattern, pattern),
+                             columns=SUMMARY_COLUMNS))
 
 
 def summarize_rows(rows, limit=5):
@@ -19,28 +21,20 @@ def summarize_rows(rows, limit=5):
     out['count'] = len(rows)
     out['sample'] = []
     for r in rows[:limit]:
-        id_, num, village, geom, props, min_lat, min_lng, max_lat, max_lng = r
-        has_geom = 1 if geom and geom.strip() else 0
-        has_props = 1 if props and props.strip() else 0
-        bbox_populated = 1 if (min_lat is not None and min_lng is not None and max_lat is not None and max_lng is not None) else 0
-        # try parse properties to capture commune/region keys
-        parsed_props = None
-        try:
-            parsed_props = json.loads(props) if props and props.strip() else None
-        except Exception:
-            parsed_props = None
+        # capture commune/region keys
+        props = r.properties
         sample = {
-            'id': id_,
-            'num_parcel': num,
-            'village': village,
-            'has_geometry': bool(has_geom),
-            'has_properties': bool(has_props),
-            'bbox_populated': bool(bbox_populated),
-            'min_lat': min_lat,
-            'min_lng': min_lng,
-            'max_lat': max_lat,
-            'max_lng': max_lng,
-            'properties_keys': list(parsed_props.keys())[:10] if isinstance(parsed_props, dict) else None
+            'id': r.id,
+            'num_parcel': r.num_parcel,
+            'village': r.village,
+            'has_geometry': r.has_geometry,
+            'has_properties': bool(r.raw_properties and r.raw_properties.strip()),
+            'bbox_populated': r.bbox is not None,
+            'min_lat': r.min_lat,
+            'min_lng': r.min_lng,
+            'max_lat': r.max_lat,
+            'max_lng': r.max_lng,
+            'properties_keys': list(props.keys())[:10] if props else None
         }
         out['sample'].append(sample)
     return out
@@ -48,7 +42,7 @@ def summarize_rows(rows, limit=5):
 
 def main():
     try:
-        conn = sqlite3.connect(DB_PATH)
+        store = ParcelStore(DB_PATH)
     except Exception as e:
         print('ERROR: could not open DB at', DB_PATH, e)
         sys.exit(1)
@@ -56,7 +50,7 @@ def main():
     results = {}
     total_found = 0
     for v in VILLAGES:
-        rows = inspect_village(conn, v)
+        rows = inspect_village(store, v)
         summary = summarize_rows(rows)
         results[v] = summary
         total_found += summary['count']
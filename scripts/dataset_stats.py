@@ -0,0 +1,179 @@
+"""
+Materialized dataset statistics for parcelapp.db.
+
+generate_prebuilt_db.py calls build_parcel_stats() at the end of every build
+(full or --incremental). parcel_stats then holds parcel counts per
+(dimension, value, parcel_type) for:
+    type          parcel_type
+    department    properties.departmentSenegal
+    commune       properties.communeSenegal
+    village       village column
+    survey_date   properties.today (YYYY-MM-DD)
+    topographe    properties.Topographe
+Missing values are counted under ''. Dimensions that promoted_columns.py
+copied into columns are read from them; otherwise properties are parsed once
+per parcel (materialized CTE). Each dimension is then one GROUP BY.
+
+table_summaries() gives rows, on-disk bytes (dbstat, tables plus their
+indexes) and a content checksum per table; write_build_meta() puts them in
+parcelapp.meta.json next to the counts the app reads.
+
+Usage:
+    python scripts/dataset_stats.py [db] [--dimension commune] [--type collectif] [--write]
+"""
+
+import argparse
+import hashlib
+import sqlite3
+
+STATS_TABLE = 'parcel_stats'
+
+# dimension -> SQL expression over parcels
+STAT_DIMENSIONS = {
+    'type': 'parcel_type',
+    'department': "json_extract(properties, '$.departmentSenegal')",
+    'commune': "json_extract(properties, '$.communeSenegal')",
+    'village': 'village',
+    'survey_date': "substr(json_extract(properties, '$.today'), 1, 10)",
+    'topographe': "json_extract(properties, '$.Topographe')",
+}
+# Dimensions read from the promoted column of the same name when it exists (promoted_columns)
+PROMOTED_DIMENSIONS = ('department', 'commune', 'survey_date', 'topographe')
+
+# Tables whose content is the build output itself (meta holds the checksums)
+_SUMMARY_EXCLUDED = ('meta',)
+
+
+def has_parcel_stats(con):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (STATS_TABLE,)).fetchone() is not None
+
+
+def dimension_exprs(con):
+    """STAT_DIMENSIONS with promoted columns used in place of json_extract where available."""
+    columns = {r[1] for r in con.execute('PRAGMA table_info(parcels)')}
+    return {name: name if name in PROMOTED_DIMENSIONS and name in columns else expr
+            for name, expr in STAT_DIMENSIONS.items()}
+
+
+def build_parcel_stats(con):
+    """(Re)build parcel_stats from the parcels table. Returns the number of rows written."""
+    con.execute(f'''CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+        dimension TEXT NOT NULL,
+        value TEXT NOT NULL,
+        parcel_type TEXT NOT NULL,
+        parcel_count INTEGER NOT NULL,
+        PRIMARY KEY (dimension, value, parcel_type)
+    ) WITHOUT ROWID;''')
+    con.execute(f'DELETE FROM {STATS_TABLE}')
+    columns = ', '.join(f'{expr} AS d_{name}' for name, expr in dimension_exprs(con).items())
+    selects = ' UNION ALL '.join(
+        f"SELECT '{name}', COALESCE(CAST(d_{name} AS TEXT), ''), COALESCE(parcel_type, ''), COUNT(*) "
+        f"FROM v GROUP BY 2, 3"
+        for name in STAT_DIMENSIONS)
+    sql = f'''INSERT INTO {STATS_TABLE} (dimension, value, parcel_type, parcel_count)
+        WITH v AS MATERIALIZED (SELECT parcel_type, {columns} FROM parcels)
+        {selects}'''
+    return con.execute(sql).rowcount
+
+
+def dimension_counts(con, dimension, parcel_type=None):
+    """[(value, count)] for one dimension, largest first (from parcel_stats when present)."""
+    if dimension not in STAT_DIMENSIONS:
+        raise ValueError(f'unknown dimension {dimension!r} (expected one of {", ".join(STAT_DIMENSIONS)})')
+    type_sql, params = (' AND parcel_type = ?', [parcel_type]) if parcel_type else ('', [])
+    if has_parcel_stats(con):
+        sql = f'''SELECT value, SUM(parcel_count) AS n FROM {STATS_TABLE}
+            WHERE dimension = ?{type_sql} GROUP BY value ORDER BY n DESC, value'''
+        return con.execute(sql, [dimension] + params).fetchall()
+    sql = f'''SELECT COALESCE(CAST({dimension_exprs(con)[dimension]} AS TEXT), '') AS value, COUNT(*) AS n
+        FROM parcels WHERE 1{type_sql} GROUP BY value ORDER BY n DESC, value'''
+    return con.execute(sql, params).fetchall()
+
+
+def parcel_counts(con):
+    """{'total', 'individuel', 'collectif'} parcel counts (same shape as meta.json counts)."""
+    counts = {'total': 0, 'individuel': 0, 'collectif': 0}
+    for ptype, n in dimension_counts(con, 'type'):
+        counts['total'] += n
+        if ptype in counts:
+            counts[ptype] = n
+    return counts
+
+
+def _table_checksum(con, table, order):
+    h = hashlib.blake2b(digest_size=16)
+    for row in con.execute(f'SELECT * FROM "{table}" ORDER BY {order}'):
+        for value in row:
+            if value is None:
+                h.update(b'\x00N')
+            elif isinstance(value, bytes):
+                h.update(b'\x00B')
+                h.update(value)
+            else:
+                h.update(b'\x00S')
+                h.update(str(value).encode('utf-8'))
+    return h.hexdigest()
+
+
+def table_sizes(con):
+    """{table: bytes including its indexes} from dbstat, or None when SQLite lacks dbstat."""
+    sizes = {}
+    try:
+        owners = dict(con.execute("SELECT name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')"))
+        for name, size in con.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'):
+            table = owners.get(name, name)
+            sizes[table] = sizes.get(table, 0) + size
+    except sqlite3.OperationalError:
+        return None
+    return sizes
+
+
+def table_summaries(con):
+    """{table: {'rows', 'bytes', 'checksum'}} for every ordinary table.
+
+    bytes includes the table's indexes and is None when SQLite lacks dbstat.
+    Checksums hash the rows in primary-key order, so they also change when
+    row ids do.
+    """
+    sizes = table_sizes(con)
+    out = {}
+    tables = con.execute("""SELECT name, sql FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%' ORDER BY name""")
+    for name, sql in tables.fetchall():
+        if name in _SUMMARY_EXCLUDED:
+            continue
+        pk = [r[1] for r in sorted(con.execute(f'PRAGMA table_info("{name}")'), key=lambda r: r[5]) if r[5]]
+        order = ', '.join(f'"{c}"' for c in pk) if 'WITHOUT ROWID' in sql.upper() else 'rowid'
+        out[name] = {
+            'rows': con.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0],
+            'bytes': sizes.get(name) if sizes is not None else None,
+            'checksum': _table_checksum(con, name, order),
+        }
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dataset counts from the parcel_stats table.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('--dimension', choices=tuple(STAT_DIMENSIONS), default=None,
+                        help='print counts for one dimension (default: all, top 10 each)')
+    parser.add_argument('--type', dest='parcel_type', default=None, help='only this parcel_type')
+    parser.add_argument('--write', action='store_true', help='(re)build parcel_stats first')
+    args = parser.parse_args()
+
+    con = sqlite3.connect(args.db)
+    if args.write:
+        print(f'{build_parcel_stats(con)} parcel_stats rows')
+        con.commit()
+    counts = parcel_counts(con)
+    print(f"parcels: {counts['total']} (individuel {counts['individuel']}, collectif {counts['collectif']})")
+    for dimension in (args.dimension,) if args.dimension else STAT_DIMENSIONS:
+        rows = dimension_counts(con, dimension, args.parcel_type)
+        print(f'\n{dimension} ({len(rows)} values):')
+        for value, n in rows if args.dimension else rows[:10]:
+            print(f'  {value or "(none)"}: {n}')
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,124 +1,70 @@
-import sqlite3
-import json
-import math
+from neighbor_graph import haversine_m
+from parcelstore import ParcelStore
+from spatial_index import GEOM_FLAG_SWAPPED
 
 DB_PATH = 'prebuilt/parcelapp.db'
 TARGET = '0522010201354'
-
-def try_parse_geom(raw):
-    if not raw:
-        return None
-    if isinstance(raw, (dict, list)):
-        return raw
-    try:
-        return json.loads(raw)
-    except Exception:
-        return None
+BBOX_DELTA = 0.01  # ~1.1km, same window as getNeighborParcels
+MAX = 500
 
 
-def centroid_from_ring(ring, assume_lonlat=True):
-    s_lat = s_lng = 0.0
-    c = 0
-    for p in ring:
-        if not isinstance(p, (list, tuple)) or len(p) < 2:
-            continue
-        a = float(p[0]); b = float(p[1])
-        if assume_lonlat:
-            lng = a; lat = b
-        else:
-            lat = a; lng = b
-        s_lat += lat; s_lng += lng; c += 1
-    if c == 0:
+def swapped_flag(parcel, store):
+    # geom_flags records what ingest did; older DBs have no flags (unknown)
+    if not store.canonical or parcel.geom_flags is None:
         return None
-    return (s_lat/c, s_lng/c)
-
-
-def plausible(lat, lng):
-    return 4.0 <= lat <= 20.0 and -20.0 <= lng <= -4.0
-
+    return bool(parcel.geom_flags & GEOM_FLAG_SWAPPED)
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000.0
-    phi1 = math.radians(lat1); phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1); dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
 
+store = ParcelStore(DB_PATH)
 
-conn = sqlite3.connect(DB_PATH)
-cur = conn.cursor()
-
-cur.execute('SELECT id, num_parcel, geometry, properties FROM parcels WHERE num_parcel = ?', (TARGET,))
-row = cur.fetchone()
-if not row:
+target = store.get_by_num(TARGET, columns=('id', 'num_parcel', 'geom_flags', 'min_lat', 'min_lng', 'max_lat', 'max_lng'))
+if not target:
     print('Target parcel not found')
     raise SystemExit(1)
 
-pid, num, geom_raw, props_raw = row
-print('Found parcel', num)
-geom = try_parse_geom(geom_raw)
-props = try_parse_geom(props_raw)
-print('properties keys:', list((props or {}).keys())[:20])
-
-# attempt to get ring
-ring = None
-if geom and geom.get('type') == 'Polygon' and isinstance(geom.get('coordinates'), list):
-    ring = geom['coordinates'][0]
-elif geom and geom.get('type') == 'MultiPolygon' and isinstance(geom.get('coordinates'), list):
-    ring = geom['coordinates'][0][0]
+print('Found parcel', target.num_parcel)
+print('properties keys:', list(target.properties.keys())[:20])
 
-if not ring:
+centroid = target.centroid
+if not centroid:
     print('No ring found in geometry; aborting')
     raise SystemExit(1)
-
-cent = centroid_from_ring(ring, assume_lonlat=True)
-cent_swapped = centroid_from_ring(ring, assume_lonlat=False)
-print('cent default (lon,lat)-> (lat,lng):', cent)
-print('cent swapped (lat,lon)-> (lat,lng):', cent_swapped)
-
-if cent and plausible(*cent):
-    centroid = cent
-    swapped = False
-elif cent_swapped and plausible(*cent_swapped):
-    centroid = cent_swapped
-    swapped = True
+print('Chosen centroid:', centroid, 'swapped?', swapped_flag(target, store))
+
+# Precomputed graph when the DB has it, otherwise bbox candidates from parcels_rtree;
+# only candidate geometries are decoded
+if store.has_neighbors:
+    scored = [(d, n.num_parcel, n.centroid, swapped_flag(n, store))
+              for n, d, _touches in store.neighbors(target)]
+    print('candidates (parcel_neighbors):', len(scored))
+elif not store.has_bbox:
+    # Database without bbox columns: scan the first MAX parcels
+    candidates = list(store.select('num_parcel != ? AND geometry IS NOT NULL', (TARGET,),
+                                   columns=('id', 'num_parcel'), limit=MAX))
+    print('candidates count:', len(candidates))
+    scored = []
+    for c in candidates:
+        chosen = c.centroid
+        if chosen:
+            d = haversine_m(centroid[0], centroid[1], chosen[0], chosen[1])
+            scored.append((d, c.num_parcel, chosen, None))
 else:
-    centroid = cent or cent_swapped
-    swapped = None
-
-print('Chosen centroid:', centroid, 'swapped?', swapped)
-
-# fetch candidates
-MAX = 500
-cur.execute(f'SELECT id,num_parcel,geometry,properties FROM parcels WHERE num_parcel != ? AND geometry IS NOT NULL LIMIT {MAX}', (TARGET,))
-rows = cur.fetchall()
-print('candidates count:', len(rows))
-scored = []
-for r in rows:
-    rid, rnum, rgeom_raw, rprops_raw = r
-    rgeom = try_parse_geom(rgeom_raw)
-    if not rgeom:
-        continue
-    rr = None
-    if rgeom.get('type') == 'Polygon' and isinstance(rgeom.get('coordinates'), list):
-        rr = rgeom['coordinates'][0]
-    elif rgeom.get('type') == 'MultiPolygon' and isinstance(rgeom.get('coordinates'), list):
-        rr = rgeom['coordinates'][0][0]
-    if not rr:
-        continue
-    c1 = centroid_from_ring(rr, assume_lonlat=True)
-    c2 = centroid_from_ring(rr, assume_lonlat=False)
-    chosen = None; swapped_cand = None
-    if c1 and plausible(*c1):
-        chosen = c1; swapped_cand = False
-    elif c2 and plausible(*c2):
-        chosen = c2; swapped_cand = True
+    if target.bbox:
+        min_lat, min_lng, max_lat, max_lng = target.bbox
     else:
-        chosen = c1 or c2
-    if not chosen:
-        continue
-    d = haversine(centroid[0], centroid[1], chosen[0], chosen[1])
-    scored.append((d, rnum, chosen, swapped_cand))
+        min_lat = max_lat = centroid[0]
+        min_lng = max_lng = centroid[1]
+    candidates = store.in_bbox(min_lat - BBOX_DELTA, min_lng - BBOX_DELTA, max_lat + BBOX_DELTA, max_lng + BBOX_DELTA,
+                               columns=('id', 'num_parcel', 'geom_flags'))
+    candidates = [c for c in candidates if c.num_parcel != TARGET][:MAX]
+    print('candidates count:', len(candidates))
+    scored = []
+    for c in candidates:
+        chosen = c.centroid
+        if not chosen:
+            continue
+        d = haversine_m(centroid[0], centroid[1], chosen[0], chosen[1])
+        scored.append((d, c.num_parcel, chosen, swapped_flag(c, store)))
 
 scored.sort()
 print('Top 20 candidates:')
@@ -126,4 +72,4 @@ for s in scored[:20]:
     d, rnum, chosen, swapped_cand = s
     print(f'{rnum} dist_m={int(d)} centroid={chosen} swapped={swapped_cand}')
 
-conn.close()
+store.close()
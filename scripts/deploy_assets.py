@@ -0,0 +1,189 @@
+"""
+Deployment of the built DB into the Android assets.
+
+generate_prebuilt_db.py calls deploy_db() as its last ('assets') stage:
+  - the DB is read in COPY_CHUNK_SIZE blocks and hashed (SHA-256), so memory
+    use does not grow with the file;
+  - when the asset already has the same size and hash nothing is written, and
+    its mtime stays put, so Gradle's asset merge stays up to date;
+  - otherwise the blocks stream into a hidden temp file next to the asset
+    (aapt skips dotfiles), which is hashed again while written, fsynced and
+    renamed over the asset;
+  - with a zstd level, <name>.zst is produced the same way (needs the
+    zstandard package) and skipped when the sidecar shows it was made from
+    the same DB at the same level;
+  - <name>.sha256.json records bytes and SHA-256 of the DB (and of the
+    compressed copy) for the app to verify; it is only rewritten when it
+    changes.
+A .zst listed by the previous sidecar is removed when no zstd level is given.
+
+Usage:
+    python scripts/deploy_assets.py [db] [--dest android/app/src/main/assets] [--zstd [LEVEL]]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # no compressed copy
+    zstandard = None
+
+COPY_CHUNK_SIZE = 1 << 20
+DEFAULT_ZSTD_LEVEL = 19
+SIDECAR_SUFFIX = '.sha256.json'
+ASSETS_DIR = Path('android') / 'app' / 'src' / 'main' / 'assets'
+
+
+def file_digest(path, chunk_size=COPY_CHUNK_SIZE):
+    """SHA-256 hex digest of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def same_file(path, size, digest):
+    return path.exists() and path.stat().st_size == size and file_digest(path) == digest
+
+
+class _HashingWriter:
+    """File wrapper that hashes and counts what is written through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.bytes += len(data)
+        return self.f.write(data)
+
+
+def _atomic_write(dest, fill):
+    """Call fill(writer) on a temp file next to dest, fsync it and rename it over dest; return the writer."""
+    tmp = dest.with_name(f'.{dest.name}.tmp')
+    try:
+        with open(tmp, 'wb') as f:
+            writer = _HashingWriter(f)
+            fill(writer)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return writer
+
+
+def _copy_into(src, expected_digest):
+    def fill(writer):
+        with open(src, 'rb') as f:
+            for block in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                writer.write(block)
+        if writer.hash.hexdigest() != expected_digest:
+            raise OSError(f'{src} changed while it was being deployed')
+    return fill
+
+
+def _compress_into(src, size, level):
+    def fill(writer):
+        cctx = zstandard.ZstdCompressor(level=level, threads=-1, write_checksum=True)
+        with open(src, 'rb') as f:
+            cctx.copy_stream(f, writer, size=size, read_size=COPY_CHUNK_SIZE, write_size=COPY_CHUNK_SIZE)
+    return fill
+
+
+def read_sidecar(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def deploy_db(src, dest_dir, name=None, zstd_level=None):
+    """Deploy `src` as dest_dir/name (see the module docstring).
+
+    Returns {'path', 'bytes', 'sha256', 'written', 'compressed', 'sidecar', 'sidecar_written'}, where
+    compressed is None or {'file', 'bytes', 'sha256', 'level', 'written'}.
+    """
+    src = Path(src)
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    dest = dest_dir / (name or src.name)
+    sidecar_path = dest.with_name(dest.name + SIDECAR_SUFFIX)
+    previous = read_sidecar(sidecar_path)
+
+    size = src.stat().st_size
+    digest = file_digest(src)
+    written = not same_file(dest, size, digest)
+    if written:
+        _atomic_write(dest, _copy_into(src, digest))
+
+    compressed = None
+    old = previous.get('compressed') or {}
+    if zstd_level is not None:
+        if zstandard is None:
+            raise RuntimeError('zstandard is not installed (pip install zstandard)')
+        packed = dest.with_name(dest.name + '.zst')
+        if (previous.get('sha256') == digest and old.get('level') == zstd_level
+                and old.get('file') == packed.name and same_file(packed, old.get('bytes'), old.get('sha256'))):
+            compressed = dict(old, written=False)
+        else:
+            writer = _atomic_write(packed, _compress_into(src, size, zstd_level))
+            compressed = {'file': packed.name, 'codec': 'zstd', 'level': zstd_level, 'bytes': writer.bytes,
+                          'sha256': writer.hash.hexdigest(), 'written': True}
+    elif old.get('file'):
+        (dest_dir / old['file']).unlink(missing_ok=True)
+
+    sidecar = {'file': dest.name, 'bytes': size, 'sha256': digest}
+    if compressed:
+        sidecar['compressed'] = {k: v for k, v in compressed.items() if k != 'written'}
+    text = json.dumps(sidecar, indent=2) + '\n'
+    sidecar_written = not sidecar_path.exists() or sidecar_path.read_text(encoding='utf-8') != text
+    if sidecar_written:
+        _atomic_write(sidecar_path, lambda writer: writer.write(text.encode('utf-8')))
+    return {'path': dest, 'bytes': size, 'sha256': digest, 'written': written, 'compressed': compressed,
+            'sidecar': sidecar_path, 'sidecar_written': sidecar_written}
+
+
+def print_deploy_summary(result):
+    state = 'copied' if result['written'] else 'unchanged, not rewritten'
+    print(f"{result['path']}: {result['bytes']} bytes, sha256 {result['sha256'][:16]}... ({state})")
+    packed = result['compressed']
+    if packed:
+        state = 'written' if packed['written'] else 'unchanged'
+        print(f"{packed['file']}: {packed['bytes']} bytes (zstd -{packed['level']}, "
+              f"{100.0 * packed['bytes'] / max(1, result['bytes']):.1f}%) ({state})")
+    print(f"{result['sidecar']}{'' if result['sidecar_written'] else ' (unchanged)'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy the built DB into the Android assets (streamed, checksummed).')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('--dest', default=str(ASSETS_DIR), help=f'assets directory (default {ASSETS_DIR})')
+    parser.add_argument('--zstd', nargs='?', type=int, const=DEFAULT_ZSTD_LEVEL, metavar='LEVEL',
+                        help=f'also write a zstd-compressed copy (default level {DEFAULT_ZSTD_LEVEL}); needs zstandard')
+    args = parser.parse_args()
+    if not Path(args.db).exists():
+        parser.error(f'{args.db} not found')
+    if args.zstd is not None and zstandard is None:
+        print('zstandard is not installed; --zstd is ignored')
+        args.zstd = None
+    try:
+        result = deploy_db(args.db, args.dest, zstd_level=args.zstd)
+    except OSError as e:
+        print(f'ERROR: {e}')
+        sys.exit(1)
+    print_deploy_summary(result)
+
+
+if __name__ == '__main__':
+    main()
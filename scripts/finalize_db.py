@@ -0,0 +1,146 @@
+"""
+Finalize stage for the shipped parcelapp.db.
+
+generate_prebuilt_db.py calls finalize_db() once the build is committed:
+  - ANALYZE, so sqlite_stat1 ships with the DB and the app's first queries
+    are planned with real statistics;
+  - VACUUM INTO a temporary file with the chosen page size: every table and
+    index b-tree is rewritten in key order into contiguous, full pages, and
+    the free pages left by incremental updates are dropped;
+  - PRAGMA integrity_check on the copy, which then atomically replaces the
+    original (the original is left untouched if the check fails).
+
+The page size is fixed (4096 by default, the Android/SQLite default) or
+'auto': every size in PAGE_SIZES is tried and the smallest file wins.
+
+size_breakdown() reports pages and bytes per table and index from dbstat.
+
+Usage:
+    python scripts/finalize_db.py <db> [--page-size 4096|auto] [--report-only]
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+DEFAULT_PAGE_SIZE = 4096
+PAGE_SIZES = (1024, 2048, 4096, 8192, 16384)
+
+
+class IntegrityError(Exception):
+    """PRAGMA integrity_check did not return ok."""
+
+
+def check_integrity(con):
+    problems = [r[0] for r in con.execute('PRAGMA integrity_check')]
+    if problems != ['ok']:
+        raise IntegrityError('; '.join(problems[:10]))
+
+
+def _vacuum_into(con, dest, page_size):
+    if dest.exists():
+        dest.unlink()
+    con.execute(f'PRAGMA page_size = {int(page_size)}')
+    con.execute('VACUUM INTO ?', (str(dest),))
+    return dest.stat().st_size
+
+
+def pick_page_size(con, path, candidates=PAGE_SIZES):
+    """Try every candidate page size with VACUUM INTO; return (best size, {size: file bytes})."""
+    sizes = {}
+    probe = path.with_name(path.name + '.probe')
+    try:
+        for page_size in candidates:
+            sizes[page_size] = _vacuum_into(con, probe, page_size)
+    finally:
+        if probe.exists():
+            probe.unlink()
+    return min(sizes, key=lambda p: (sizes[p], p)), sizes
+
+
+def finalize_db(path, page_size=DEFAULT_PAGE_SIZE):
+    """ANALYZE, VACUUM INTO (with `page_size`, or 'auto'), integrity-check and replace `path`.
+
+    Returns {'page_size', 'bytes_before', 'bytes_after'}. Raises IntegrityError
+    (leaving `path` unchanged) if the rebuilt copy fails the check.
+    """
+    path = Path(path)
+    bytes_before = path.stat().st_size
+    tmp = path.with_name(path.name + '.finalize')
+    con = sqlite3.connect(str(path))
+    try:
+        con.execute('ANALYZE')
+        con.commit()
+        if page_size == 'auto':
+            page_size, _ = pick_page_size(con, path)
+        _vacuum_into(con, tmp, page_size)
+    finally:
+        con.close()
+
+    check = sqlite3.connect(str(tmp))
+    try:
+        check_integrity(check)
+    except IntegrityError:
+        check.close()
+        tmp.unlink()
+        raise
+    check.close()
+    os.replace(tmp, path)
+    return {'page_size': page_size, 'bytes_before': bytes_before, 'bytes_after': path.stat().st_size}
+
+
+def size_breakdown(con):
+    """[(name, 'table'|'index', owning table, pages, bytes, unused bytes)] from dbstat, largest first.
+
+    Returns [] when SQLite was built without dbstat.
+    """
+    kinds = {name: (kind, table) for name, kind, table in
+             con.execute("SELECT name, type, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')")}
+    kinds.setdefault('sqlite_schema', ('table', 'sqlite_schema'))
+    try:
+        rows = con.execute('''SELECT name, COUNT(*), SUM(pgsize), SUM(unused) FROM dbstat
+            GROUP BY name ORDER BY SUM(pgsize) DESC, name''').fetchall()
+    except sqlite3.OperationalError:
+        return []
+    out = []
+    for name, pages, size, unused in rows:
+        kind, table = kinds.get(name, ('table', name))
+        out.append((name, kind, table, pages, size, unused))
+    return out
+
+
+def print_size_breakdown(con, limit=None):
+    rows = size_breakdown(con)
+    if not rows:
+        print('dbstat is not available in this SQLite build; no size breakdown')
+        return
+    total = sum(r[4] for r in rows) or 1
+    print(f"{'name':<32} {'type':<6} {'pages':>7} {'bytes':>12} {'share':>6} {'unused':>7}")
+    for name, kind, _table, pages, size, unused in rows[:limit]:
+        print(f'{name:<32} {kind:<6} {pages:>7} {size:>12} {100.0 * size / total:5.1f}% '
+              f'{100.0 * unused / size if size else 0.0:6.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ANALYZE, compact and integrity-check a parcelapp.db.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('--page-size', default=str(DEFAULT_PAGE_SIZE),
+                        help=f"page size for the rebuilt file, or 'auto' to try {', '.join(map(str, PAGE_SIZES))}")
+    parser.add_argument('--report-only', action='store_true', help='only print the dbstat size breakdown')
+    args = parser.parse_args()
+
+    if not args.report_only:
+        page_size = args.page_size if args.page_size == 'auto' else int(args.page_size)
+        t0 = time.perf_counter()
+        result = finalize_db(args.db, page_size)
+        print(f"finalized with page_size {result['page_size']}: {result['bytes_before']} -> "
+              f"{result['bytes_after']} bytes in {time.perf_counter() - t0:.2f}s")
+    con = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    print_size_breakdown(con)
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
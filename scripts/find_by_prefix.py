@@ -1,4 +1,7 @@
-import sqlite3, sys, os, json
+import sqlite3, sys, os
+
+from parcel_numbers import find_by_prefix
+
 root = os.path.dirname(os.path.dirname(__file__))
 db = os.path.join(root, 'prebuilt', 'parcelapp.db')
 if len(sys.argv) < 2:
@@ -6,9 +9,8 @@ if len(sys.argv) < 2:
     sys.exit(1)
 pref = sys.argv[1]
 con = sqlite3.connect(db)
-cur = con.cursor()
-cur.execute("SELECT num_parcel FROM parcels WHERE num_parcel LIKE ? LIMIT 200", (pref + '%',))
-rows = cur.fetchall()
+# Index range on the decoded number columns (LIKE on older DBs)
+rows = find_by_prefix(con, pref, limit=200)
 if not rows:
     print('no matches')
 else:
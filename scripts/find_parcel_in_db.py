@@ -2,6 +2,8 @@ import sqlite3
 import sys
 from pathlib import Path
 
+from bulk_lookup import count_matches, load_lookup_ids, read_ids
+
 
 def get_tables(conn):
     cur = conn.cursor()
@@ -33,9 +35,18 @@ def find_parcel(conn, parcel_num):
     return hits
 
 
+def find_parcels_bulk(conn, parcel_nums):
+    """Per-number hits like find_parcel(), with one join per table column for the whole list."""
+    load_lookup_ids(conn, parcel_nums)
+    matches = count_matches(conn)
+    for pn in parcel_nums:
+        yield pn, [(t, col, counts[pn]) for (t, col), counts in matches.items() if counts.get(pn)]
+
+
 def main():
     if len(sys.argv) < 3:
         print("Usage: python scripts/find_parcel_in_db.py <path/to/db> <parcel_num> [parcel_num ...]")
+        print("       python scripts/find_parcel_in_db.py <path/to/db> --ids <file|->")
         sys.exit(1)
     db_path = Path(sys.argv[1])
     if not db_path.exists():
@@ -43,6 +54,19 @@ def main():
         sys.exit(2)
     conn = sqlite3.connect(str(db_path))
     try:
+        if sys.argv[2] == "--ids":
+            source = sys.argv[3] if len(sys.argv) > 3 else "-"
+            if source == "-":
+                nums = list(read_ids(sys.stdin))
+            else:
+                with open(source, "r", encoding="utf-8-sig") as fh:
+                    nums = list(read_ids(fh))
+            for pn, hits in find_parcels_bulk(conn, nums):
+                if hits:
+                    print(f"{pn}: " + ", ".join(f"{t}.{col}={cnt}" for (t, col, cnt) in hits))
+                else:
+                    print(f"{pn}: not found")
+            return
         for pn in sys.argv[2:]:
             hits = find_parcel(conn, pn)
             if hits:
@@ -1,12 +1,85 @@
 import sqlite3
 import json
 import os
+import sys
 import time
-import math
+import argparse
+import cProfile
+import hashlib
+from datetime import date
+from itertools import islice
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+from spatial_index import (GEOM_FLAG_3D, GEOM_FLAG_INVALID, GEOM_FLAG_OUT_OF_RANGE, GEOM_FLAG_SWAPPED,
+                           normalize_geometry, populate_rtree)
+from search_index import build_search_index
+from geometry_codec import try_encode_geometry
+from property_codec import PROPERTIES_FORMATS, has_compact_properties, load_schemas, write_compact_properties
+from table_layout import COMPAT_VIEW, LAYOUTS, SIDE_TABLES, is_split, merge_parcels, split_parcels
+from neighbor_graph import build_neighbor_graph
+from parcel_numbers import build_prefix_stats, write_parcel_numbers
+from dataset_stats import STAT_DIMENSIONS, build_parcel_stats, dimension_counts, parcel_counts, table_summaries, table_sizes
+from promoted_columns import PROMOTED_COLUMNS, load_config, report_promoted_columns, write_promoted_columns
+from finalize_db import DEFAULT_PAGE_SIZE, IntegrityError, finalize_db, print_size_breakdown
+from build_report import StageStats, report_path, write_build_report
+from shard_packs import PACK_LEVELS, build_packs, print_summary as print_pack_summary
+from deploy_assets import ASSETS_DIR, DEFAULT_ZSTD_LEVEL, deploy_db, print_deploy_summary, zstandard
+try:
+    from geometry_metrics import write_metrics
+except ImportError:  # numpy not installed: metric columns stay NULL
+    write_metrics = None
+try:
+    from geometry_lod import LOD_TOLERANCES_M, has_lod_table, parse_tolerances, print_lod_report, stored_tolerances, write_lods
+except ImportError:  # numpy not installed: no parcel_geometry_lod
+    write_lods = None
+
+# Number of features canonicalized and inserted per executemany().
+# In streaming mode memory use is bounded by the chunks in flight regardless of input size.
+STREAM_CHUNK_SIZE = 1000
+
+# Geometry storage: JSON text (what the app reads), text plus the compact
+# binary column, or the compact column only (smaller DBs for scripts/analysis)
+GEOMETRY_FORMATS = ('json', 'both', 'compact')
+
+# Canonical key -> predicate over a source key. Each predicate is evaluated once
+# per distinct key set (see compile_key_plan), never per feature.
+_TYPE_USAGE_VARIANTS = ('typeusa', 'typeusage', 'typeusag', 'typeusag1', 'typeusa1', 'usage')
+_CANONICAL_KEY_RULES = (
+    # Vocation_1 -> Vocation
+    ('Vocation', lambda k: k.lower().replace('_', '').startswith('vocation')),
+    # any key like type_usa / typeusage -> type_usag
+    ('type_usag', lambda k: k.lower().replace('_', '').replace(' ', '') in _TYPE_USAGE_VARIANTS),
+    # keys like 'village', 'village_name', 'village_sene', 'commune', 'commune_senegal', 'locality'
+    ('Village', lambda k: any(part in k.lower().strip() for part in ('village', 'commune', 'localit'))),
+)
+KEY_PLAN_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=KEY_PLAN_CACHE_SIZE)
+def compile_key_plan(keys: tuple) -> tuple:
+    """Compile the alias resolution plan for one properties key set.
+
+    Returns ((canonical_key, (source_key, ...)), ...) with source keys in
+    property order. Kobo exports repeat the same few key sets across thousands
+    of features, so the key scanning is paid once per key set.
+    """
+    plan = []
+    for target, matches in _CANONICAL_KEY_RULES:
+        sources = tuple(k for k in keys if k and isinstance(k, str) and matches(k))
+        if sources:
+            plan.append((target, sources))
+    return tuple(plan)
+
+
+def key_plan_cache_counts():
+    """Return (hits, misses) of the key plan cache in this process."""
+    info = compile_key_plan.cache_info()
+    return info.hits, info.misses
+
 
-# Performance optimization: Better DB generation with threading and optimized SQLite settings
 def canonicalize_properties(properties: dict) -> dict:
     """Return a shallow copy of properties with some common variant keys
     mapped to canonical names expected by the app UI.
@@ -14,49 +87,54 @@ def canonicalize_properties(properties: dict) -> dict:
     Examples handled:
       - Vocation_1 -> Vocation
       - any key like type_usa / typeusage -> type_usag
+      - village / commune / locality variants -> Village
+
+    The first source key (in property order) with a truthy value wins, and a
+    canonical key that already has a truthy value is left alone.
     """
     if not properties:
         return properties
     props = dict(properties)  # shallow copy
 
-    # Canonicalize vocation-like keys
-    if not props.get('Vocation'):
-        for k, v in properties.items():
-            if k and isinstance(k, str) and k.lower().replace('_', '').startswith('vocation') and v:
-                props['Vocation'] = v
+    for target, sources in compile_key_plan(tuple(properties)):
+        if props.get(target):
+            continue
+        for k in sources:
+            v = properties[k]
+            if v:
+                props[target] = v
                 break
 
-    # Canonicalize type usage keys -> 'type_usag'
-    if not props.get('type_usag'):
-        for k, v in properties.items():
-            if not k or not isinstance(k, str):
-                continue
-            kl = k.lower().replace('_', '').replace(' ', '')
-            # common variants
-            if kl in ('typeusa', 'typeusage', 'typeusag', 'typeusag1', 'typeusa1', 'usage') and v:
-                props['type_usag'] = v
-                break
+    return props
 
-    # Canonicalize village-like keys -> 'Village'
-    if not props.get('Village'):
-        for k, v in properties.items():
-            if not k or not isinstance(k, str) or not v:
-                continue
-            kl = k.lower().strip()
-            # accept keys like 'village', 'village_name', 'village_sene', 'commune', 'commune_senegal', 'locality'
-            if ('village' in kl or kl.startswith('village') or 'commune' in kl or 'localit' in kl or 'locality' in kl) and v:
-                # prefer shorter names without trailing codes
-                props['Village'] = v
-                break
 
-    return props
-def process_batch(batch, parcel_type):
-    """Process a batch of parcels in a separate thread"""
+def process_batch(batch, parcel_type, geometry_format='json', timings=None):
+    """Canonicalize a batch of features into parcels insert rows.
+
+    Called by canonicalize_chunk, in a ProcessPoolExecutor worker when the
+    build runs with several workers (in the main process otherwise).
+
+    When a `timings` dict is given, the time spent in json.dumps is added to
+    timings['serialize'].
+    """
     result = []
+    serialize = 0.0
     for f in batch:
+        # Canonical 2D lon/lat, decided once here; geom_flags records swaps / dropped Z.
+        # bbox is (min_lat, min_lng, max_lat, max_lng), computed in the same pass.
+        geometry, geom_flags, bbox = normalize_geometry(f.get('geometry', {}))
+        bbox = bbox or (None, None, None, None)
+        # geometry_bin: quantized delta encoding (see geometry_codec); NULL if not requested, not
+        # encodable or not reproduced exactly by decode_geometry
+        geometry_bin = try_encode_geometry(geometry, exact=True) if geometry_format != 'json' else None
         properties = f.get('properties', {}) or {}
         # Produce a canonicalized properties dict so the DB stores app-expected keys
         properties = canonicalize_properties(properties)
+        t0 = time.perf_counter()
+        # 'compact' still keeps the JSON text for geometries the codec cannot encode
+        geometry_text = json.dumps(geometry) if geometry_format != 'compact' or geometry_bin is None else None
+        properties_text = json.dumps(properties)
+        serialize += time.perf_counter() - t0
         if parcel_type == 'individuel':
             result.append((
                 properties.get('Num_parcel'),
@@ -68,9 +146,9 @@ def process_batch(batch, parcel_type):
                 None,  # nom_m
                 properties.get('Denominat'),
                 properties.get('Village'),
-                json.dumps(f.get('geometry', {})),
-                json.dumps(properties)
-            ))
+                geometry_text,
+                properties_text
+            ) + bbox + (geometry_bin, geom_flags))
         else:  # collectif
             result.append((
                 properties.get('Num_parcel'),
@@ -82,94 +160,253 @@ def process_batch(batch, parcel_type):
                 properties.get('Nom_M'),
                 properties.get('Denominat'),
                 properties.get('Village'),
-                json.dumps(f.get('geometry', {})),
-                json.dumps(properties)
-            ))
+                geometry_text,
+                properties_text
+            ) + bbox + (geometry_bin, geom_flags))
+    if timings is not None:
+        timings['serialize'] = timings.get('serialize', 0.0) + serialize
     return result
 
-def create_optimized_db():
-    """Main function to create the optimized database"""
-    print("Starting optimized DB generation...")
-    start_time = time.time()
-    
-    # Define paths
-    root = Path(__file__).resolve().parents[1]
-    out_dir = root / 'prebuilt'
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out = out_dir / 'parcelapp.db'
-    
-    # Load JSON data with progress
-    print("Loading JSON data...")
-    json_start = time.time()
-    
-    # Prefer prebuilt copies if present to avoid keeping huge JSON in src/data
-    ind_path = root / 'prebuilt' / 'Parcels_individuels.json'
-    col_path = root / 'prebuilt' / 'Parcels_collectives.json'
-    def normalize_geojson(obj, name):
-        """Accept either a list of features or a GeoJSON FeatureCollection object.
-        Return a list of feature objects. Raise ValueError with a helpful message
-        if input doesn't match expected shapes.
-        """
-        if obj is None:
-            return []
-        if isinstance(obj, list):
-            return obj
-        if isinstance(obj, dict):
-            # Common GeoJSON shape: { "type": "FeatureCollection", "features": [ ... ] }
-            if 'features' in obj and isinstance(obj['features'], list):
-                return obj['features']
-            # Sometimes users will put a single feature under 'feature'
-            if 'feature' in obj and isinstance(obj['feature'], list):
-                return obj['feature']
-        # If we get here, the structure is unexpected. Give a clear error.
-        raise ValueError(f"Unexpected JSON shape for {name}: expected a list or FeatureCollection with 'features' array")
-
-    # Load individuals JSON
-    if ind_path.exists():
-        with open(ind_path, 'r', encoding='utf-8') as f:
-            raw_individus = json.load(f)
-    else:
-        with open(root / 'src' / 'data' / 'Parcels_individuels.json', 'r', encoding='utf-8') as f:
-            raw_individus = json.load(f)
 
-    # Load collectives JSON
-    if col_path.exists():
-        with open(col_path, 'r', encoding='utf-8') as f:
-            raw_collectifs = json.load(f)
-    else:
-        with open(root / 'src' / 'data' / 'Parcels_collectives.json', 'r', encoding='utf-8') as f:
-            raw_collectifs = json.load(f)
+class _JsonTextStream:
+    """Minimal pull reader over a text file for incremental JSON decoding.
+
+    Keeps only the undecoded tail of the file in memory, so arbitrarily large
+    FeatureCollections can be walked one feature at a time with the stdlib
+    decoder (no ijson dependency).
+    """
+
+    def __init__(self, fh, read_size=1 << 16):
+        self.fh = fh
+        self.read_size = read_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, min_size=0):
+        # Drop consumed text before growing the buffer
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.fh.read(max(self.read_size, min_size))
+        if not chunk:
+            self.eof = True
+        self.buf += chunk
+
+    def peek(self):
+        """Return the next non-whitespace character without consuming it ('' at EOF)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ''
+            self._fill()
 
-    # Normalize shapes into lists of features
+    def expect(self, ch):
+        got = self.peek()
+        if got != ch:
+            raise ValueError(f"expected {ch!r} but found {got or 'end of file'!r}")
+        self.pos += 1
+
+    def decode(self):
+        """Decode the next complete JSON value, reading more input as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # Value is split across reads: grow the buffer and retry
+                self._fill(len(self.buf) - self.pos)
+                continue
+            # A number at the very end of the buffer may still be truncated
+            if end == len(self.buf) and not self.eof:
+                self._fill(len(self.buf) - self.pos)
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self):
+        """Yield the elements of the JSON array starting at the current position."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            sep = self.peek()
+            self.pos += 1
+            if sep == ']':
+                return
+            if sep != ',':
+                raise ValueError(f"expected ',' or ']' in array but found {sep or 'end of file'!r}")
+
+
+def iter_feature_collection(path, name=None):
+    """Yield features from a JSON file holding either a list of features or a
+    FeatureCollection, without loading the whole document.
+
+    Accepts the same shapes as the in-memory loader: a top-level array, an
+    object with a 'features' array, or (fallback) an object with a 'feature' array.
+    """
+    name = name or Path(path).name
+    with open(path, 'r', encoding='utf-8') as fh:
+        stream = _JsonTextStream(fh)
+        first = stream.peek()
+        if first == '[':
+            yield from stream.iter_array()
+            return
+        if first != '{':
+            raise ValueError(f"Unexpected JSON shape for {name}: expected a list or FeatureCollection with 'features' array")
+        stream.pos += 1
+        fallback = None
+        found = False
+        if stream.peek() == '}':
+            stream.pos += 1
+        else:
+            while True:
+                key = stream.decode()
+                stream.expect(':')
+                if key == 'features' and not found and stream.peek() == '[':
+                    found = True
+                    yield from stream.iter_array()
+                else:
+                    value = stream.decode()
+                    if key == 'feature' and isinstance(value, list):
+                        fallback = value
+                sep = stream.peek()
+                stream.pos += 1
+                if sep == '}':
+                    break
+                if sep != ',':
+                    raise ValueError(f"Malformed JSON object in {name}")
+        if not found:
+            if fallback is None:
+                raise ValueError(f"Unexpected JSON shape for {name}: expected a list or FeatureCollection with 'features' array")
+            yield from fallback
+
+
+def decode_geojsonl_line(line, where):
+    """Decode one GeoJSONL line into a list of features.
+
+    Malformed lines are skipped with a warning on stderr (same policy as
+    normalize_geojsonl.py); a FeatureCollection line is expanded.
+    """
     try:
-        individus = normalize_geojson(raw_individus, 'Parcels_individuels.json')
-        collectifs = normalize_geojson(raw_collectifs, 'Parcels_collectives.json')
-    except ValueError as e:
-        print(f"ERROR: {e}")
-        print("Aborting DB generation. Please ensure the JSON files are either arrays of features or a FeatureCollection with a 'features' array.")
-        return
+        obj = json.loads(line)
+    except json.JSONDecodeError:
+        print(f"WARN: Malformed JSON line in {where}", file=sys.stderr)
+        return []
+    if obj.get('type') == 'Feature':
+        return [obj]
+    if obj.get('type') == 'FeatureCollection' and 'features' in obj:
+        return obj['features']
+    return []
 
-    print(f"JSON loading complete in {time.time() - json_start:.2f}s")
-    print(f"Processing {len(individus)} individual parcels and {len(collectifs)} collective parcels ({len(individus) + len(collectifs)} total)...")
 
-    # Remove existing database if it exists
-    if out.exists():
-        out.unlink()
+def iter_geojsonl_lines(path):
+    """Yield the raw non-empty lines of a GeoJSONL file, undecoded."""
+    with open(path, 'r', encoding='utf-8') as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def iter_geojsonl(path):
+    """Yield Feature objects from a newline-delimited GeoJSONL file, one line at a time."""
+    for line in iter_geojsonl_lines(path):
+        yield from decode_geojsonl_line(line, path)
+
+
+def is_geojsonl(path):
+    return Path(path).suffix.lower() in ('.geojsonl', '.jsonl', '.ndjson')
+
+
+def iter_features(path):
+    """Stream features from a .geojsonl/.jsonl file or a JSON FeatureCollection."""
+    if is_geojsonl(path):
+        return iter_geojsonl(path)
+    return iter_feature_collection(path)
+
+
+def iter_source_items(path):
+    """Stream pipeline work items for one input file.
+
+    GeoJSONL lines are handed over undecoded so that JSON parsing happens in
+    the worker processes too; FeatureCollections have to be walked (and thus
+    decoded) by the reader.
+    """
+    if is_geojsonl(path):
+        return iter_geojsonl_lines(path)
+    return iter_feature_collection(path)
+
+
+def chunked(iterable, size):
+    """Yield lists of at most `size` items from `iterable`."""
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def resolve_source(root, json_name, geojsonl_name):
+    """Pick the input file for one parcel layer.
+
+    Prefer prebuilt copies to avoid keeping huge JSON in src/data, then the
+    normalized JSON in src/data, then the raw GeoJSONL export.
+    """
+    candidates = [
+        root / 'prebuilt' / json_name,
+        root / 'src' / 'data' / json_name,
+        root / 'src' / 'GeojsonL_to_normalise' / geojsonl_name,
+    ]
+    for candidate in candidates:
+        if candidate.exists():
+            return candidate
+    # Keep the historical default so the error message points at src/data
+    return candidates[1]
+
+
+# Columns produced by process_batch, in row tuple order
+PARCEL_COLUMNS = ('num_parcel', 'parcel_type', 'typ_pers', 'prenom', 'nom', 'prenom_m', 'nom_m',
+                  'denominat', 'village', 'geometry', 'properties',
+                  'min_lat', 'min_lng', 'max_lat', 'max_lng', 'geometry_bin', 'geom_flags')
+
+# Define SQL statements for batch inserts / incremental updates. Ids are
+# assigned by the writer so they follow input order.
+INSERT_SQL = f"INSERT INTO parcels (id, {', '.join(PARCEL_COLUMNS)}) VALUES ({', '.join('?' * (len(PARCEL_COLUMNS) + 1))})"
+UPDATE_SQL = f"UPDATE parcels SET {', '.join(c + ' = ?' for c in PARCEL_COLUMNS)} WHERE id = ?"
+
 
+def tune_connection(con):
     # Optimize SQLite for faster inserts
-    con = sqlite3.connect(str(out))
     con.execute('PRAGMA synchronous = OFF')
     con.execute('PRAGMA journal_mode = MEMORY')
     con.execute('PRAGMA temp_store = MEMORY')
     con.execute('PRAGMA cache_size = 10000')
     con.execute('PRAGMA locking_mode = EXCLUSIVE')
-    con.execute('PRAGMA page_size = 4096')  # Optimize page size
-    
-    cur = con.cursor()
-    
+
+
+def open_output_db(out, page_size=DEFAULT_PAGE_SIZE):
+    """Create a fresh output database with the parcels table and fast-insert pragmas."""
+    # Remove existing database if it exists
+    if out.exists():
+        out.unlink()
+
+    con = sqlite3.connect(str(out))
+    tune_connection(con)
+    con.execute(f'PRAGMA page_size = {page_size}')  # before the first table; finalize_db rewrites it anyway
+
     # Create table structure with case-insensitive search columns
     print("Creating table structure...")
-    cur.execute('''CREATE TABLE parcels (
+    con.execute('''CREATE TABLE parcels (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         num_parcel TEXT COLLATE NOCASE,
         parcel_type TEXT,
@@ -181,63 +418,570 @@ def create_optimized_db():
         denominat TEXT,
         village TEXT COLLATE NOCASE,
         geometry TEXT,
-        properties TEXT
+        properties TEXT,
+        min_lat REAL,
+        min_lng REAL,
+        max_lat REAL,
+        max_lng REAL,
+        geometry_bin BLOB,
+        geom_flags INTEGER,
+        centroid_lat REAL,
+        centroid_lng REAL,
+        area_m2 REAL,
+        perimeter_m REAL,
+        num_region INTEGER,
+        num_department INTEGER,
+        num_commune INTEGER,
+        num_sequence INTEGER
     );''')
-    
-    # Define SQL statement for batch inserts
-    insert_sql = '''INSERT INTO parcels 
-        (num_parcel, parcel_type, typ_pers, prenom, nom, prenom_m, nom_m, denominat, village, geometry, properties) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
-    
-    # Process data in parallel batches
-    print("Processing individual parcels...")
-    
-    # Calculate optimal batch size based on data volume
-    # Use more threads for larger data sets
-    total_records = len(individus) + len(collectifs)
-    batch_size = min(5000, max(1000, math.ceil(total_records / 20)))
-    max_workers = min(32, os.cpu_count() * 2)
-    
-    # Process individual parcels in batches
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Split data into batches for parallel processing
-        batches = [individus[i:i + batch_size] for i in range(0, len(individus), batch_size)]
-        futures = [executor.submit(process_batch, batch, 'individuel') for batch in batches]
-        
-        # Process results as they complete
-        batch_count = 0
-        total_batches = len(batches)
-        for future in as_completed(futures):
-            batch_count += 1
-            rows = future.result()
-            cur.executemany(insert_sql, rows)
-            print(f"Processed individual batch {batch_count}/{total_batches} ({len(rows)} records)")
-    
-    # Process collective parcels
-    print("Processing collective parcels...")
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Split data into batches for parallel processing
-        batches = [collectifs[i:i + batch_size] for i in range(0, len(collectifs), batch_size)]
-        futures = [executor.submit(process_batch, batch, 'collectif') for batch in batches]
-        
-        # Process results as they complete
-        batch_count = 0
-        total_batches = len(batches)
-        for future in as_completed(futures):
-            batch_count += 1
-            rows = future.result()
-            cur.executemany(insert_sql, rows)
-            print(f"Processed collective batch {batch_count}/{total_batches} ({len(rows)} records)")
-    
+    create_build_tables(con)
+    return con
+
+
+def create_build_tables(con):
+    """Create the meta key/value table (same shape as the app's) and the build manifest.
+
+    build_manifest holds one content hash per parcel, keyed by
+    (num_parcel, parcel_type, seq) where seq disambiguates repeated parcel
+    numbers, so the next --incremental run can diff against it.
+    """
+    con.execute('''CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );''')
+    con.execute('''CREATE TABLE IF NOT EXISTS build_manifest (
+        parcel_id INTEGER PRIMARY KEY,
+        num_parcel TEXT,
+        parcel_type TEXT,
+        seq INTEGER NOT NULL DEFAULT 0,
+        content_hash TEXT NOT NULL
+    );''')
+
+
+def create_indices(cur):
     # Create indices after inserting data for better performance
     print("Creating indices for faster searches...")
     cur.execute('CREATE INDEX idx_num_parcel ON parcels(num_parcel);')
     cur.execute('CREATE INDEX idx_village ON parcels(village);')
     cur.execute('CREATE INDEX idx_parcel_type ON parcels(parcel_type);')
+
+
+def canonicalize_chunk(items, parcel_type, where, geometry_format='json'):
+    """Worker entry point: decode (if needed), canonicalize and serialize one chunk.
+
+    Items are either raw GeoJSONL lines or already-decoded feature dicts.
+    Returns the insert rows, their content hashes, the seconds spent per
+    stage ({'decode', 'canonicalize', 'serialize', 'hash'}) and key plan
+    cache (hits, misses) for the per-stage report.
+    """
+    t0 = time.perf_counter()
+    hits0, misses0 = key_plan_cache_counts()
+    features = []
+    for item in items:
+        if isinstance(item, str):
+            features.extend(decode_geojsonl_line(item, where))
+        else:
+            features.append(item)
+    t1 = time.perf_counter()
+    timings = {'serialize': 0.0}
+    rows = process_batch(features, parcel_type, geometry_format, timings)
+    t2 = time.perf_counter()
+    hashes = [row_content_hash(row) for row in rows]
+    timings.update(decode=t1 - t0, canonicalize=t2 - t1 - timings['serialize'], hash=time.perf_counter() - t2)
+    hits, misses = key_plan_cache_counts()
+    return rows, hashes, timings, (hits - hits0, misses - misses0)
+
+
+def row_content_hash(row):
+    """Stable hash of one canonicalized parcel row (all stored columns)."""
+    h = hashlib.blake2b(digest_size=16)
+    for value in row:
+        if value is None:
+            h.update(b'\x00N')
+        elif isinstance(value, bytes):
+            h.update(b'\x00B')
+            h.update(value)
+        else:
+            h.update(b'\x00S')
+            h.update(str(value).encode('utf-8'))
+    return h.hexdigest()
+
+
+class ParcelWriter:
+    """Single writer for a freshly created database: inserts every row in input order."""
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.next_id = 1
+        self.seq = {}
+        self.inserted = 0
+
+    def key_for(self, row):
+        """Manifest key (num_parcel, parcel_type, seq) for the next occurrence of this row."""
+        base = (row[0], row[1])
+        seq = self.seq.get(base, 0)
+        self.seq[base] = seq + 1
+        return base + (seq,)
+
+    def write(self, rows, hashes):
+        self.insert(rows, [self.key_for(row) for row in rows], hashes)
+
+    def insert(self, rows, keys, hashes):
+        """Append rows with consecutive ids and record them in the manifest."""
+        ids = range(self.next_id, self.next_id + len(rows))
+        self.next_id += len(rows)
+        self.cur.executemany(INSERT_SQL, [(pid,) + row for pid, row in zip(ids, rows)])
+        self.cur.executemany(
+            'INSERT INTO build_manifest (parcel_id, num_parcel, parcel_type, seq, content_hash) VALUES (?, ?, ?, ?, ?)',
+            [(pid,) + key + (digest,) for pid, key, digest in zip(ids, keys, hashes)])
+        self.inserted += len(rows)
+        return ids
+
+    def finish(self):
+        return {'inserted': self.inserted, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+
+
+class IncrementalWriter(ParcelWriter):
+    """Writer that diffs incoming rows against build_manifest of an existing database.
+
+    Unchanged rows are not touched at all; changed rows are updated in place
+    (keeping their id), new rows are appended and rows whose key disappeared
+    from the input are deleted in finish(). changed_ids / deleted_ids are kept
+    so later build stages can refresh only what moved.
+    """
+
+    def __init__(self, cur):
+        super().__init__(cur)
+        self.previous = {}
+        for pid, num, ptype, seq, digest in cur.execute('SELECT parcel_id, num_parcel, parcel_type, seq, content_hash FROM build_manifest'):
+            self.previous[(num, ptype, seq)] = (pid, digest)
+        self.next_id = (cur.execute('SELECT MAX(id) FROM parcels').fetchone()[0] or 0) + 1
+        self.changed_ids = []
+        self.deleted_ids = []
+        self.updated = 0
+        self.unchanged = 0
+
+    def write(self, rows, hashes):
+        new_rows, new_keys, new_hashes = [], [], []
+        updates, manifest_updates = [], []
+        for row, digest in zip(rows, hashes):
+            key = self.key_for(row)
+            old = self.previous.pop(key, None)
+            if old is None:
+                new_rows.append(row)
+                new_keys.append(key)
+                new_hashes.append(digest)
+            elif old[1] != digest:
+                updates.append(row + (old[0],))
+                manifest_updates.append((digest, old[0]))
+                self.changed_ids.append(old[0])
+            else:
+                self.unchanged += 1
+        if updates:
+            self.cur.executemany(UPDATE_SQL, updates)
+            self.cur.executemany('UPDATE build_manifest SET content_hash = ? WHERE parcel_id = ?', manifest_updates)
+            self.updated += len(updates)
+        if new_rows:
+            self.changed_ids.extend(self.insert(new_rows, new_keys, new_hashes))
+
+    def finish(self):
+        # Anything left in the previous manifest no longer exists in the input
+        self.deleted_ids = [pid for pid, _digest in self.previous.values()]
+        if self.deleted_ids:
+            self.cur.executemany('DELETE FROM parcels WHERE id = ?', [(pid,) for pid in self.deleted_ids])
+            self.cur.executemany('DELETE FROM build_manifest WHERE parcel_id = ?', [(pid,) for pid in self.deleted_ids])
+        return {'inserted': self.inserted, 'updated': self.updated,
+                'deleted': len(self.deleted_ids), 'unchanged': self.unchanged}
+
+
+def default_workers():
+    return max(1, os.cpu_count() or 1)
+
+
+def run_pipeline(writer, layers, workers=None, chunk_size=STREAM_CHUNK_SIZE, stats=None, geometry_format='json'):
+    """Canonicalize layers on a process pool and insert them with a single ordered writer.
+
+    `layers` is a list of (items, parcel_type, name). Chunks are submitted in
+    input order and written back in the same order, so row ids are
+    deterministic. At most 2 * workers chunks are in flight, which bounds
+    memory and applies backpressure to the reader. `writer` is a ParcelWriter
+    (or IncrementalWriter); the caller owns the transaction (the sqlite3
+    module keeps all writes in one implicit transaction until commit()).
+    """
+    workers = workers or default_workers()
+    stats = stats or StageStats()
+    counts = {}
+
+    def write(parcel_type, rows, hashes, timings, plan_counts):
+        for stage in ('decode', 'canonicalize', 'serialize', 'hash'):
+            stats.add(stage, len(rows), timings[stage])
+        stats.plan_hits += plan_counts[0]
+        stats.plan_misses += plan_counts[1]
+        t0 = time.perf_counter()
+        writer.write(rows, hashes)
+        stats.add('write', len(rows), time.perf_counter() - t0)
+        counts[parcel_type] = counts.get(parcel_type, 0) + len(rows)
+
+    def read_chunks(items):
+        it = chunked(items, chunk_size)
+        while True:
+            t0 = time.perf_counter()
+            chunk = next(it, None)
+            if chunk is None:
+                return
+            stats.add('read', len(chunk), time.perf_counter() - t0)
+            yield chunk
+
+    if workers <= 1:
+        # In-process path: no pickling overhead, useful for small inputs and debugging
+        for items, parcel_type, name in layers:
+            print(f"Processing {parcel_type} parcels from {name}...")
+            for chunk in read_chunks(items):
+                write(parcel_type, *canonicalize_chunk(chunk, parcel_type, name, geometry_format))
+        stats.snapshot('pipeline')
+        return counts, stats
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for items, parcel_type, name in layers:
+            print(f"Processing {parcel_type} parcels from {name} on {workers} workers...")
+            pending = deque()
+            for chunk in read_chunks(items):
+                pending.append(pool.submit(canonicalize_chunk, chunk, parcel_type, name, geometry_format))
+                if len(pending) >= max_in_flight:
+                    write(parcel_type, *pending.popleft().result())
+            while pending:
+                write(parcel_type, *pending.popleft().result())
+            print(f"Processed {counts.get(parcel_type, 0)} {parcel_type} records")
+    stats.snapshot('pipeline')
+    return counts, stats
+
+
+def load_features(path, name):
+    """Load a whole layer into memory (legacy, non-streaming path)."""
+    if Path(path).suffix.lower() in ('.geojsonl', '.jsonl', '.ndjson'):
+        return list(iter_geojsonl(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        return normalize_geojson(json.load(f), name)
+
+
+def normalize_geojson(obj, name):
+    """Accept either a list of features or a GeoJSON FeatureCollection object.
+    Return a list of feature objects. Raise ValueError with a helpful message
+    if input doesn't match expected shapes.
+    """
+    if obj is None:
+        return []
+    if isinstance(obj, list):
+        return obj
+    if isinstance(obj, dict):
+        # Common GeoJSON shape: { "type": "FeatureCollection", "features": [ ... ] }
+        if 'features' in obj and isinstance(obj['features'], list):
+            return obj['features']
+        # Sometimes users will put a single feature under 'feature'
+        if 'feature' in obj and isinstance(obj['feature'], list):
+            return obj['feature']
+    # If we get here, the structure is unexpected. Give a clear error.
+    raise ValueError(f"Unexpected JSON shape for {name}: expected a list or FeatureCollection with 'features' array")
+
+
+def report_geom_flags(con):
+    """Print how many stored geometries were rewritten or rejected by normalize_geometry."""
+    names = ((GEOM_FLAG_SWAPPED, 'lat/lon swapped'), (GEOM_FLAG_3D, '3D cut to 2D'),
+             (GEOM_FLAG_OUT_OF_RANGE, 'outside Senegal'), (GEOM_FLAG_INVALID, 'invalid'))
+    counts = {label: 0 for _, label in names}
+    for flags, n in con.execute('SELECT geom_flags, COUNT(*) FROM parcels WHERE geom_flags != 0 GROUP BY geom_flags'):
+        for bit, label in names:
+            if flags & bit:
+                counts[label] += n
+    print('Geometry normalization: ' + ', '.join(f'{label} {n}' for label, n in counts.items()))
+
+
+def has_build_manifest(out):
+    """True if `out` was produced by this generator (build_manifest present) with
+    the current parcels columns, i.e. it can be updated incrementally."""
+    if not out.exists():
+        return False
+    con = sqlite3.connect(str(out))
+    try:
+        if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'build_manifest'").fetchone() is None:
+            return False
+        # A split DB (table_layout) is checked through its parcels_wide view
+        table = COMPAT_VIEW if is_split(con) else 'parcels'
+        columns = {r[1] for r in con.execute(f'PRAGMA table_info({table})')}
+        return set(PARCEL_COLUMNS) <= columns
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        con.close()
+
+
+def dataset_digest(con):
+    """Digest of the whole dataset, independent of row ids (and thus of build mode)."""
+    h = hashlib.blake2b(digest_size=16)
+    for (digest,) in con.execute('SELECT content_hash FROM build_manifest ORDER BY parcel_type, num_parcel, seq'):
+        h.update(digest.encode('ascii'))
+    return h.hexdigest()
+
+
+def write_build_meta(con, meta_path):
+    """Record counts and version in the meta table and in the sidecar meta.json read by the app.
+
+    The version only changes when the dataset digest does, so rebuilding
+    identical data does not force every device to re-import parcels.
+    Counts come from parcel_stats (dataset_stats), which must be built first;
+    meta.json also lists the number of distinct values per stats dimension
+    and rows / bytes / checksum per table.
+    """
+    counts = parcel_counts(con)
+    digest = dataset_digest(con)
+
+    previous = {}
+    if meta_path.exists():
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = {}
+    if previous.get('digest') == digest and previous.get('version'):
+        version = previous['version']
+        generated_at = previous.get('generatedAt', version)
+    else:
+        generated_at = date.today().isoformat()
+        version = f'{generated_at}-{digest[:8]}'
+
+    distinct = {dimension: len(dimension_counts(con, dimension)) for dimension in STAT_DIMENSIONS}
+    meta = {'version': version, 'generatedAt': generated_at, 'digest': digest, 'counts': counts,
+            'distinct': distinct, 'tables': table_summaries(con)}
+    con.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', [
+        ('version', version),
+        ('generated_at', generated_at),
+        ('dataset_digest', digest),
+        ('count_total', str(counts['total'])),
+        ('count_individuel', str(counts['individuel'])),
+        ('count_collectif', str(counts['collectif'])),
+    ])
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+        f.write('\n')
+    return meta
+
+
+def update_meta_sizes(meta, meta_path, sizes):
+    """Rewrite meta.json with the per-table byte sizes of the finalized file."""
+    if sizes is None:
+        return
+    for name, entry in meta.get('tables', {}).items():
+        entry['bytes'] = sizes.get(name)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+        f.write('\n')
+
+
+def create_optimized_db(stream=False, individuels=None, collectives=None, out=None,
+                        chunk_size=STREAM_CHUNK_SIZE, copy_assets=True, workers=None,
+                        incremental=False, geometry_format='json', finalize=True, page_size=DEFAULT_PAGE_SIZE,
+                        promote_spec=None, properties_format='json', layout='wide', lod_tolerances=None,
+                        profile=False, trace_memory=False, pack_level=None, packs_dir=None, zstd_level=None):
+    """Main function to create the optimized database"""
+    print("Starting optimized DB generation...")
+    start_time = time.time()
+    workers = workers or default_workers()
+    # Per-stage timings / statements / memory, written next to the DB as <stem>.build.json (build_report)
+    stats = StageStats(trace_memory=trace_memory)
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
     
-    # Commit changes and close connection
+    # Define paths
+    root = Path(__file__).resolve().parents[1]
+    out_dir = root / 'prebuilt'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out = Path(out) if out else out_dir / 'parcelapp.db'
+    ind_path = Path(individuels) if individuels else resolve_source(root, 'Parcels_individuels.json', 'Parcels_Individuels.geojsonl')
+    col_path = Path(collectives) if collectives else resolve_source(root, 'Parcels_collectives.json', 'Parcels_Collectives.geojsonl')
+
+    if stream:
+        print(f"Streaming {ind_path.name} and {col_path.name} in chunks of {chunk_size}...")
+        layers = [
+            (iter_source_items(ind_path), 'individuel', ind_path.name),
+            (iter_source_items(col_path), 'collectif', col_path.name),
+        ]
+    else:
+        # Load JSON data with progress
+        print("Loading JSON data...")
+        json_start = time.time()
+        # Normalize shapes into lists of features
+        try:
+            individus = load_features(ind_path, 'Parcels_individuels.json')
+            collectifs = load_features(col_path, 'Parcels_collectives.json')
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            print("Aborting DB generation. Please ensure the JSON files are either arrays of features or a FeatureCollection with a 'features' array.")
+            return
+        print(f"JSON loading complete in {time.time() - json_start:.2f}s")
+        stats.add('load', len(individus) + len(collectifs), time.time() - json_start)
+        print(f"Processing {len(individus)} individual parcels and {len(collectifs)} collective parcels ({len(individus) + len(collectifs)} total)...")
+        layers = [
+            (individus, 'individuel', ind_path.name),
+            (collectifs, 'collectif', col_path.name),
+        ]
+
+    if incremental and not has_build_manifest(out):
+        print(f"No compatible build manifest found in {out}; doing a full build instead of an incremental one")
+        incremental = False
+
+    if incremental:
+        print(f"Incremental update of {out}...")
+        con = sqlite3.connect(str(out))
+        tune_connection(con)
+        create_build_tables(con)
+        # A split DB is merged back so the writer and the stages see the wide table
+        wide_order = merge_parcels(con)
+        cur = con.cursor()
+        writer = IncrementalWriter(cur)
+    else:
+        con = open_output_db(out, page_size if page_size != 'auto' else DEFAULT_PAGE_SIZE)
+        wide_order = None
+        cur = con.cursor()
+        writer = ParcelWriter(cur)
+    stats.watch(con)
+    try:
+        counts, stats = run_pipeline(writer, layers, workers=workers, chunk_size=chunk_size, stats=stats,
+                                     geometry_format=geometry_format)
+        summary = writer.finish()
+    except (ValueError, json.JSONDecodeError) as e:
+        con.rollback()
+        con.close()
+        if not incremental:
+            out.unlink()
+        print(f"ERROR: {e}")
+        print("Aborting DB generation. Please ensure the inputs are GeoJSONL, arrays of features or a FeatureCollection with a 'features' array.")
+        return
+    total_records = sum(counts.values())
+    report_geom_flags(con)
+    print(f"Rows inserted: {summary['inserted']}, updated: {summary['updated']}, "
+          f"deleted: {summary['deleted']}, unchanged: {summary['unchanged']}")
+
+    # Hot property keys (commune, department, survey date...) as typed, indexed columns
+    promote_start = time.perf_counter()
+    promoted_rows, promoted = write_promoted_columns(con, writer.changed_ids if incremental else None,
+                                                     promote_spec or PROMOTED_COLUMNS)
+    report_promoted_columns(promoted, promoted_rows)
+    stats.add('promote', promoted_rows, time.perf_counter() - promote_start)
+
+    # num_parcel decoded into region / department / commune / sequence (parcel_numbers)
+    numbers_start = time.perf_counter()
+    number_rows = write_parcel_numbers(con, writer.changed_ids if incremental else None)
+    build_prefix_stats(con)
+    stats.add('numbers', number_rows, time.perf_counter() - numbers_start)
+
+    index_start = time.perf_counter()
+    if not incremental:
+        # Incremental runs keep the existing indexes, which SQLite maintains row by row
+        create_indices(cur)
+        stats.add('index', total_records, time.perf_counter() - index_start)
+
+    # Spatial index from the inline bbox columns (only touched rows when incremental)
+    rtree_start = time.perf_counter()
+    if incremental:
+        rtree_rows = populate_rtree(con, writer.changed_ids, writer.deleted_ids)
+    else:
+        rtree_rows = populate_rtree(con)
+    stats.add('rtree', rtree_rows, time.perf_counter() - rtree_start)
+
+    # Area-weighted centroid, area and perimeter in one vectorized pass (geometry_metrics)
+    if write_metrics is None:
+        print("numpy is not installed; skipping centroid/area/perimeter columns")
+    else:
+        metrics_start = time.perf_counter()
+        metric_rows = write_metrics(con, writer.changed_ids if incremental else None)
+        stats.add('metrics', metric_rows, time.perf_counter() - metrics_start)
+
+    # Simplified geometries per level of detail (geometry_lod). Shared edges are
+    # simplified across parcels, so like the neighbor graph it is rebuilt whole.
+    if lod_tolerances or (incremental and write_lods is not None and has_lod_table(con)):
+        if write_lods is None:
+            print("numpy is not installed; skipping parcel_geometry_lod")
+        elif lod_tolerances or writer.changed_ids or writer.deleted_ids:
+            lod_start = time.perf_counter()
+            lod_rows, lod_report, full_vertices = write_lods(con, lod_tolerances or stored_tolerances(con), workers)
+            print_lod_report(lod_report, full_vertices)
+            stats.add('lod', lod_rows, time.perf_counter() - lod_start)
+
+    # Neighbor graph (touching + K nearest parcels). It is global, so incremental
+    # runs rebuild it whenever any row changed.
+    if not incremental or writer.changed_ids or writer.deleted_ids:
+        neighbors_start = time.perf_counter()
+        neighbor_rows = build_neighbor_graph(con)
+        stats.add('neighbors', neighbor_rows, time.perf_counter() - neighbors_start)
+
+    # Full-text search index over owner / mandataire / denomination / village fields
+    fts_start = time.perf_counter()
+    if incremental:
+        fts_rows = build_search_index(con, writer.changed_ids, writer.deleted_ids)
+    else:
+        fts_rows = build_search_index(con)
+    stats.add('fts', fts_rows, time.perf_counter() - fts_start)
+
+    # Materialized counts per type / department / commune / village / survey date / topographe
+    stats_start = time.perf_counter()
+    stats_rows = build_parcel_stats(con)
+    stats.add('stats', stats_rows, time.perf_counter() - stats_start)
+
+    # Shared key dictionary for properties (property_codec). Runs after every stage
+    # that reads the JSON text; incremental runs keep an existing encoding in sync.
+    if properties_format != 'json' or has_compact_properties(con):
+        codec_start = time.perf_counter()
+        codec_rows = write_compact_properties(con, writer.changed_ids if incremental else None,
+                                              keep_json=properties_format != 'compact')
+        stats.add('properties', codec_rows, time.perf_counter() - codec_start)
+        print(f"Encoded properties of {codec_rows} parcels ({len(load_schemas(con))} key schemas)")
+
+    # Slim parcels table + geometry / properties side tables and the parcels_wide view (table_layout)
+    if layout == 'split':
+        split_start = time.perf_counter()
+        split_rows = split_parcels(con, wide_order)
+        stats.add('split', split_rows, time.perf_counter() - split_start)
+        print(f"Split parcels into scalar columns + {', '.join(SIDE_TABLES)} (view parcels_wide)")
+
+    meta_path = out.with_name(out.stem + '.meta.json')
+    meta_start = time.perf_counter()
+    meta = write_build_meta(con, meta_path)
+    stats.add('meta', total_records, time.perf_counter() - meta_start)
+    print(f"Dataset version {meta['version']} ({meta['counts']['total']} parcels)")
+    
+    # Commit changes and close connection (the cursor first: a statement it left
+    # unfinished would keep the connection, and its exclusive lock, alive)
+    commit_start = time.perf_counter()
     con.commit()
+    stats.add('commit', total_records, time.perf_counter() - commit_start)
+    cur.close()
     con.close()
+
+    # ANALYZE + VACUUM INTO (compact, key-ordered pages) + integrity check, then
+    # refresh the per-table sizes recorded in meta.json
+    if finalize:
+        finalize_start = time.perf_counter()
+        try:
+            result = finalize_db(out, page_size)
+        except IntegrityError as e:
+            print(f"ERROR: integrity check failed on the finalized copy, keeping the unfinalized DB: {e}")
+        else:
+            stats.add('finalize', total_records, time.perf_counter() - finalize_start)
+            print(f"Finalized {out.name} (page_size {result['page_size']}): "
+                  f"{result['bytes_before']} -> {result['bytes_after']} bytes")
+            con = sqlite3.connect(f'file:{out.as_posix()}?mode=ro', uri=True)
+            update_meta_sizes(meta, meta_path, table_sizes(con))
+            print_size_breakdown(con, limit=15)
+            con.close()
+
+    # One self-contained DB per commune / arrondissement plus catalog.db (shard_packs)
+    if pack_level:
+        packs_start = time.perf_counter()
+        pack_summary = build_packs(out, packs_dir, pack_level, workers, finalize, page_size)
+        stats.add('packs', pack_summary['parcels'], time.perf_counter() - packs_start)
+        print_pack_summary(pack_summary)
     
     # Print final statistics
     end_time = time.time()
@@ -245,19 +989,107 @@ def create_optimized_db():
     print(f'Database generation complete in {total_time:.2f}s')
     print(f'Average processing speed: {total_records / total_time:.2f} records/second')
     print(f'Wrote prebuilt DB to {out}')
-    
-    # Copy the database to the android assets folder
-    print("Copying database to Android assets...")
-    android_assets = root / 'android' / 'app' / 'src' / 'main' / 'assets'
-    android_assets.mkdir(exist_ok=True, parents=True)
-    android_db_path = android_assets / 'parcelapp.db'
-    
-    # Use buffer for faster copy
-    with open(out, 'rb') as src, open(android_db_path, 'wb') as dst:
-        dst.write(src.read())
-    
-    print(f"Database copied to Android assets: {android_db_path}")
-    print(f"Total optimization complete in {time.time() - start_time:.2f}s")
-    
+
+    if copy_assets:
+        # Streamed, hashed copy into the android assets folder; an identical
+        # asset is left untouched (deploy_assets)
+        print("Deploying database to Android assets...")
+        assets_start = time.perf_counter()
+        deployed = deploy_db(out, root / ASSETS_DIR, 'parcelapp.db', zstd_level)
+        stats.add('assets', total_records, time.perf_counter() - assets_start)
+        print_deploy_summary(deployed)
+        print(f"Total optimization complete in {time.time() - start_time:.2f}s")
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(report_path(out, '.build.prof'))
+        print(f"Wrote cProfile stats of the main process to {report_path(out, '.build.prof')} "
+              f"(python -m pstats)")
+    stats.report(workers)
+    build_report = report_path(out)
+    write_build_report(build_report, stats, workers, out=str(out), inputs=[str(ind_path), str(col_path)],
+                       options={'stream': stream, 'incremental': incremental, 'chunk_size': chunk_size,
+                                'geometry': geometry_format, 'properties': properties_format, 'layout': layout,
+                                'lod': list(lod_tolerances) if lod_tolerances else None, 'finalize': finalize,
+                                'page_size': page_size, 'packs': pack_level, 'assets': copy_assets,
+                                'assets_zstd': zstd_level},
+                       records=total_records, rows=summary, db_bytes=out.stat().st_size,
+                       sqlite_version=sqlite3.sqlite_version, python_version=sys.version.split()[0])
+    print(f"Wrote build report to {build_report}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the prebuilt parcelapp.db bundled with the app.')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream features from GeoJSONL / FeatureCollection inputs in fixed-size chunks (bounded memory)')
+    parser.add_argument('--chunk-size', type=int, default=STREAM_CHUNK_SIZE,
+                        help=f'features per worker chunk and insert batch (default {STREAM_CHUNK_SIZE})')
+    parser.add_argument('--individuels', help='individual parcels input (.json FeatureCollection or .geojsonl)')
+    parser.add_argument('--collectives', help='collective parcels input (.json FeatureCollection or .geojsonl)')
+    parser.add_argument('--out', help='output database path (default prebuilt/parcelapp.db)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='canonicalization worker processes (default: CPU count; 1 runs in-process)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='diff against the build manifest of the existing output DB and only apply inserts/updates/deletes')
+    parser.add_argument('--geometry', choices=GEOMETRY_FORMATS, default='json',
+                        help="geometry storage: 'json' text (default, what the app reads), 'both' adds the compact "
+                             "geometry_bin column, 'compact' stores geometry_bin only (not for the app bundle)")
+    parser.add_argument('--properties', choices=PROPERTIES_FORMATS, default='json',
+                        help="properties storage: 'json' text (default, what the app reads), 'both' adds the "
+                             "property_schemas key dictionary and properties_values, 'compact' drops the JSON text "
+                             "(not for the app bundle)")
+    parser.add_argument('--layout', choices=LAYOUTS, default='wide',
+                        help="'wide' parcels table (default, what the app reads) or 'split' into scalar parcels + "
+                             "parcel_geometry / parcel_properties side tables with a parcels_wide compatibility view")
+    parser.add_argument('--lod', nargs='?', const='default', metavar='TOLERANCES',
+                        help='build parcel_geometry_lod: simplified geometries at comma-separated Douglas-Peucker '
+                             'tolerances in meters (default 0.5,2,10); needs numpy')
+    parser.add_argument('--no-assets', action='store_true', help='do not copy the database into android assets')
+    parser.add_argument('--assets-zstd', nargs='?', type=int, const=DEFAULT_ZSTD_LEVEL, metavar='LEVEL',
+                        help=f'also deploy a zstd-compressed copy of the DB (default level {DEFAULT_ZSTD_LEVEL}); '
+                             'needs zstandard')
+    parser.add_argument('--no-finalize', action='store_true',
+                        help='skip ANALYZE / VACUUM INTO / integrity check (faster local builds)')
+    parser.add_argument('--page-size', default=str(DEFAULT_PAGE_SIZE),
+                        help=f"page size of the finalized DB (default {DEFAULT_PAGE_SIZE}), or 'auto' to keep the smallest file")
+    parser.add_argument('--promote-config',
+                        help='JSON list of property keys to promote into typed columns (default: promoted_columns.PROMOTED_COLUMNS)')
+    parser.add_argument('--packs', choices=PACK_LEVELS, metavar='LEVEL',
+                        help=f"also write one pack DB per {' / '.join(PACK_LEVELS)} and a catalog.db (shard_packs)")
+    parser.add_argument('--packs-dir', help='pack directory (default: packs/ next to the output DB)')
+    parser.add_argument('--profile', action='store_true',
+                        help='write a cProfile dump of the main process next to the DB (<name>.build.prof)')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='record tracemalloc peaks and top allocation sites per stage in the build report (slower)')
+    args = parser.parse_args(argv)
+    # The app reads the geometry / properties JSON text of a wide parcels table
+    not_for_app = [f'--{name} {value}' for name, value in (('geometry', args.geometry), ('properties', args.properties),
+                                                          ('layout', args.layout)) if value in ('compact', 'split')]
+    if not_for_app and not args.out:
+        parser.error(f"{', '.join(not_for_app)} builds a DB the app cannot read; "
+                     "pass --out instead of overwriting the bundled prebuilt/parcelapp.db")
+    if not_for_app and not args.no_assets:
+        print(f"{', '.join(not_for_app)}: the app cannot read this DB, not deploying it to the Android assets")
+        args.no_assets = True
+    page_size = args.page_size if args.page_size == 'auto' else int(args.page_size)
+    promote_spec = load_config(args.promote_config) if args.promote_config else None
+    if args.assets_zstd is not None and zstandard is None:
+        print("zstandard is not installed; --assets-zstd is ignored")
+        args.assets_zstd = None
+    lod_tolerances = None
+    if args.lod and write_lods is None:
+        print("numpy is not installed; --lod is ignored")
+    elif args.lod:
+        lod_tolerances = LOD_TOLERANCES_M if args.lod == 'default' else parse_tolerances(args.lod)
+    create_optimized_db(stream=args.stream, individuels=args.individuels, collectives=args.collectives,
+                        out=args.out, chunk_size=args.chunk_size, copy_assets=not args.no_assets,
+                        workers=args.workers, incremental=args.incremental, geometry_format=args.geometry,
+                        finalize=not args.no_finalize, page_size=page_size, promote_spec=promote_spec,
+                        properties_format=args.properties, layout=args.layout, lod_tolerances=lod_tolerances,
+                        profile=args.profile, trace_memory=args.trace_memory, pack_level=args.packs,
+                        packs_dir=args.packs_dir, zstd_level=args.assets_zstd)
+
+
 if __name__ == "__main__":
-    create_optimized_db()
+    main()
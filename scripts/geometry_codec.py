@@ -0,0 +1,339 @@
+"""
+Compact binary encoding for parcel geometries (TWKB-like).
+
+Coordinates are quantized to integers (1e-7 degree by default, which is
+lossless for the 7-decimal Kobo/QGIS exports), the first coordinate is stored
+absolutely and the following ones as per-axis deltas, packed as int16 when
+every delta fits and int32 otherwise. Ring/part structure is kept as a small
+uint32 count list, so decoding is one struct.unpack_from (with a cached Struct
+per blob shape), itertools.accumulate and a few slices.
+
+Building dicts, json.loads (C) is still a little faster than decode_geometry
+for the few-vertex cadastre polygons (see bench), so load_geometry() reads
+the JSON text when the row has it and only decodes the blob for rows stored
+compact-only. The blob pays off in the numpy consumers: geometry_metrics'
+GeometryArrays.from_rows (metrics, geometry_lod) takes unpack_geometry()'s
+quantized integers straight into coordinate arrays, without per-vertex
+Python objects.
+
+generate_prebuilt_db.py --geometry both|compact fills parcels.geometry_bin,
+encoding with exact=True: a geometry whose blob does not decode back to the
+same dict (more than 7 decimals, extra members) keeps its JSON text only, so
+the round trip that verify reports on a whole file is checked row by row at
+build time.
+
+Layout (little-endian):
+    <BBBBI        geometry type code, xy precision, z precision (255 = 2D),
+                  delta width (2 or 4), number of structure counts (n)
+    n * uint32    structure counts (see _structure)
+    dims * int32  first coordinate (absent when the geometry is empty)
+    deltas        (points - 1) deltas for x, then for y, then for z; int16 or int32
+
+Usage:
+    python scripts/geometry_codec.py verify <parcelapp.db | file.geojsonl>
+    python scripts/geometry_codec.py bench <parcelapp.db | file.geojsonl>
+"""
+
+import json
+import struct
+import sys
+import time
+from functools import lru_cache
+from itertools import accumulate
+from pathlib import Path
+
+DEFAULT_PRECISION = 7
+DEFAULT_Z_PRECISION = 3
+NO_Z = 255
+
+GEOMETRY_TYPES = {
+    'Point': 1,
+    'LineString': 2,
+    'Polygon': 3,
+    'MultiPoint': 4,
+    'MultiLineString': 5,
+    'MultiPolygon': 6,
+}
+GEOMETRY_NAMES = {code: name for name, code in GEOMETRY_TYPES.items()}
+
+_HEADER = struct.Struct('<BBBBI')
+_INT16_MIN, _INT16_MAX = -(1 << 15), (1 << 15) - 1
+_DELTA_CODES = {2: 'h', 4: 'i'}
+
+
+@lru_cache(maxsize=4096)
+def _body_struct(n_counts, dim, width, n_deltas):
+    """Struct for everything after the header: counts, first coordinate, deltas."""
+    if not n_deltas and not dim:
+        return struct.Struct(f'<{n_counts}I')
+    return struct.Struct(f'<{n_counts}I{dim}i{n_deltas}{_DELTA_CODES[width]}')
+
+
+def _structure(gtype, coords):
+    """Return (counts, flat list of positions) for a GeoJSON coordinates tree."""
+    if gtype == 'Point':
+        return [1], [coords]
+    if gtype in ('LineString', 'MultiPoint'):
+        return [len(coords)], list(coords)
+    if gtype in ('Polygon', 'MultiLineString'):
+        counts = [len(coords)]
+        points = []
+        for ring in coords:
+            counts.append(len(ring))
+            points.extend(ring)
+        return counts, points
+    # MultiPolygon
+    counts = [len(coords)]
+    points = []
+    for poly in coords:
+        counts.append(len(poly))
+        for ring in poly:
+            counts.append(len(ring))
+            points.extend(ring)
+    return counts, points
+
+
+def encode_geometry(geom, precision=DEFAULT_PRECISION, z_precision=DEFAULT_Z_PRECISION):
+    """Encode a GeoJSON geometry dict; raises ValueError for unsupported input."""
+    if not isinstance(geom, dict) or geom.get('type') not in GEOMETRY_TYPES:
+        raise ValueError(f"unsupported geometry: {geom.get('type') if isinstance(geom, dict) else type(geom).__name__}")
+    gtype = geom['type']
+    coords = geom.get('coordinates')
+    if coords is None:
+        coords = [] if gtype != 'Point' else None
+    if coords is None:
+        raise ValueError('Point without coordinates')
+    counts, points = _structure(gtype, coords)
+
+    dims = {len(p) for p in points}
+    if len(dims) > 1:
+        raise ValueError(f'mixed coordinate dimensions {sorted(dims)}')
+    dim = dims.pop() if dims else 2
+    if dim not in (2, 3):
+        raise ValueError(f'unsupported coordinate dimension {dim}')
+
+    xy_scale = 10 ** precision
+    scales = [xy_scale, xy_scale] + ([10 ** z_precision] if dim == 3 else [])
+    axes = [[round(p[i] * scales[i]) for p in points] for i in range(dim)]
+    deltas = [b - a for axis in axes for a, b in zip(axis, axis[1:])]
+    width = 2 if all(_INT16_MIN <= d <= _INT16_MAX for d in deltas) else 4
+
+    header = _HEADER.pack(GEOMETRY_TYPES[gtype], precision, z_precision if dim == 3 else NO_Z, width, len(counts))
+    if not points:
+        return header + _body_struct(len(counts), 0, width, 0).pack(*counts)
+    body = _body_struct(len(counts), dim, width, len(deltas))
+    return header + body.pack(*counts, *(axis[0] for axis in axes), *deltas)
+
+
+def _split(seq, counts):
+    out = []
+    pos = 0
+    for n in counts:
+        out.append(seq[pos:pos + n])
+        pos += n
+    return out
+
+
+def _position_count(gtype, counts):
+    """Number of positions the structure counts describe; ValueError if they are inconsistent."""
+    if gtype == 'Point':
+        if counts != (1,):
+            raise ValueError(f'bad Point structure {counts}')
+        return 1
+    if gtype in ('LineString', 'MultiPoint'):
+        if len(counts) != 1:
+            raise ValueError(f'bad {gtype} structure {counts}')
+        return counts[0]
+    if gtype in ('Polygon', 'MultiLineString'):
+        if not counts or len(counts) != 1 + counts[0]:
+            raise ValueError(f'bad {gtype} structure {counts}')
+        return sum(counts[1:])
+    # MultiPolygon
+    if not counts:
+        raise ValueError('bad MultiPolygon structure ()')
+    n = 0
+    ci = 1
+    for _ in range(counts[0]):
+        if ci >= len(counts):
+            raise ValueError(f'bad MultiPolygon structure {counts}')
+        n += sum(counts[ci + 1:ci + 1 + counts[ci]])
+        ci += 1 + counts[ci]
+    if ci != len(counts):
+        raise ValueError(f'bad MultiPolygon structure {counts}')
+    return n
+
+
+def unpack_geometry(blob):
+    """Checked fields of a blob produced by encode_geometry, without building coordinates.
+
+    Returns (geometry type, xy precision, z precision or None, dim, counts,
+    values, n): values is the unpacked body (structure counts, first
+    coordinate, then the n - 1 deltas of each axis in turn) and n the number
+    of positions. Raises ValueError unless the blob is exactly as long as its
+    structure counts require.
+    """
+    try:
+        code, precision, z_precision, width, n_counts = _HEADER.unpack_from(blob, 0)
+    except struct.error:
+        raise ValueError(f'geometry blob too short ({len(blob)} bytes)') from None
+    gtype = GEOMETRY_NAMES.get(code)
+    if gtype is None or width not in _DELTA_CODES:
+        raise ValueError(f'bad geometry blob header (type {code}, delta width {width})')
+    dim = 2 if z_precision == NO_Z else 3
+    counts_end = _HEADER.size + 4 * n_counts
+    if len(blob) < counts_end:
+        raise ValueError(f'geometry blob too short ({len(blob)} bytes) for {n_counts} structure counts')
+    counts = _body_struct(n_counts, 0, width, 0).unpack_from(blob, _HEADER.size)
+    n = _position_count(gtype, counts)
+    n_deltas = dim * (n - 1) if n else 0
+    expected = counts_end + (4 * dim + width * n_deltas if n else 0)
+    if len(blob) != expected:
+        raise ValueError(f'geometry blob is {len(blob)} bytes, its {n} positions need {expected}')
+    values = _body_struct(n_counts, dim if n else 0, width, n_deltas).unpack_from(blob, _HEADER.size)
+    return gtype, precision, None if dim == 2 else z_precision, dim, counts, values, n
+
+
+def decode_geometry(blob):
+    """Decode bytes produced by encode_geometry back into a GeoJSON geometry dict (ValueError if malformed)."""
+    gtype, precision, z_precision, dim, counts, values, n = unpack_geometry(blob)
+    n_counts = len(counts)
+    if not n:
+        points = []
+    else:
+        start = n_counts + dim
+        m = n - 1
+        xy = 10 ** precision
+        x = accumulate(values[start:start + m], initial=values[n_counts])
+        y = accumulate(values[start + m:start + 2 * m], initial=values[n_counts + 1])
+        if dim == 2:
+            points = [[a / xy, b / xy] for a, b in zip(x, y)]
+        else:
+            zs = 10 ** z_precision
+            z = accumulate(values[start + 2 * m:], initial=values[n_counts + 2])
+            points = [[a / xy, b / xy, c / zs] for a, b, c in zip(x, y, z)]
+
+    if gtype == 'Point':
+        coords = points[0]
+    elif gtype in ('LineString', 'MultiPoint'):
+        coords = points
+    elif gtype in ('Polygon', 'MultiLineString'):
+        coords = _split(points, counts[1:1 + counts[0]])
+    else:
+        coords = []
+        ci = 1
+        pi = 0
+        for _ in range(counts[0]):
+            nrings = counts[ci]
+            ring_counts = counts[ci + 1:ci + 1 + nrings]
+            ci += 1 + nrings
+            size = sum(ring_counts)
+            coords.append(_split(points[pi:pi + size], ring_counts))
+            pi += size
+    return {'type': gtype, 'coordinates': coords}
+
+
+def try_encode_geometry(geom, precision=DEFAULT_PRECISION, exact=False):
+    """encode_geometry, or None when the geometry cannot be encoded (kept as JSON only).
+
+    With exact=True the blob is decoded again and None is returned unless it
+    reproduces `geom` exactly.
+    """
+    try:
+        blob = encode_geometry(geom, precision)
+    except (ValueError, TypeError, OverflowError, struct.error):
+        return None
+    if exact and decode_geometry(blob) != geom:
+        return None
+    return blob
+
+
+def load_geometry(text=None, blob=None):
+    """Return a geometry dict from the JSON text when present, else from the compact column."""
+    if text:
+        try:
+            return json.loads(text)
+        except ValueError:
+            if blob is None:
+                return None
+    if blob is not None:
+        return decode_geometry(blob)
+    return None
+
+
+def has_compact_geometry(con):
+    """True if the parcels table has the geometry_bin column (filled by --geometry both|compact)."""
+    return any(r[1] == 'geometry_bin' for r in con.execute('PRAGMA table_info(parcels)'))
+
+
+def _max_error(a, b):
+    """Largest absolute coordinate difference between two coordinate trees (inf on shape mismatch)."""
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return abs(a - b)
+    if isinstance(a, list) and isinstance(b, list) and len(a) == len(b):
+        return max((_max_error(x, y) for x, y in zip(a, b)), default=0.0)
+    return float('inf')
+
+
+def _iter_source_geometries(path):
+    path = Path(path)
+    if path.suffix.lower() in ('.geojsonl', '.jsonl', '.ndjson'):
+        with open(path, 'r', encoding='utf-8') as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    yield json.loads(line).get('geometry')
+        return
+    import sqlite3
+    con = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    for (text,) in con.execute('SELECT geometry FROM parcels WHERE geometry IS NOT NULL'):
+        yield json.loads(text)
+    con.close()
+
+
+def verify(path):
+    """Round-trip every geometry of a DB or GeoJSONL file and report exactness."""
+    total = exact = skipped = 0
+    worst = 0.0
+    raw_bytes = packed_bytes = 0
+    for geom in _iter_source_geometries(path):
+        blob = try_encode_geometry(geom)
+        if blob is None:
+            skipped += 1
+            continue
+        total += 1
+        decoded = decode_geometry(blob)
+        err = _max_error(geom['coordinates'], decoded['coordinates']) if decoded['type'] == geom['type'] else float('inf')
+        worst = max(worst, err)
+        exact += err == 0.0
+        raw_bytes += len(json.dumps(geom))
+        packed_bytes += len(blob)
+    print(f'{total} geometries round-tripped, {exact} exact, {skipped} not encodable, max error {worst:g} deg')
+    if total:
+        print(f'JSON {raw_bytes} bytes -> compact {packed_bytes} bytes ({100.0 * packed_bytes / raw_bytes:.1f}%)')
+    return exact == total
+
+
+def bench(path, repeat=5):
+    geoms = [g for g in _iter_source_geometries(path) if try_encode_geometry(g) is not None]
+    texts = [json.dumps(g) for g in geoms]
+    blobs = [encode_geometry(g) for g in geoms]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for t in texts:
+            json.loads(t)
+    t_json = (time.perf_counter() - t0) / repeat
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for b in blobs:
+            decode_geometry(b)
+    t_bin = (time.perf_counter() - t0) / repeat
+    print(f'{len(geoms)} geometries: json.loads {t_json * 1000:.2f} ms, decode_geometry {t_bin * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] not in ('verify', 'bench'):
+        print('Usage: python scripts/geometry_codec.py verify|bench <parcelapp.db | file.geojsonl>', file=sys.stderr)
+        sys.exit(1)
+    if sys.argv[1] == 'verify':
+        sys.exit(0 if verify(sys.argv[2]) else 1)
+    bench(sys.argv[2])
@@ -0,0 +1,419 @@
+"""
+Simplified parcel geometries at several levels of detail (needs numpy).
+
+The map screens draw a parcel and all of its neighbors at full resolution;
+at low zoom most of those vertices are sub-pixel. parcel_geometry_lod holds,
+per parcel and level, the rings simplified with Douglas-Peucker at
+LOD_TOLERANCES_M (meters, on the UTM 28N projection of geometry_metrics):
+    level 1   0.5 m
+    level 2   2 m
+    level 3   10 m
+A level is only stored when it drops vertices compared with the next finer
+one; load_lod_geometry() falls back to the next finer level, then to the full
+geometry. The tolerances are recorded in meta (lod_tolerances_m) so
+--incremental builds rebuild the same levels.
+
+Topology: a vertex shared by several parcels is kept whenever the set of
+parcels sharing it differs from its ring neighbors' (ends of shared edges,
+junctions of three parcels). Each chain between kept vertices is simplified
+on its own with a direction-independent rule (chord taken from the smaller
+vertex key, ties broken on the key), so the two sides of a shared boundary
+keep exactly the same vertices and simplified neighbors neither gap nor
+overlap. Rings keep at least three distinct vertices.
+
+The recursion is vectorized: every pending (start, end) interval of every
+ring is split in the same numpy pass, one pass per recursion depth. Parcels
+are simplified in chunks on a process pool.
+
+Usage:
+    python scripts/geometry_lod.py <db> [--tolerances 0.5,2,10] [--workers N] [--write]
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from geometry_codec import load_geometry
+from geometry_metrics import GeometryArrays, compute_metrics, utm28_forward
+from spatial_index import has_canonical_geometry
+from table_layout import COMPAT_VIEW, is_split
+
+LOD_TABLE = 'parcel_geometry_lod'
+LOD_TOLERANCES_M = (0.5, 2.0, 10.0)
+# Parcels per worker task
+LOD_CHUNK_SIZE = 5000
+
+_KEY_SCALE = 1e7  # vertices are matched at 1e-7 degree, like geometry_codec
+_HASH_MULT = np.uint64(0x9E3779B97F4A7C15)
+
+
+def parse_tolerances(text):
+    """'0.5,2,10' -> (0.5, 2.0, 10.0), increasing."""
+    tolerances = tuple(float(t) for t in text.split(',') if t.strip())
+    if not tolerances or any(t <= 0 for t in tolerances) or list(tolerances) != sorted(set(tolerances)):
+        raise ValueError(f'tolerances must be positive and increasing: {text!r}')
+    return tolerances
+
+
+def create_lod_table(con):
+    con.execute(f'''CREATE TABLE IF NOT EXISTS {LOD_TABLE} (
+        parcel_id INTEGER NOT NULL,
+        level INTEGER NOT NULL,
+        vertex_count INTEGER NOT NULL,
+        max_deviation_m REAL NOT NULL,
+        geometry TEXT NOT NULL,
+        PRIMARY KEY (parcel_id, level)
+    ) WITHOUT ROWID;''')
+
+
+def has_lod_table(con):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (LOD_TABLE,)).fetchone() is not None
+
+
+def stored_tolerances(con):
+    """Tolerances parcel_geometry_lod was built with (meta lod_tolerances_m), or LOD_TOLERANCES_M."""
+    try:
+        row = con.execute("SELECT value FROM meta WHERE key = 'lod_tolerances_m'").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    return parse_tolerances(row[0]) if row and row[0] else LOD_TOLERANCES_M
+
+
+# -- preparation (parent process) ---------------------------------------------
+
+def load_shapes(con):
+    """(GeometryArrays keyed by parcels.id, {id: geometry type}) for every Polygon/MultiPolygon parcel."""
+    columns = {r[1] for r in con.execute(f"PRAGMA table_info({COMPAT_VIEW if is_split(con) else 'parcels'})")}
+    source = COMPAT_VIEW if is_split(con) else 'parcels'
+    blob = 'geometry_bin' if 'geometry_bin' in columns else 'NULL'
+    arrays = GeometryArrays.from_rows(con.execute(f'SELECT id, geometry, {blob} FROM {source} ORDER BY id'))
+    return arrays, arrays.types
+
+
+def open_rings(arrays):
+    """Vertex indexes of `arrays` with each ring's closing duplicate dropped, and the open ring offsets."""
+    starts = arrays.ring_offsets[:-1]
+    ends = arrays.ring_offsets[1:] - 1
+    closed = (ends > starts) & (arrays.x[starts] == arrays.x[ends]) & (arrays.y[starts] == arrays.y[ends])
+    keep = np.ones(len(arrays.x), dtype=bool)
+    keep[ends[closed]] = False
+    sizes = np.diff(arrays.ring_offsets) - closed
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    return np.flatnonzero(keep), offsets
+
+
+def _ring_neighbors(offsets):
+    """Previous / next vertex index within each cyclic ring."""
+    n = offsets[-1]
+    prev = np.arange(-1, n - 1)
+    nxt = np.arange(1, n + 1)
+    starts, ends = offsets[:-1], offsets[1:]
+    nonempty = ends > starts
+    prev[starts[nonempty]] = ends[nonempty] - 1
+    nxt[ends[nonempty] - 1] = starts[nonempty]
+    return prev, nxt
+
+
+def vertex_keys(x, y):
+    """One uint64 per vertex from its coordinates quantized to 1e-7 degree (orders like (x, y))."""
+    kx = (np.round(x * _KEY_SCALE).astype(np.int64) + (1 << 31)).astype(np.uint64)
+    ky = (np.round(y * _KEY_SCALE).astype(np.int64) + (1 << 31)).astype(np.uint64)
+    return (kx << np.uint64(32)) | (ky & np.uint64(0xFFFFFFFF))
+
+
+def shared_vertex_pins(keys, vertex_geom, offsets):
+    """True for vertices shared by 2+ parcels whose sharing set differs from a ring neighbor's."""
+    order = np.lexsort((vertex_geom, keys))
+    k, g = keys[order], vertex_geom[order]
+    new_pair = np.ones(len(k), dtype=bool)
+    new_pair[1:] = (k[1:] != k[:-1]) | (g[1:] != g[:-1])
+    pair_keys, pair_geoms = k[new_pair], g[new_pair]
+    key_start = np.flatnonzero(np.r_[True, pair_keys[1:] != pair_keys[:-1]])
+    uniq = pair_keys[key_start]
+    share = np.diff(np.append(key_start, len(pair_keys)))
+    # Order-independent signature of the set of parcels sharing each vertex
+    signature = np.add.reduceat((pair_geoms.astype(np.uint64) + np.uint64(1)) * _HASH_MULT, key_start)
+    where = np.searchsorted(uniq, keys)
+    v_share, v_sig = share[where], signature[where]
+    prev, nxt = _ring_neighbors(offsets)
+    return (v_share >= 2) & ((v_sig != v_sig[prev]) | (v_sig != v_sig[nxt]))
+
+
+# -- simplification (worker processes) -----------------------------------------
+
+def _segment_distance(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = np.where(length2 > 0, ((px - ax) * dx + (py - ay) * dy) / np.where(length2 > 0, length2, 1.0), 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def _group_ranges(starts, lengths):
+    """Concatenated ranges starts[i] .. starts[i] + lengths[i] - 1, and their group index."""
+    total = int(lengths.sum())
+    group = np.repeat(np.arange(len(starts)), lengths)
+    within = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + within, group
+
+
+def douglas_peucker(x, y, keys, anchors, ring_of, tolerance):
+    """Keep mask for closed, rotated rings (first == last position) given anchor positions.
+
+    Every interval between consecutive anchors of a ring is simplified
+    independently of its direction.
+    """
+    keep = anchors.copy()
+    pos = np.flatnonzero(anchors)
+    same = ring_of[pos[:-1]] == ring_of[pos[1:]]
+    s, e = pos[:-1][same], pos[1:][same]
+    while len(s):
+        lengths = e - s - 1
+        inner = lengths > 0
+        s, e, lengths = s[inner], e[inner], lengths[inner]
+        if not len(s):
+            break
+        p, group = _group_ranges(s + 1, lengths)
+        # Chord from the endpoint with the smaller key, so both sides of a shared edge compute the same
+        flip = keys[e] < keys[s]
+        a, b = np.where(flip, e, s), np.where(flip, s, e)
+        d = _segment_distance(x[p], y[p], x[a][group], y[a][group], x[b][group], y[b][group])
+        order = np.lexsort((keys[p], -d, group))
+        first = order[np.r_[0, np.flatnonzero(np.diff(group[order])) + 1]]
+        split = d[first] > tolerance
+        mid = p[first][split]
+        keep[mid] = True
+        s, e = np.concatenate([s[split], mid]), np.concatenate([mid, e[split]])
+    return keep
+
+
+def _ensure_three(x, y, keep, ring_starts, ring_ends):
+    """Add the vertex farthest from the kept ones to rings left with fewer than three distinct kept vertices."""
+    kept = np.add.reduceat(keep, ring_starts) - 1  # the closing position repeats the first
+    for r in np.flatnonzero(kept < 3):
+        idx = np.arange(ring_starts[r], ring_ends[r] - 1)
+        while 0 < (~keep[idx]).sum() and keep[idx].sum() < 3:
+            chosen = idx[keep[idx]]
+            dist = np.min(np.hypot(x[idx, None] - x[None, chosen], y[idx, None] - y[None, chosen]), axis=1)
+            dist[keep[idx]] = -1.0
+            keep[idx[int(np.argmax(dist))]] = True
+
+
+def max_deviation(x, y, keep, ring_of, n_rings):
+    """Per ring, the largest distance of a dropped vertex to the simplified edge replacing it."""
+    idx = np.arange(len(x))
+    prev_kept = np.maximum.accumulate(np.where(keep, idx, 0))
+    next_kept = np.minimum.accumulate(np.where(keep, idx, len(x) - 1)[::-1])[::-1]
+    d = _segment_distance(x, y, x[prev_kept], y[prev_kept], x[next_kept], y[next_kept])
+    d[keep] = 0.0
+    out = np.zeros(n_rings)
+    np.maximum.at(out, ring_of, d)
+    return out
+
+
+def simplify_chunk(task):
+    """Simplify one chunk of parcels at every tolerance.
+
+    `task` holds the chunk's open rings: metric x/y, keys, pins, stored
+    coordinates, ring offsets, ring -> parcel index, hole flags, parcel ids /
+    types and the tolerances. Returns [(parcel id, level, vertex count,
+    max deviation m, geometry dict)] for levels that drop vertices.
+    """
+    (mx, my, keys, pins, sx, sy, offsets, ring_geom, ring_is_hole, ids, types, full_counts, tolerances) = task
+    n_rings = len(offsets) - 1
+    sizes = np.diff(offsets)
+    # Anchors: pinned shared vertices; rings with fewer than two get their min / max key vertices
+    anchor = pins.copy()
+    ring_of_open = np.repeat(np.arange(n_rings), sizes)
+    pinned_per_ring = np.bincount(ring_of_open, weights=pins, minlength=n_rings)
+    for r in np.flatnonzero(pinned_per_ring < 2):
+        s, e = offsets[r], offsets[r + 1]
+        if e - s:
+            anchor[s + int(np.argmin(keys[s:e]))] = True
+            anchor[s + int(np.argmax(keys[s:e]))] = True
+    small = sizes <= 3
+    anchor[np.repeat(small, sizes)] = True
+
+    # Rotate each ring to start at its first anchor and close it again
+    first_anchor = np.full(n_rings, -1, dtype=np.int64)
+    apos = np.flatnonzero(anchor)
+    aring = ring_of_open[apos]
+    first_idx = np.r_[0, np.flatnonzero(np.diff(aring)) + 1] if len(apos) else np.empty(0, dtype=np.int64)
+    first_anchor[aring[first_idx]] = apos[first_idx] - offsets[aring[first_idx]]
+    closed_sizes = np.where(sizes > 0, sizes + 1, 0)
+    j, ring_of = _group_ranges(np.zeros(n_rings, dtype=np.int64), closed_sizes)
+    src = offsets[ring_of] + (first_anchor[ring_of] + j) % np.maximum(sizes[ring_of], 1)
+    x, y, k, anchors = mx[src], my[src], keys[src], anchor[src]
+    rot_offsets = np.zeros(n_rings + 1, dtype=np.int64)
+    np.cumsum(closed_sizes, out=rot_offsets[1:])
+    nonempty = np.flatnonzero(closed_sizes > 0)
+    ring_starts, ring_ends = rot_offsets[:-1][nonempty], rot_offsets[1:][nonempty]
+
+    results = []
+    geom_rings = np.searchsorted(ring_geom, np.arange(len(ids) + 1))
+    finer_counts = list(full_counts)
+    for level, tolerance in enumerate(tolerances, start=1):
+        keep = douglas_peucker(x, y, k, anchors, ring_of, tolerance)
+        _ensure_three(x, y, keep, ring_starts, ring_ends)
+        deviation = max_deviation(x, y, keep, ring_of, n_rings)
+        kept_src = src[keep]
+        kept_ring = ring_of[keep]
+        ring_cuts = np.searchsorted(kept_ring, np.arange(n_rings + 1))
+        counts = np.diff(ring_cuts)
+        for gi, pid in enumerate(ids):
+            r0, r1 = geom_rings[gi], geom_rings[gi + 1]
+            vertex_count = int(counts[r0:r1].sum())
+            if vertex_count >= finer_counts[gi]:
+                continue
+            finer_counts[gi] = vertex_count
+            polygons = []
+            for r in range(r0, r1):
+                pts = kept_src[ring_cuts[r]:ring_cuts[r + 1]]
+                ring = [[float(sx[v]), float(sy[v])] for v in pts]
+                if not ring_is_hole[r] or not polygons:
+                    polygons.append([ring])
+                else:
+                    polygons[-1].append(ring)
+            if types[gi] == 'Polygon' and len(polygons) == 1:
+                geom = {'type': 'Polygon', 'coordinates': polygons[0]}
+            else:
+                geom = {'type': 'MultiPolygon', 'coordinates': polygons}
+            results.append((pid, level, vertex_count, float(deviation[r0:r1].max(initial=0.0)), geom))
+    return results
+
+
+# -- driver -------------------------------------------------------------------
+
+def prepare_tasks(arrays, types, canonical, tolerances=LOD_TOLERANCES_M, chunk_size=LOD_CHUNK_SIZE):
+    """Split the parcels into worker tasks; pins are computed over all parcels first."""
+    vidx, offsets = open_rings(arrays)
+    sx, sy = arrays.x[vidx], arrays.y[vidx]
+    ring_sizes = np.diff(offsets)
+    vertex_geom = np.repeat(arrays.ring_geom, ring_sizes)
+    if canonical:
+        lng, lat = sx, sy
+    else:
+        swapped = np.repeat(compute_metrics(arrays)['swapped'][arrays.ring_geom], ring_sizes)
+        lng, lat = np.where(swapped, sy, sx), np.where(swapped, sx, sy)
+    mx, my = utm28_forward(lat, lng)
+    keys = vertex_keys(sx, sy)
+    pins = shared_vertex_pins(keys, vertex_geom, offsets)
+    full_counts = np.bincount(arrays.ring_geom, weights=np.diff(arrays.ring_offsets), minlength=len(arrays))
+
+    tasks = []
+    geom_rings = np.searchsorted(arrays.ring_geom, np.arange(len(arrays) + 1))
+    for g0 in range(0, len(arrays), chunk_size):
+        g1 = min(g0 + chunk_size, len(arrays))
+        r0, r1 = geom_rings[g0], geom_rings[g1]
+        v0, v1 = offsets[r0], offsets[r1]
+        ids = arrays.ids[g0:g1]
+        tasks.append((mx[v0:v1], my[v0:v1], keys[v0:v1], pins[v0:v1], sx[v0:v1], sy[v0:v1],
+                      offsets[r0:r1 + 1] - v0, arrays.ring_geom[r0:r1] - g0, arrays.ring_is_hole[r0:r1],
+                      ids, [types[pid] for pid in ids], full_counts[g0:g1], tuple(tolerances)))
+    return tasks, dict(zip(arrays.ids, full_counts.astype(int).tolist()))
+
+
+def compute_lods(con, tolerances=LOD_TOLERANCES_M, workers=1, chunk_size=LOD_CHUNK_SIZE):
+    """[(parcel id, level, vertex count, max deviation m, geometry dict)] and {parcel id: full vertex count}."""
+    arrays, types = load_shapes(con)
+    if not len(arrays):
+        return [], {}
+    tasks, full_counts = prepare_tasks(arrays, types, has_canonical_geometry(con), tolerances, chunk_size)
+    if workers <= 1 or len(tasks) == 1:
+        chunks = map(simplify_chunk, tasks)
+        return [row for chunk in chunks for row in chunk], full_counts
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [row for chunk in pool.map(simplify_chunk, tasks) for row in chunk], full_counts
+
+
+def lod_report(rows, full_counts, tolerances=LOD_TOLERANCES_M):
+    """{level: (tolerance, parcels stored, vertices drawn, max deviation m)}.
+
+    Vertices drawn counts what load_lod_geometry returns for every parcel:
+    the coarsest stored level not above `level`, else the full geometry.
+    """
+    stored = {}
+    report = {}
+    for level, tolerance in enumerate(tolerances, start=1):
+        report[level] = [tolerance, 0, 0, 0.0]
+    for pid, level, count, deviation, _geom in rows:
+        stored.setdefault(pid, {})[level] = count
+        report[level][1] += 1
+        report[level][3] = max(report[level][3], deviation)
+    for level in report:
+        drawn = 0
+        for pid, full in full_counts.items():
+            levels = stored.get(pid, {})
+            finer = [lv for lv in levels if lv <= level]
+            drawn += levels[max(finer)] if finer else full
+        report[level][2] = drawn
+    return {level: tuple(values) for level, values in report.items()}
+
+
+def print_lod_report(report, full_vertices):
+    print(f"{'level':>5} {'tolerance m':>11} {'parcels':>8} {'vertices':>10} {'kept':>6} {'max dev m':>9}")
+    print(f"{0:>5} {'-':>11} {'-':>8} {full_vertices:>10} {100.0:5.1f}% {0.0:9.3f}")
+    for level, (tolerance, parcels, vertices, deviation) in report.items():
+        share = 100.0 * vertices / full_vertices if full_vertices else 0.0
+        print(f'{level:>5} {tolerance:>11g} {parcels:>8} {vertices:>10} {share:5.1f}% {deviation:9.3f}')
+
+
+def write_lods(con, tolerances=LOD_TOLERANCES_M, workers=1):
+    """(Re)build parcel_geometry_lod; returns (rows written, report, full vertex count) for print_lod_report."""
+    rows, full_counts = compute_lods(con, tolerances, workers)
+    create_lod_table(con)
+    con.execute(f'DELETE FROM {LOD_TABLE}')
+    con.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('lod_tolerances_m', ?)",
+                (','.join(f'{t:g}' for t in tolerances),))
+    con.executemany(f'INSERT INTO {LOD_TABLE} (parcel_id, level, vertex_count, max_deviation_m, geometry) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    ((pid, level, count, deviation, json.dumps(geom)) for pid, level, count, deviation, geom in rows))
+    return len(rows), lod_report(rows, full_counts, tolerances), sum(full_counts.values())
+
+
+def load_lod_geometry(con, parcel_id, level):
+    """(geometry dict, level used) at `level` or the next finer stored level; level 0 is the full geometry."""
+    row = con.execute(f'''SELECT geometry, level FROM {LOD_TABLE}
+        WHERE parcel_id = ? AND level <= ? ORDER BY level DESC LIMIT 1''', (parcel_id, level)).fetchone() \
+        if level > 0 and has_lod_table(con) else None
+    if row:
+        return json.loads(row[0]), row[1]
+    source = COMPAT_VIEW if is_split(con) else 'parcels'
+    columns = {r[1] for r in con.execute(f'PRAGMA table_info({source})')}
+    blob = 'geometry_bin' if 'geometry_bin' in columns else 'NULL'
+    row = con.execute(f'SELECT geometry, {blob} FROM {source} WHERE id = ?', (parcel_id,)).fetchone()
+    return (load_geometry(*row) if row else None), 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simplified parcel geometries per level of detail (numpy).')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('--tolerances', default=','.join(f'{t:g}' for t in LOD_TOLERANCES_M),
+                        help='comma-separated Douglas-Peucker tolerances in meters, one per level')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes')
+    parser.add_argument('--write', action='store_true', help='(re)build parcel_geometry_lod')
+    args = parser.parse_args()
+
+    tolerances = parse_tolerances(args.tolerances)
+    con = sqlite3.connect(args.db)
+    t0 = time.perf_counter()
+    if args.write:
+        written, report, full_vertices = write_lods(con, tolerances, args.workers)
+        con.commit()
+        print(f'wrote {written} {LOD_TABLE} rows in {time.perf_counter() - t0:.2f}s')
+    else:
+        rows, full_counts = compute_lods(con, tolerances, args.workers)
+        report, full_vertices = lod_report(rows, full_counts, tolerances), sum(full_counts.values())
+        print(f'{len(full_counts)} parcels simplified in {time.perf_counter() - t0:.2f}s (dry run)')
+    print_lod_report(report, full_vertices)
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
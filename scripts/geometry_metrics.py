@@ -0,0 +1,354 @@
+"""
+Vectorized geometry metrics for the whole parcels table (needs numpy).
+
+All vertices are flattened into contiguous arrays with ring / geometry
+offset indexes, and bbox, area-weighted centroid, area and perimeter are
+computed for every parcel in one pass of numpy reductions:
+  - bbox and centroid in degrees (lat/lng), holes and every MultiPolygon part
+    included; on databases normalized at ingest (geom_flags) coordinates are
+    taken as lon/lat, otherwise the order is decided per parcel against the
+    Senegal window, like spatial_index.normalize_geometry;
+  - area (m², outer rings minus holes) and perimeter (m, all rings) on a
+    UTM zone 28N projection (EPSG:32628) computed in-module.
+
+generate_prebuilt_db.py fills the centroid/area/perimeter columns with
+write_metrics(); add_bboxes.py uses the same engine to backfill old DBs.
+
+Usage:
+    python scripts/geometry_metrics.py <db> [--write]
+"""
+
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+
+from geometry_codec import has_compact_geometry, load_geometry, unpack_geometry
+from spatial_index import SENEGAL_LAT_RANGE, SENEGAL_LNG_RANGE, has_canonical_geometry
+
+METRIC_COLUMNS = ('centroid_lat', 'centroid_lng', 'area_m2', 'perimeter_m')
+BBOX_COLUMNS = ('min_lat', 'min_lng', 'max_lat', 'max_lng')
+
+# WGS84 / UTM zone 28N
+_WGS84_A = 6378137.0
+_WGS84_F = 1 / 298.257223563
+UTM28_CENTRAL_MERIDIAN = -15.0
+UTM_SCALE = 0.9996
+UTM_FALSE_EASTING = 500000.0
+
+
+def utm28_forward(lat, lng):
+    """Project degree arrays to UTM 28N (easting, northing) in meters (Krüger series)."""
+    n = _WGS84_F / (2 - _WGS84_F)
+    big_a = _WGS84_A / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    alpha = (n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16,
+             13 * n ** 2 / 48 - 3 * n ** 3 / 5,
+             61 * n ** 3 / 240)
+    e2n = 2 * np.sqrt(n) / (1 + n)
+    phi = np.radians(lat)
+    dlam = np.radians(lng - UTM28_CENTRAL_MERIDIAN)
+    sin_phi = np.sin(phi)
+    t = np.sinh(np.arctanh(sin_phi) - e2n * np.arctanh(e2n * sin_phi))
+    xi = np.arctan2(t, np.cos(dlam))
+    eta = np.arctanh(np.sin(dlam) / np.sqrt(1 + t * t))
+    easting = eta.copy()
+    northing = xi.copy()
+    for j, a_j in enumerate(alpha, start=1):
+        easting += a_j * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        northing += a_j * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+    return UTM_FALSE_EASTING + UTM_SCALE * big_a * easting, UTM_SCALE * big_a * northing
+
+
+class GeometryArrays:
+    """Vertices of many Polygon/MultiPolygon geometries flattened into numpy arrays.
+
+    x, y           vertex coordinates as stored (x = first ordinate)
+    ring_offsets   start of each ring in x/y, plus a final end offset
+    ring_geom      index of the geometry each ring belongs to
+    ring_is_hole   True for interior rings
+    ids            caller-supplied id per geometry (only geometries with rings are kept)
+    types          {id: 'Polygon' | 'MultiPolygon'} for the kept geometries
+    """
+
+    def __init__(self, ids, geometries):
+        xy, ring_sizes, ring_geom, ring_is_hole, kept, types = [], [], [], [], [], {}
+        for gid, geom in zip(ids, geometries):
+            first_ring = len(ring_sizes)
+            for poly in _polygons(geom):
+                for r, ring in enumerate(poly):
+                    try:
+                        pts = [(float(p[0]), float(p[1])) for p in ring]
+                    except (TypeError, ValueError, IndexError, KeyError):
+                        continue  # malformed ring
+                    if not pts:
+                        continue
+                    xy.extend(pts)
+                    ring_sizes.append(len(pts))
+                    ring_geom.append(len(kept))
+                    ring_is_hole.append(r > 0)
+            if len(ring_sizes) > first_ring:
+                kept.append(gid)
+                types[gid] = geom['type']
+        coords = np.array(xy, dtype=np.float64).reshape(-1, 2)
+        self._set(kept, types, coords[:, 0], coords[:, 1], ring_sizes, ring_geom, ring_is_hole)
+
+    def _set(self, ids, types, x, y, ring_sizes, ring_geom, ring_is_hole):
+        self.ids = ids
+        self.types = types
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.ring_offsets = np.zeros(len(ring_sizes) + 1, dtype=np.int64)
+        np.cumsum(ring_sizes, out=self.ring_offsets[1:])
+        self.ring_geom = np.asarray(ring_geom, dtype=np.int64)
+        self.ring_is_hole = np.asarray(ring_is_hole, dtype=bool)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """GeometryArrays from (id, geometry JSON text, geometry_bin) rows.
+
+        geometry_bin blobs go straight into the arrays: their quantized
+        values are unpacked per row, then accumulated and scaled for all
+        rows in a few numpy passes, with no per-vertex Python objects. Rows
+        without a blob are parsed from the text and appended after them.
+        Rows whose geometry cannot be decoded are skipped.
+        """
+        ids, geoms = [], []
+        kept, types, ring_sizes, ring_geom, ring_is_hole = [], {}, [], [], []
+        x_steps, y_steps, sizes, scales = [], [], [], []
+        for gid, text, blob in rows:
+            if blob is None:
+                ids.append(gid)
+                geoms.append(load_geometry(text))
+                continue
+            try:
+                gtype, precision, _z, dim, counts, values, n = unpack_geometry(blob)
+            except ValueError:
+                continue
+            if gtype not in ('Polygon', 'MultiPolygon') or not n:
+                continue
+            # Polygon counts: rings, sizes; MultiPolygon: parts, then rings and sizes per part
+            parts = [counts[1:]] if gtype == 'Polygon' else []
+            ci = 1
+            while gtype == 'MultiPolygon' and ci < len(counts):
+                parts.append(counts[ci + 1:ci + 1 + counts[ci]])
+                ci += 1 + counts[ci]
+            for part in parts:
+                for r, size in enumerate(part):
+                    if size:
+                        ring_sizes.append(size)
+                        ring_geom.append(len(kept))
+                        ring_is_hole.append(r > 0)
+            start = len(counts) + dim
+            # Each row starts with its absolute first coordinate, then the deltas
+            x_steps.append(values[len(counts)])
+            x_steps.extend(values[start:start + n - 1])
+            y_steps.append(values[len(counts) + 1])
+            y_steps.extend(values[start + n - 1:start + 2 * (n - 1)])
+            sizes.append(n)
+            scales.append(10 ** precision)
+            kept.append(gid)
+            types[gid] = gtype
+
+        arrays = cls.__new__(cls)
+        sizes = np.asarray(sizes, dtype=np.int64)
+        first = np.zeros(len(sizes), dtype=np.int64)
+        np.cumsum(sizes[:-1], out=first[1:])
+        scale = np.repeat(np.asarray(scales, dtype=np.float64), sizes)
+        axes = []
+        for steps in (x_steps, y_steps):
+            steps = np.asarray(steps, dtype=np.int64)
+            total = np.cumsum(steps)
+            # Restart the running sum at each row's first coordinate
+            if len(sizes):
+                total -= np.repeat(total[first] - steps[first], sizes)
+            axes.append(total / scale)
+        arrays._set(kept, types, axes[0], axes[1], ring_sizes, ring_geom, ring_is_hole)
+        return arrays.extend(cls(ids, geoms)) if ids else arrays
+
+    def extend(self, other):
+        """Append the geometries of `other` (in place); returns self."""
+        self.ring_geom = np.concatenate([self.ring_geom, other.ring_geom + len(self.ids)])
+        self.ring_offsets = np.concatenate([self.ring_offsets[:-1], other.ring_offsets + self.ring_offsets[-1]])
+        self.ring_is_hole = np.concatenate([self.ring_is_hole, other.ring_is_hole])
+        self.x = np.concatenate([self.x, other.x])
+        self.y = np.concatenate([self.y, other.y])
+        self.ids = self.ids + other.ids
+        self.types = {**self.types, **other.types}
+        return self
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def vertex_geom(self):
+        return np.repeat(self.ring_geom, np.diff(self.ring_offsets))
+
+    @property
+    def geom_offsets(self):
+        """Start of each geometry's vertices, plus a final end offset."""
+        first_ring = np.searchsorted(self.ring_geom, np.arange(len(self.ids)))
+        return np.append(self.ring_offsets[first_ring], self.ring_offsets[-1])
+
+
+def _polygons(geom):
+    if not isinstance(geom, dict):
+        return []
+    c = geom.get('coordinates')
+    if not isinstance(c, list):
+        return []
+    if geom.get('type') == 'Polygon':
+        return [c]
+    if geom.get('type') == 'MultiPolygon':
+        return [p for p in c if isinstance(p, list)]
+    return []
+
+
+def _in_window(min_lat, min_lng, max_lat, max_lng):
+    lat_lo, lat_hi = SENEGAL_LAT_RANGE
+    lng_lo, lng_hi = SENEGAL_LNG_RANGE
+    return ((min_lat >= lat_lo) & (max_lat <= lat_hi) & (min_lng >= lng_lo) & (max_lng <= lng_hi))
+
+
+def compute_metrics(arrays, detect_order=True):
+    """Return a dict of numpy arrays (one value per geometry in arrays.ids).
+
+    Keys: min_lat, min_lng, max_lat, max_lng, centroid_lat, centroid_lng,
+    area_m2, perimeter_m, swapped (True where the geometry was stored lat/lon).
+    With detect_order=False the input is known to be lon/lat.
+    """
+    n_geoms = len(arrays)
+    if not n_geoms:
+        return {k: np.empty(0) for k in BBOX_COLUMNS + METRIC_COLUMNS + ('swapped',)}
+    g_off = arrays.geom_offsets[:-1]
+    min_x = np.minimum.reduceat(arrays.x, g_off)
+    max_x = np.maximum.reduceat(arrays.x, g_off)
+    min_y = np.minimum.reduceat(arrays.y, g_off)
+    max_y = np.maximum.reduceat(arrays.y, g_off)
+
+    # Stored lon/lat unless only the swapped bbox falls inside the Senegal window
+    if detect_order:
+        swapped = ~_in_window(min_y, min_x, max_y, max_x) & _in_window(min_x, min_y, max_x, max_y)
+    else:
+        swapped = np.zeros(n_geoms, dtype=bool)
+    v_swapped = np.repeat(swapped, np.diff(arrays.geom_offsets))
+    lng = np.where(v_swapped, arrays.y, arrays.x)
+    lat = np.where(v_swapped, arrays.x, arrays.y)
+    min_lat = np.where(swapped, min_x, min_y)
+    max_lat = np.where(swapped, max_x, max_y)
+    min_lng = np.where(swapped, min_y, min_x)
+    max_lng = np.where(swapped, max_y, max_x)
+
+    # Next vertex within the same ring (wraps, so open and closed rings both work)
+    n_vertices = len(lat)
+    nxt = np.arange(1, n_vertices + 1)
+    ring_ends = arrays.ring_offsets[1:]
+    nxt[ring_ends - 1] = arrays.ring_offsets[:-1]
+    r_off = arrays.ring_offsets[:-1]
+    vertex_geom = arrays.vertex_geom
+
+    # Shoelace terms relative to each geometry's first vertex to keep precision
+    origin = g_off[vertex_geom]
+    e, nn = utm28_forward(lat, lng)
+    e -= e[origin]
+    nn -= nn[origin]
+    cross_m = e * nn[nxt] - e[nxt] * nn
+    ring_area = 0.5 * np.add.reduceat(cross_m, r_off)
+    # Outer rings add, holes subtract, whatever the ring orientation
+    ring_sign = np.where(arrays.ring_is_hole, -1.0, 1.0)
+    area = np.bincount(arrays.ring_geom, weights=ring_sign * np.abs(ring_area), minlength=n_geoms)
+    seg = np.hypot(e[nxt] - e, nn[nxt] - nn)
+    perimeter = np.bincount(vertex_geom, weights=seg, minlength=n_geoms)
+
+    # Area-weighted centroid in (shifted) degrees; a parcel-sized area of a
+    # conformal projection is locally affine, so the centroid is the same
+    dx = lng - lng[origin]
+    dy = lat - lat[origin]
+    cross_d = dx * dy[nxt] - dx[nxt] * dy
+    ring_a = 0.5 * np.add.reduceat(cross_d, r_off)
+    ring_mx = np.add.reduceat((dx + dx[nxt]) * cross_d, r_off) / 6.0
+    ring_my = np.add.reduceat((dy + dy[nxt]) * cross_d, r_off) / 6.0
+    orient = ring_sign * np.sign(ring_a)
+    geom_a = np.bincount(arrays.ring_geom, weights=orient * ring_a, minlength=n_geoms)
+    geom_mx = np.bincount(arrays.ring_geom, weights=orient * ring_mx, minlength=n_geoms)
+    geom_my = np.bincount(arrays.ring_geom, weights=orient * ring_my, minlength=n_geoms)
+    counts = np.bincount(vertex_geom, minlength=n_geoms)
+    mean_dx = np.bincount(vertex_geom, weights=dx, minlength=n_geoms) / counts
+    mean_dy = np.bincount(vertex_geom, weights=dy, minlength=n_geoms) / counts
+    # Degenerate (zero-area) geometries fall back to the vertex mean
+    has_area = np.abs(geom_a) > 1e-18
+    safe_a = np.where(has_area, geom_a, 1.0)
+    centroid_lng = lng[g_off] + np.where(has_area, geom_mx / safe_a, mean_dx)
+    centroid_lat = lat[g_off] + np.where(has_area, geom_my / safe_a, mean_dy)
+
+    return {
+        'min_lat': min_lat, 'min_lng': min_lng, 'max_lat': max_lat, 'max_lng': max_lng,
+        'centroid_lat': centroid_lat, 'centroid_lng': centroid_lng,
+        'area_m2': area, 'perimeter_m': perimeter,
+        'swapped': swapped,
+    }
+
+
+def load_arrays(con, ids=None):
+    """Read parcel geometries (compact column when present) into GeometryArrays keyed by parcels.id."""
+    geom_cols = 'geometry, geometry_bin' if has_compact_geometry(con) else 'geometry, NULL'
+    sql = f'SELECT id, {geom_cols} FROM parcels'
+    if ids is None:
+        rows = con.execute(sql + ' ORDER BY id').fetchall()
+    else:
+        rows = []
+        for pid in ids:
+            rows.extend(con.execute(sql + ' WHERE id = ?', (pid,)))
+    return GeometryArrays.from_rows(rows)
+
+
+def ensure_metric_columns(con, columns=METRIC_COLUMNS):
+    existing = {r[1] for r in con.execute('PRAGMA table_info(parcels)')}
+    for col in columns:
+        if col not in existing:
+            con.execute(f'ALTER TABLE parcels ADD COLUMN {col} REAL')
+
+
+def write_metrics(con, ids=None, columns=METRIC_COLUMNS):
+    """Compute metrics for all parcels (or only `ids`) and write `columns` in one executemany.
+
+    Returns the number of rows updated.
+    """
+    arrays = load_arrays(con, ids)
+    return _write(con, arrays, compute_metrics(arrays, not has_canonical_geometry(con)), columns)
+
+
+def _write(con, arrays, metrics, columns):
+    ensure_metric_columns(con, columns)
+    values = [metrics[c].tolist() for c in columns]
+    sql = f"UPDATE parcels SET {', '.join(c + ' = ?' for c in columns)} WHERE id = ?"
+    con.executemany(sql, zip(*values, arrays.ids))
+    return len(arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute parcel bbox / centroid / area / perimeter with numpy.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('--write', action='store_true', help='write the metric columns back to the DB')
+    args = parser.parse_args()
+
+    con = sqlite3.connect(args.db)
+    t0 = time.perf_counter()
+    arrays = load_arrays(con)
+    t1 = time.perf_counter()
+    metrics = compute_metrics(arrays, not has_canonical_geometry(con))
+    t2 = time.perf_counter()
+    print(f'{len(arrays)} parcels, {len(arrays.x)} vertices: load {t1 - t0:.3f}s, metrics {t2 - t1:.3f}s')
+    if len(arrays):
+        area = metrics['area_m2']
+        print(f"area m2 min {area.min():.1f} median {np.median(area):.1f} max {area.max():.1f}; "
+              f"{int(metrics['swapped'].sum())} stored lat/lon")
+    if args.write:
+        _write(con, arrays, metrics, METRIC_COLUMNS)
+        con.commit()
+        print(f'wrote {", ".join(METRIC_COLUMNS)} in {time.perf_counter() - t2:.3f}s')
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
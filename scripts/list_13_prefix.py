@@ -1,14 +1,14 @@
 import sqlite3
 from pathlib import Path
+
+from parcel_numbers import count_by_prefix, find_by_prefix
+
 root=Path(__file__).resolve().parents[1]
 db=root/'prebuilt'/'parcelapp.db'
 con=sqlite3.connect(str(db))
-cur=con.cursor()
-cur.execute("SELECT count(*) FROM parcels WHERE num_parcel LIKE '13%'")
-count=cur.fetchone()[0]
+count=count_by_prefix(con, '13')
 print('count13=',count)
-cur.execute("SELECT id,num_parcel,village,substr(properties,1,200) FROM parcels WHERE num_parcel LIKE '13%' ORDER BY id LIMIT 50")
-rows=cur.fetchall()
+rows=find_by_prefix(con, '13', limit=50, columns=('id', 'num_parcel', 'village'))
 for r in rows:
     print(r[0], r[1], r[2])
 con.close()
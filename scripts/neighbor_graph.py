@@ -0,0 +1,269 @@
+"""
+Precomputed parcel neighbor graph (parcel_neighbors) for parcelapp.db.
+
+generate_prebuilt_db.py calls build_neighbor_graph() after parcels_rtree is
+filled. For every parcel the table holds:
+  - every parcel whose outer ring touches or overlaps it (touches = 1), found
+    with an R*Tree self-join on the bbox columns and confirmed on the rings
+    with a small metric tolerance for survey gaps;
+  - its K nearest parcels by centroid (same centroid and haversine as
+    getNeighborParcels in src/data/database.ts), found on a grid of projected
+    centroids, up to MAX_NEIGHBOR_DISTANCE_M.
+Rows are clustered by parcel_id (WITHOUT ROWID), so a lookup is one index
+range read.
+
+Usage:
+    python scripts/neighbor_graph.py <db> <num_parcel>
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from math import asin, cos, radians, sin, sqrt
+
+from geometry_codec import has_compact_geometry, load_geometry
+from spatial_index import (RTREE_TABLE, geometry_centroid, has_canonical_geometry, has_rtree,
+                           outer_rings_latlng, populate_rtree)
+
+NEIGHBOR_TABLE = 'parcel_neighbors'
+
+# Same as DEFAULT_NEIGHBOR_LIMIT in src/data/database.ts
+DEFAULT_NEIGHBOR_K = 6
+MAX_NEIGHBOR_DISTANCE_M = 10000.0
+# Rings closer than this are considered touching (digitizing gaps between surveys)
+TOUCH_TOLERANCE_M = 1.0
+# ~1.1 m in degrees, used to widen bboxes in the R*Tree join
+TOUCH_TOLERANCE_DEG = 1e-5
+
+GRID_CELL_M = 500.0
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEG_LAT = 110574.0
+METERS_PER_DEG_LNG_EQUATOR = 111320.0
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters (same radius as the app)."""
+    lat1, lng1, lat2, lng2 = map(radians, (lat1, lng1, lat2, lng2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * asin(sqrt(min(1.0, a)))
+
+
+def create_neighbor_table(con):
+    con.execute(f'''CREATE TABLE IF NOT EXISTS {NEIGHBOR_TABLE} (
+        parcel_id INTEGER NOT NULL,
+        neighbor_id INTEGER NOT NULL,
+        distance_m REAL,
+        touches INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (parcel_id, neighbor_id)
+    ) WITHOUT ROWID;''')
+
+
+def has_neighbor_table(con):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (NEIGHBOR_TABLE,)).fetchone() is not None
+
+
+def _load_shapes(con):
+    """id -> (centroid (lat, lng), outer rings as (lat, lng)) for every parcel with a usable geometry."""
+    geom_cols = 'geometry, geometry_bin' if has_compact_geometry(con) else 'geometry, NULL'
+    # Geometries normalized at ingest are already lon/lat
+    canonical = has_canonical_geometry(con)
+    shapes = {}
+    for pid, text, blob in con.execute(f'SELECT id, {geom_cols} FROM parcels'):
+        try:
+            geom = load_geometry(text, blob)
+        except (ValueError, KeyError):
+            continue
+        centroid = geometry_centroid(geom, canonical)
+        if centroid is None:
+            continue
+        shapes[pid] = (centroid, outer_rings_latlng(geom, canonical))
+    return shapes
+
+
+def _to_xy(rings, lat0):
+    kx = METERS_PER_DEG_LNG_EQUATOR * cos(radians(lat0))
+    return [[(lng * kx, lat * METERS_PER_DEG_LAT) for lat, lng in ring] for ring in rings]
+
+
+def _segments(ring):
+    return list(zip(ring, ring[1:] + ring[:1]))
+
+
+def _point_segment_dist2(p, a, b):
+    ax, ay = a
+    dx, dy = b[0] - ax, b[1] - ay
+    px, py = p[0] - ax, p[1] - ay
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, (px * dx + py * dy) / length2))
+    ex, ey = px - t * dx, py - t * dy
+    return ex * ex + ey * ey
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _segments_cross(a, b, c, d):
+    d1, d2 = _cross(c, d, a), _cross(c, d, b)
+    d3, d4 = _cross(a, b, c), _cross(a, b, d)
+    return ((d1 > 0) != (d2 > 0)) and ((d3 > 0) != (d4 > 0))
+
+
+def _point_in_ring(p, ring):
+    x, y = p
+    inside = False
+    for (x1, y1), (x2, y2) in _segments(ring):
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
+
+def rings_touch(rings_a, rings_b, tolerance_m=TOUCH_TOLERANCE_M):
+    """True if two sets of (lat, lng) outer rings overlap or come within tolerance_m."""
+    if not rings_a or not rings_b:
+        return False
+    lat0 = rings_a[0][0][0]
+    xa = _to_xy(rings_a, lat0)
+    xb = _to_xy(rings_b, lat0)
+    tol2 = tolerance_m * tolerance_m
+    for ra in xa:
+        for rb in xb:
+            if _point_in_ring(ra[0], rb) or _point_in_ring(rb[0], ra):
+                return True
+            sb = _segments(rb)
+            for a1, a2 in _segments(ra):
+                for b1, b2 in sb:
+                    if (_segments_cross(a1, a2, b1, b2)
+                            or _point_segment_dist2(a1, b1, b2) <= tol2
+                            or _point_segment_dist2(b1, a1, a2) <= tol2):
+                        return True
+    return False
+
+
+def touching_pairs(con, shapes):
+    """(id_a, id_b) with id_a < id_b whose rings touch, via an R*Tree self-join on the bboxes."""
+    e = TOUCH_TOLERANCE_DEG
+    sql = f'''SELECT a.id, b.id FROM {RTREE_TABLE} a, {RTREE_TABLE} b
+        WHERE b.id > a.id
+          AND b.min_lng <= a.max_lng + {e} AND b.max_lng >= a.min_lng - {e}
+          AND b.min_lat <= a.max_lat + {e} AND b.max_lat >= a.min_lat - {e}'''
+    pairs = []
+    for a, b in con.execute(sql):
+        if a in shapes and b in shapes and rings_touch(shapes[a][1], shapes[b][1]):
+            pairs.append((a, b))
+    return pairs
+
+
+def nearest_neighbors(shapes, k=DEFAULT_NEIGHBOR_K, max_distance_m=MAX_NEIGHBOR_DISTANCE_M):
+    """id -> [(distance_m, neighbor_id)] of the k nearest centroids, using a grid in projected meters."""
+    if not shapes:
+        return {}
+    lat0 = sum(c[0] for c, _ in shapes.values()) / len(shapes)
+    kx = METERS_PER_DEG_LNG_EQUATOR * cos(radians(lat0))
+    grid = {}
+    cells = {}
+    for pid, ((lat, lng), _) in shapes.items():
+        cell = (int(lng * kx // GRID_CELL_M), int(lat * METERS_PER_DEG_LAT // GRID_CELL_M))
+        cells[pid] = cell
+        grid.setdefault(cell, []).append(pid)
+
+    max_ring = int(max_distance_m / GRID_CELL_M) + 1
+    result = {}
+    for pid, (cx, cy) in cells.items():
+        lat, lng = shapes[pid][0]
+        found = []
+        for r in range(max_ring + 1):
+            for gx in range(cx - r, cx + r + 1):
+                for gy in (range(cy - r, cy + r + 1) if gx in (cx - r, cx + r) else (cy - r, cy + r)):
+                    for other in grid.get((gx, gy), ()):
+                        if other == pid:
+                            continue
+                        olat, olng = shapes[other][0]
+                        d = haversine_m(lat, lng, olat, olng)
+                        if d <= max_distance_m:
+                            found.append((d, other))
+            if len(found) >= k:
+                found.sort()
+                # Every unvisited cell is at least r cells away; the projection is only
+                # approximate away from lat0, so keep a small margin
+                if found[k - 1][0] <= r * GRID_CELL_M * 0.95:
+                    break
+        found.sort()
+        result[pid] = found[:k]
+    return result
+
+
+def build_neighbor_graph(con, k=DEFAULT_NEIGHBOR_K, max_distance_m=MAX_NEIGHBOR_DISTANCE_M):
+    """(Re)build parcel_neighbors from the parcels table. Returns the number of rows written.
+
+    The graph is global (an inserted parcel can displace a neighbor of any
+    nearby parcel), so it is always rebuilt as a whole.
+    """
+    if not has_rtree(con):
+        populate_rtree(con)
+    create_neighbor_table(con)
+    con.execute(f'DELETE FROM {NEIGHBOR_TABLE}')
+    shapes = _load_shapes(con)
+    edges = {}
+    for pid, found in nearest_neighbors(shapes, k, max_distance_m).items():
+        for d, other in found:
+            edges[(pid, other)] = (d, 0)
+    for a, b in touching_pairs(con, shapes):
+        (alat, alng), (blat, blng) = shapes[a][0], shapes[b][0]
+        d = haversine_m(alat, alng, blat, blng)
+        edges[(a, b)] = (d, 1)
+        edges[(b, a)] = (d, 1)
+    con.executemany(f'INSERT INTO {NEIGHBOR_TABLE} (parcel_id, neighbor_id, distance_m, touches) VALUES (?, ?, ?, ?)',
+                    ((a, b, d, t) for (a, b), (d, t) in sorted(edges.items())))
+    return len(edges)
+
+
+NEIGHBOR_COLUMNS = ('id', 'num_parcel', 'parcel_type', 'village')
+
+
+def parcel_neighbors(con, num_parcel, limit=None):
+    """Neighbors of a parcel as dicts (NEIGHBOR_COLUMNS + distance_m, touches), nearest first."""
+    select = ', '.join(f'p.{c}' for c in NEIGHBOR_COLUMNS)
+    sql = f'''SELECT {select}, n.distance_m, n.touches
+        FROM parcels s
+        JOIN {NEIGHBOR_TABLE} n ON n.parcel_id = s.id
+        JOIN parcels p ON p.id = n.neighbor_id
+        WHERE s.num_parcel = ?
+        ORDER BY n.distance_m, p.id'''
+    params = [num_parcel]
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    names = NEIGHBOR_COLUMNS + ('distance_m', 'touches')
+    return [dict(zip(names, r)) for r in con.execute(sql, params)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Look up the precomputed neighbors of a parcel.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('num_parcel')
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--json', action='store_true', help='print the rows as JSON')
+    args = parser.parse_args()
+
+    con = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    if not has_neighbor_table(con):
+        print(f'{args.db} has no {NEIGHBOR_TABLE}; rebuild it with scripts/generate_prebuilt_db.py')
+        sys.exit(1)
+    t0 = time.perf_counter()
+    rows = parcel_neighbors(con, args.num_parcel, args.limit)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(f'{len(rows)} neighbors in {elapsed_ms:.3f} ms')
+        for r in rows:
+            print(f"{r['num_parcel']} {r['parcel_type']} {r['distance_m']:.1f} m"
+                  f"{' touches' if r['touches'] else ''} {r['village'] or ''}")
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Administrative hierarchy decoded from parcel numbers.
+
+A 13-digit parcel number such as 0532010351856 is read as
+    05    region        (num_region)
+    32    department    (num_department)
+    0103  commune       (num_commune)
+    51856 sequence      (num_sequence)
+and stored as integer columns covered by one composite index, so any digit
+prefix becomes an index range: whole fields are equality terms and a partial
+field a BETWEEN (e.g. 05320 -> region = 5 AND department = 32 AND commune
+BETWEEN 0 AND 999). Numbers that are not 13 digits keep NULL columns and are
+matched with LIKE on the (few) NULL rows.
+
+parcel_prefix_stats holds parcel counts per region / department / commune
+prefix and parcel type, so rollups are primary-key reads.
+
+generate_prebuilt_db.py fills both with write_parcel_numbers() and
+build_prefix_stats(); run this script with --write to backfill an older DB.
+
+Usage:
+    python scripts/parcel_numbers.py <db> [prefix] [--limit 200] [--level region|department|commune] [--write]
+"""
+
+import argparse
+import sqlite3
+import time
+
+# (column, start, end) slices of the 13-digit number
+NUM_FIELDS = (
+    ('num_region', 0, 2),
+    ('num_department', 2, 4),
+    ('num_commune', 4, 8),
+    ('num_sequence', 8, 13),
+)
+NUM_COLUMNS = tuple(name for name, _, _ in NUM_FIELDS)
+NUM_LENGTH = NUM_FIELDS[-1][2]
+HIERARCHY_INDEX = 'idx_num_hierarchy'
+
+PREFIX_STATS_TABLE = 'parcel_prefix_stats'
+# Rollup level -> number of leading fields
+PREFIX_LEVELS = {'region': 1, 'department': 2, 'commune': 3}
+
+_DIGITS_GLOB = '[0-9]' * NUM_LENGTH
+
+
+def decode_num_parcel(num):
+    """(region, department, commune, sequence) ints, or None if `num` is not a 13-digit number."""
+    if not isinstance(num, str) or len(num) != NUM_LENGTH or not num.isdigit():
+        return None
+    return tuple(int(num[start:end]) for _, start, end in NUM_FIELDS)
+
+
+def has_parcel_numbers(con):
+    """True if the parcels table has the decoded hierarchy columns."""
+    columns = {r[1] for r in con.execute('PRAGMA table_info(parcels)')}
+    return set(NUM_COLUMNS) <= columns
+
+
+def has_prefix_stats(con):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (PREFIX_STATS_TABLE,)).fetchone() is not None
+
+
+def ensure_parcel_number_columns(con):
+    existing = {r[1] for r in con.execute('PRAGMA table_info(parcels)')}
+    for col in NUM_COLUMNS:
+        if col not in existing:
+            con.execute(f'ALTER TABLE parcels ADD COLUMN {col} INTEGER')
+
+
+def write_parcel_numbers(con, ids=None):
+    """Decode num_parcel into the hierarchy columns for all parcels (or only `ids`).
+
+    Done in SQL in one UPDATE; also creates the composite index if missing.
+    Returns the number of rows updated.
+    """
+    ensure_parcel_number_columns(con)
+    values = ', '.join(
+        f"{name} = CASE WHEN num_parcel GLOB '{_DIGITS_GLOB}' "
+        f"THEN CAST(substr(num_parcel, {start + 1}, {end - start}) AS INTEGER) END"
+        for name, start, end in NUM_FIELDS)
+    sql = f'UPDATE parcels SET {values}'
+    if ids is None:
+        updated = con.execute(sql).rowcount
+    else:
+        updated = sum(con.execute(f'{sql} WHERE id = ?', (pid,)).rowcount for pid in ids)
+    con.execute(f"CREATE INDEX IF NOT EXISTS {HIERARCHY_INDEX} ON parcels({', '.join(NUM_COLUMNS)})")
+    return updated
+
+
+def _level_prefix_sql(n_fields):
+    fields = NUM_FIELDS[:n_fields]
+    fmt = ''.join(f'%0{end - start}d' for _, start, end in fields)
+    return f"printf('{fmt}', {', '.join(name for name, _, _ in fields)})"
+
+
+def build_prefix_stats(con):
+    """(Re)build parcel_prefix_stats from the hierarchy columns. Returns the number of rows written."""
+    con.execute(f'''CREATE TABLE IF NOT EXISTS {PREFIX_STATS_TABLE} (
+        level TEXT NOT NULL,
+        prefix TEXT NOT NULL,
+        parcel_type TEXT NOT NULL,
+        parcel_count INTEGER NOT NULL,
+        PRIMARY KEY (level, prefix, parcel_type)
+    ) WITHOUT ROWID;''')
+    con.execute(f'DELETE FROM {PREFIX_STATS_TABLE}')
+    written = 0
+    for level, n_fields in PREFIX_LEVELS.items():
+        group = ', '.join(NUM_COLUMNS[:n_fields])
+        written += con.execute(f'''INSERT INTO {PREFIX_STATS_TABLE} (level, prefix, parcel_type, parcel_count)
+            SELECT ?, {_level_prefix_sql(n_fields)}, COALESCE(parcel_type, ''), COUNT(*)
+            FROM parcels WHERE num_region IS NOT NULL
+            GROUP BY {group}, COALESCE(parcel_type, '')''', (level,)).rowcount
+    return written
+
+
+def prefix_condition(prefix):
+    """WHERE clause and params selecting decoded numbers starting with `prefix` as an index range.
+
+    Returns None when no 13-digit number can start with `prefix`.
+    """
+    if prefix == '':
+        return 'num_region IS NOT NULL', []
+    if not prefix.isdigit() or len(prefix) > NUM_LENGTH:
+        return None
+    terms, params = [], []
+    for name, start, end in NUM_FIELDS:
+        part = prefix[start:end]
+        if not part:
+            break
+        if len(part) == end - start:
+            terms.append(f'{name} = ?')
+            params.append(int(part))
+        else:
+            scale = 10 ** (end - start - len(part))
+            terms.append(f'{name} BETWEEN ? AND ?')
+            params += [int(part) * scale, (int(part) + 1) * scale - 1]
+            break
+    return ' AND '.join(terms), params
+
+
+def find_by_prefix(con, prefix, limit=200, columns=('num_parcel',)):
+    """Rows of `columns` for parcels whose number starts with `prefix`, in number order."""
+    select = ', '.join(columns)
+    if not has_parcel_numbers(con):
+        sql = f'SELECT {select} FROM parcels WHERE num_parcel LIKE ? ORDER BY num_parcel LIMIT ?'
+        return con.execute(sql, (prefix + '%', limit)).fetchall()
+    rows = []
+    condition = prefix_condition(prefix)
+    if condition:
+        where, params = condition
+        order = ', '.join(NUM_COLUMNS)
+        rows = con.execute(f'SELECT {select} FROM parcels WHERE {where} ORDER BY {order}, id LIMIT ?',
+                           params + [limit]).fetchall()
+    if len(rows) < limit:
+        # Numbers that are not 13 digits are not decoded
+        rows += con.execute(f'SELECT {select} FROM parcels WHERE num_region IS NULL AND num_parcel LIKE ? '
+                            'ORDER BY num_parcel, id LIMIT ?', (prefix + '%', limit - len(rows))).fetchall()
+    return rows
+
+
+def count_by_prefix(con, prefix, parcel_type=None):
+    """Number of parcels whose number starts with `prefix` (optionally of one parcel type)."""
+    type_sql, type_params = (' AND parcel_type = ?', [parcel_type]) if parcel_type else ('', [])
+    if not has_parcel_numbers(con):
+        return con.execute(f'SELECT COUNT(*) FROM parcels WHERE num_parcel LIKE ?{type_sql}',
+                           [prefix + '%'] + type_params).fetchone()[0]
+    total = 0
+    condition = prefix_condition(prefix)
+    level = next((lv for lv, n in PREFIX_LEVELS.items() if len(prefix) == NUM_FIELDS[n - 1][2]), None)
+    if condition and level and has_prefix_stats(con):
+        total = con.execute(f'SELECT COALESCE(SUM(parcel_count), 0) FROM {PREFIX_STATS_TABLE} '
+                            f'WHERE level = ? AND prefix = ?{type_sql}', [level, prefix] + type_params).fetchone()[0]
+    elif condition:
+        where, params = condition
+        total = con.execute(f'SELECT COUNT(*) FROM parcels WHERE {where}{type_sql}', params + type_params).fetchone()[0]
+    total += con.execute(f'SELECT COUNT(*) FROM parcels WHERE num_region IS NULL AND num_parcel LIKE ?{type_sql}',
+                         [prefix + '%'] + type_params).fetchone()[0]
+    return total
+
+
+def prefix_counts(con, level='region', parcel_type=None):
+    """[(prefix, count)] for every region / department / commune prefix, largest first."""
+    if level not in PREFIX_LEVELS:
+        raise ValueError(f'unknown level {level!r} (expected one of {", ".join(PREFIX_LEVELS)})')
+    type_sql, type_params = (' AND parcel_type = ?', [parcel_type]) if parcel_type else ('', [])
+    if has_prefix_stats(con):
+        sql = f'''SELECT prefix, SUM(parcel_count) AS n FROM {PREFIX_STATS_TABLE}
+            WHERE level = ?{type_sql} GROUP BY prefix ORDER BY n DESC, prefix'''
+        return con.execute(sql, [level] + type_params).fetchall()
+    n_fields = PREFIX_LEVELS[level]
+    if has_parcel_numbers(con):
+        sql = f'''SELECT {_level_prefix_sql(n_fields)} AS p, COUNT(*) AS n FROM parcels
+            WHERE num_region IS NOT NULL{type_sql} GROUP BY {', '.join(NUM_COLUMNS[:n_fields])} ORDER BY n DESC, p'''
+    else:
+        width = NUM_FIELDS[n_fields - 1][2]
+        sql = f'''SELECT substr(num_parcel, 1, {width}) AS p, COUNT(*) AS n FROM parcels
+            WHERE length(num_parcel) = {NUM_LENGTH}{type_sql} GROUP BY p ORDER BY n DESC, p'''
+    return con.execute(sql, type_params).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parcel number prefix listing and counts.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('prefix', nargs='?', help='digit prefix to list and count')
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--level', choices=tuple(PREFIX_LEVELS), default='region',
+                        help='rollup level printed when no prefix is given')
+    parser.add_argument('--write', action='store_true',
+                        help='(re)compute the hierarchy columns, index and parcel_prefix_stats')
+    args = parser.parse_args()
+
+    con = sqlite3.connect(args.db)
+    if args.write:
+        t0 = time.perf_counter()
+        updated = write_parcel_numbers(con)
+        stats = build_prefix_stats(con)
+        con.commit()
+        print(f'decoded {updated} parcel numbers, {stats} prefix stats rows in {time.perf_counter() - t0:.3f}s')
+    if args.prefix is None:
+        for prefix, n in prefix_counts(con, args.level):
+            print(f'{prefix}*: {n} parcels')
+    else:
+        t0 = time.perf_counter()
+        total = count_by_prefix(con, args.prefix)
+        rows = find_by_prefix(con, args.prefix, args.limit)
+        print(f'{total} parcels in {(time.perf_counter() - t0) * 1000:.2f} ms')
+        for (num,) in rows:
+            print(num)
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
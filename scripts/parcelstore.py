@@ -0,0 +1,275 @@
+"""
+Read-only data access to parcelapp.db for the diagnostic scripts.
+
+ParcelStore opens the database read-only (URI mode=ro) with a sized
+prepared-statement cache; every query it issues has fixed SQL text with
+bound parameters, so each statement is prepared once per connection.
+Rows come back as Parcel records (__slots__, no per-row dict) holding the
+raw geometry / properties columns; they are only decoded when .geometry or
+.properties is first read. Parsed geometries are kept in a size-bounded LRU
+keyed by parcel id and shared by all records of the store.
+
+Queries can be projected on a subset of columns (columns=...). A Parcel
+read without its geometry or properties columns fetches them by id on first
+access.
+
+    with ParcelStore('prebuilt/parcelapp.db') as store:
+        p = store.get_by_num('0522010201354')
+        print(p.village, p.centroid, p.prop('communeSenegal'))
+        for q in store.get_many([1, 2, 3], columns=('id', 'num_parcel')):
+            ...
+"""
+
+import json
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+
+from geometry_codec import load_geometry
+from property_codec import load_properties, load_schemas
+from spatial_index import bbox_candidates, geometry_centroid, outer_rings_latlng
+from table_layout import COMPAT_VIEW, is_split, mentions_side_columns
+
+DEFAULT_DB = Path(__file__).resolve().parents[1] / 'prebuilt' / 'parcelapp.db'
+GEOMETRY_CACHE_SIZE = 4096
+STATEMENT_CACHE_SIZE = 256
+
+# Scalar columns a Parcel exposes directly (missing ones read as None)
+SCALAR_COLUMNS = (
+    'id', 'num_parcel', 'parcel_type', 'typ_pers', 'prenom', 'nom', 'prenom_m', 'nom_m', 'denominat',
+    'village', 'min_lat', 'min_lng', 'max_lat', 'max_lng', 'geom_flags',
+    'centroid_lat', 'centroid_lng', 'area_m2', 'perimeter_m',
+    'num_region', 'num_department', 'num_commune', 'num_sequence',
+)
+# Raw columns decoded lazily, and the Parcel slot holding each
+LAZY_COLUMNS = ('geometry', 'geometry_bin', 'properties', 'properties_schema', 'properties_values')
+LAZY_SLOTS = {'geometry': '_geometry_text', 'geometry_bin': '_geometry_bin', 'properties': '_properties_text',
+              'properties_schema': '_properties_schema', 'properties_values': '_properties_values'}
+SUMMARY_COLUMNS = ('id', 'num_parcel', 'parcel_type', 'village', 'min_lat', 'min_lng', 'max_lat', 'max_lng')
+
+_UNLOADED = object()
+
+
+class Parcel:
+    """One parcels row. geometry / properties are decoded on first access."""
+
+    __slots__ = SCALAR_COLUMNS + ('_store', '_geometry_text', '_geometry_bin', '_properties_text',
+                                  '_properties_schema', '_properties_values', '_properties')
+
+    def __init__(self, store, values):
+        self._store = store
+        self._properties = _UNLOADED
+        # Only columns the DB has can be pending; the others read as None without a query
+        for name in LAZY_COLUMNS:
+            setattr(self, LAZY_SLOTS[name], _UNLOADED if name in store.columns else None)
+        for name in SCALAR_COLUMNS:
+            setattr(self, name, None)
+        for name, value in values:
+            setattr(self, LAZY_SLOTS.get(name, name), value)
+
+    def __repr__(self):
+        return f'Parcel(id={self.id!r}, num_parcel={self.num_parcel!r}, parcel_type={self.parcel_type!r})'
+
+    @property
+    def raw_geometry(self):
+        """The stored geometry JSON text (None for compact-only databases)."""
+        if self._geometry_text is _UNLOADED:
+            self._store._load_lazy(self)
+        return self._geometry_text
+
+    @property
+    def raw_properties(self):
+        """The stored properties JSON text (None for compact-only databases)."""
+        if self._properties_text is _UNLOADED:
+            self._store._load_lazy(self)
+        return self._properties_text
+
+    @property
+    def has_geometry(self):
+        if self._geometry_text is _UNLOADED or self._geometry_bin is _UNLOADED:
+            self._store._load_lazy(self)
+        return bool(self._geometry_text and self._geometry_text.strip() not in ('null', '{}')) or bool(self._geometry_bin)
+
+    @property
+    def geometry(self):
+        """Parsed GeoJSON geometry dict (None if missing or unparsable), via the store's LRU."""
+        return self._store.geometry_of(self)
+
+    @property
+    def properties(self):
+        """Parsed properties dict ({} if missing or unparsable), cached on the record."""
+        if self._properties is _UNLOADED:
+            if _UNLOADED in (self._properties_text, self._properties_schema, self._properties_values):
+                self._store._load_lazy(self)
+            self._properties = load_properties(self._properties_text, self._properties_schema,
+                                               self._properties_values, self._store.schemas)
+        return self._properties
+
+    def prop(self, key, default=None):
+        return self.properties.get(key, default)
+
+    @property
+    def bbox(self):
+        """(min_lat, min_lng, max_lat, max_lng) from the bbox columns, or None."""
+        box = (self.min_lat, self.min_lng, self.max_lat, self.max_lng)
+        return None if any(v is None for v in box) else box
+
+    @property
+    def centroid(self):
+        """(lat, lng) vertex mean of the first outer ring, as the app computes it."""
+        return geometry_centroid(self.geometry, self._store.canonical)
+
+    @property
+    def outer_rings(self):
+        """Outer rings as lists of (lat, lng)."""
+        return outer_rings_latlng(self.geometry, self._store.canonical)
+
+    def as_dict(self, decode=True):
+        out = {name: getattr(self, name) for name in SCALAR_COLUMNS if name in self._store.columns}
+        out['geometry'] = self.geometry if decode else self.raw_geometry
+        out['properties'] = self.properties if decode else self.raw_properties
+        return out
+
+
+class ParcelStore:
+    """Read-only parcelapp.db access with lazy Parcel records and a geometry LRU."""
+
+    def __init__(self, path=DEFAULT_DB, geometry_cache_size=GEOMETRY_CACHE_SIZE,
+                 statement_cache_size=STATEMENT_CACHE_SIZE):
+        self.path = Path(path)
+        if not self.path.exists():
+            raise FileNotFoundError(f'DB not found: {self.path}')
+        self.con = sqlite3.connect(f'file:{self.path.as_posix()}?mode=ro', uri=True,
+                                   cached_statements=statement_cache_size)
+        # Split layout (table_layout): scalar columns in parcels, the rest through the parcels_wide view
+        self.split = is_split(self.con)
+        self.columns = tuple(r[1] for r in self.con.execute(f'PRAGMA table_info({COMPAT_VIEW if self.split else "parcels"})'))
+        tables = {r[0] for r in self.con.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        self.has_neighbors = 'parcel_neighbors' in tables
+        # Geometries normalized at ingest (geom_flags) are already lon/lat
+        self.canonical = 'geom_flags' in self.columns
+        self.compact = 'geometry_bin' in self.columns
+        self.has_bbox = 'min_lat' in self.columns
+        # Key lists of schema-encoded properties (property_codec), shared by all records
+        self.schemas = load_schemas(self.con) if 'properties_values' in self.columns else {}
+        self._lazy_sql = 'SELECT {} FROM {} WHERE id = ?'.format(
+            ', '.join(c for c in LAZY_COLUMNS if c in self.columns), COMPAT_VIEW if self.split else 'parcels')
+        self._geometry_cache = OrderedDict()
+        self._geometry_cache_size = geometry_cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.con.close()
+
+    # -- queries ---------------------------------------------------------
+
+    def _source(self, columns, *sql_parts):
+        """parcels, or parcels_wide when the DB is split and the query needs a moved column."""
+        if self.split and mentions_side_columns(' '.join(columns), *sql_parts):
+            return COMPAT_VIEW
+        return 'parcels'
+
+    def _projection(self, columns):
+        if columns is None:
+            columns = SCALAR_COLUMNS + LAZY_COLUMNS
+        cols = tuple(c for c in columns if c in self.columns)
+        if 'id' not in cols:
+            cols = ('id',) + cols  # lazy columns are fetched by id
+        return cols
+
+    def _parcels(self, sql, params, cols):
+        for row in self.con.execute(sql, params):
+            yield Parcel(self, zip(cols, row))
+
+    def select(self, where='', params=(), columns=None, order_by='id', limit=None):
+        """Iterate Parcels matching a SQL WHERE clause, fetching only `columns` (plus id)."""
+        cols = self._projection(columns)
+        sql = f"SELECT {', '.join(cols)} FROM {self._source(cols, where, order_by)}"
+        if where:
+            sql += f' WHERE {where}'
+        if order_by:
+            sql += f' ORDER BY {order_by}'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params = tuple(params) + (limit,)
+        return self._parcels(sql, params, cols)
+
+    def values(self, columns, where='', params=()):
+        """Plain tuples of `columns` for rows matching `where` (no Parcel objects)."""
+        sql = f"SELECT {', '.join(columns)} FROM {self._source(columns, where)}"
+        if where:
+            sql += f' WHERE {where}'
+        return self.con.execute(sql, params).fetchall()
+
+    def get(self, pid, columns=None):
+        return next(self.select('id = ?', (pid,), columns, order_by=None), None)
+
+    def find(self, num_parcel, columns=None):
+        """All parcels with this num_parcel (numbers can repeat across layers)."""
+        return list(self.select('num_parcel = ?', (num_parcel,), columns))
+
+    def get_by_num(self, num_parcel, columns=None):
+        return next(self.select('num_parcel = ?', (num_parcel,), columns, limit=1), None)
+
+    def get_many(self, ids, columns=None):
+        """Parcels for `ids` in the given order (missing ids are skipped), in one query."""
+        ids = list(ids)
+        if not ids:
+            return []
+        cols = self._projection(columns)
+        # One fixed statement whatever the number of ids: the list is bound as a JSON array
+        sql = f"SELECT {', '.join('p.' + c for c in cols)} FROM {self._source(cols)} p WHERE p.id IN (SELECT value FROM json_each(?))"
+        by_id = {p.id: p for p in self._parcels(sql, (json.dumps(ids),), cols)}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def in_bbox(self, min_lat, min_lng, max_lat, max_lng, columns=SUMMARY_COLUMNS):
+        """Parcels whose bbox intersects the given one (parcels_rtree when present)."""
+        return self.get_many(bbox_candidates(self.con, min_lat, min_lng, max_lat, max_lng), columns)
+
+    def neighbors(self, parcel, limit=None, columns=SUMMARY_COLUMNS):
+        """[(Parcel, distance_m, touches)] from the precomputed parcel_neighbors table, nearest first."""
+        if not self.has_neighbors:
+            return []
+        sql = 'SELECT neighbor_id, distance_m, touches FROM parcel_neighbors WHERE parcel_id = ? ORDER BY distance_m, neighbor_id'
+        rows = self.con.execute(sql, (parcel.id,)).fetchall()
+        if limit is not None:
+            rows = rows[:limit]
+        by_id = {p.id: p for p in self.get_many([r[0] for r in rows], columns)}
+        return [(by_id[nid], d, bool(t)) for nid, d, t in rows if nid in by_id]
+
+    # -- lazy decoding ---------------------------------------------------
+
+    def _load_lazy(self, parcel):
+        row = self.con.execute(self._lazy_sql, (parcel.id,)).fetchone() or ()
+        values = dict(zip((c for c in LAZY_COLUMNS if c in self.columns), row))
+        for name, slot in LAZY_SLOTS.items():
+            if getattr(parcel, slot) is _UNLOADED:
+                setattr(parcel, slot, values.get(name))
+
+    def geometry_of(self, parcel):
+        cache = self._geometry_cache
+        geom = cache.get(parcel.id, _UNLOADED)
+        if geom is not _UNLOADED:
+            cache.move_to_end(parcel.id)
+            self.cache_hits += 1
+            return geom
+        self.cache_misses += 1
+        if parcel._geometry_text is _UNLOADED or parcel._geometry_bin is _UNLOADED:
+            self._load_lazy(parcel)
+        try:
+            geom = load_geometry(parcel._geometry_text, parcel._geometry_bin)
+        except (ValueError, KeyError):
+            geom = None
+        if not isinstance(geom, dict):
+            geom = None
+        cache[parcel.id] = geom
+        if len(cache) > self._geometry_cache_size:
+            cache.popitem(last=False)
+        return geom
@@ -0,0 +1,219 @@
+"""
+Hot property keys promoted into typed, indexed parcels columns.
+
+The Kobo form properties are one JSON blob per parcel, so filtering on the
+commune or the department means a LIKE scan over every blob. At build time
+generate_prebuilt_db.py copies the keys listed in PROMOTED_COLUMNS into real
+columns (first non-empty source key wins) and indexes the ones used as
+filters. Each entry is
+    (column, source keys, type, indexed)
+with type one of:
+    text      stripped string, TEXT COLLATE NOCASE like village
+    int       INTEGER ("12", "12.0" and 12 are all 12)
+    real      REAL
+    date      ISO date text YYYY-MM-DD
+    date_int  INTEGER YYYYMMDD
+Values that do not convert are stored as NULL and counted in the report.
+
+The list can be replaced with a JSON file (--promote-config) holding
+[{"column": ..., "keys": [...], "type": ..., "index": true}, ...].
+
+Usage:
+    python scripts/promoted_columns.py <db> [--config promote.json] [--write]
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import time
+from datetime import date, datetime
+
+PROMOTED_COLUMNS = (
+    ('region', ('regionSenegal',), 'text', False),
+    ('department', ('departmentSenegal', 'departementsenegal', 'department'), 'text', True),
+    ('arrondissement', ('arrondissementSenegal',), 'text', False),
+    ('commune', ('communeSenegal', 'communesenegal', 'commune', 'Commune'), 'text', True),
+    ('grappe', ('grappeSenegal',), 'text', False),
+    ('survey_date', ('today',), 'date', True),
+    ('topographe', ('Topographe',), 'text', True),
+    ('geomaticien', ('geomaticien',), 'text', False),
+    ('enqueteur', ('Enqueteur',), 'text', False),
+    ('affectataires', ('Quel_est_le_nombre_d_affectata',), 'int', False),
+)
+
+COLUMN_TYPES = {
+    'text': 'TEXT COLLATE NOCASE',
+    'int': 'INTEGER',
+    'real': 'REAL',
+    'date': 'TEXT',
+    'date_int': 'INTEGER',
+}
+
+_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d')
+_ISO_PREFIX = re.compile(r'^(\d{4})-(\d{2})-(\d{2})')
+
+
+def load_config(path):
+    """Read a promotion list from a JSON file into PROMOTED_COLUMNS form."""
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    spec = []
+    for entry in entries:
+        column = entry['column']
+        ctype = entry.get('type', 'text')
+        if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', column):
+            raise ValueError(f'invalid column name {column!r}')
+        if ctype not in COLUMN_TYPES:
+            raise ValueError(f'unknown type {ctype!r} for {column} (expected one of {", ".join(COLUMN_TYPES)})')
+        keys = entry.get('keys') or [column]
+        spec.append((column, tuple(keys), ctype, bool(entry.get('index', False))))
+    return tuple(spec)
+
+
+def _parse_date(value):
+    if isinstance(value, (int, float)):
+        return None
+    text = str(value).strip()
+    m = _ISO_PREFIX.match(text)
+    if m:
+        try:
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        except ValueError:
+            return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def convert(value, ctype):
+    """Typed value for a raw property, or None when it is empty or does not convert."""
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+    if ctype == 'text':
+        return str(value)
+    if ctype in ('int', 'real'):
+        if isinstance(value, bool):
+            return None
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        if number != number or number in (float('inf'), float('-inf')):
+            return None
+        if ctype == 'real':
+            return number
+        return int(number) if number.is_integer() else None
+    parsed = _parse_date(value)
+    if parsed is None:
+        return None
+    return parsed.isoformat() if ctype == 'date' else parsed.year * 10000 + parsed.month * 100 + parsed.day
+
+
+def promote(properties, spec=PROMOTED_COLUMNS):
+    """Tuple of typed values (one per spec entry) for a parsed properties dict.
+
+    Also returns per-column flags telling whether a non-empty raw value was
+    found but did not convert.
+    """
+    values, rejected = [], []
+    for _column, keys, ctype, _indexed in spec:
+        raw = None
+        for key in keys:
+            candidate = properties.get(key)
+            if candidate is not None and not (isinstance(candidate, str) and not candidate.strip()):
+                raw = candidate
+                break
+        value = convert(raw, ctype)
+        values.append(value)
+        rejected.append(raw is not None and value is None)
+    return tuple(values), rejected
+
+
+def ensure_promoted_columns(con, spec=PROMOTED_COLUMNS):
+    """Add missing columns; returns the names of the columns that were added."""
+    existing = {r[1] for r in con.execute('PRAGMA table_info(parcels)')}
+    added = []
+    for column, _keys, ctype, _indexed in spec:
+        if column not in existing:
+            con.execute(f'ALTER TABLE parcels ADD COLUMN {column} {COLUMN_TYPES[ctype]}')
+            added.append(column)
+    return added
+
+
+def write_promoted_columns(con, ids=None, spec=PROMOTED_COLUMNS):
+    """Fill the promoted columns for all parcels (or only `ids`) and create their indexes.
+
+    Columns that did not exist yet are filled for every parcel even when
+    `ids` is given. Returns (rows processed, {column: (populated rows,
+    rejected values)}).
+    """
+    added = ensure_promoted_columns(con, spec)
+    if added:
+        ids = None
+    if ids is None:
+        rows = con.execute('SELECT id, properties FROM parcels')
+    else:
+        rows = con.execute('SELECT id, properties FROM parcels WHERE id IN (SELECT value FROM json_each(?))',
+                           (json.dumps(list(ids)),))
+    populated = [0] * len(spec)
+    rejected = [0] * len(spec)
+    updates = []
+    for pid, text in rows.fetchall():
+        try:
+            properties = json.loads(text) if text else {}
+        except ValueError:
+            properties = {}
+        if not isinstance(properties, dict):
+            properties = {}
+        values, bad = promote(properties, spec)
+        for i, value in enumerate(values):
+            populated[i] += value is not None
+            rejected[i] += bad[i]
+        updates.append(values + (pid,))
+    assignments = ', '.join(f'{column} = ?' for column, _, _, _ in spec)
+    con.executemany(f'UPDATE parcels SET {assignments} WHERE id = ?', updates)
+    for column, _keys, _ctype, indexed in spec:
+        if indexed:
+            con.execute(f'CREATE INDEX IF NOT EXISTS idx_{column} ON parcels({column})')
+    return len(updates), {column: (populated[i], rejected[i]) for i, (column, _, _, _) in enumerate(spec)}
+
+
+def report_promoted_columns(report, total):
+    print('Promoted property columns (rows populated / values rejected):')
+    for column, (populated, rejected) in report.items():
+        share = 100.0 * populated / total if total else 0.0
+        note = f', {rejected} rejected' if rejected else ''
+        print(f'  {column:<16} {populated:>9} ({share:5.1f}%){note}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Promote property keys into typed, indexed parcels columns.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('--config', help='JSON promotion list (default: PROMOTED_COLUMNS)')
+    parser.add_argument('--write', action='store_true', help='write the columns (otherwise only report)')
+    args = parser.parse_args()
+
+    spec = load_config(args.config) if args.config else PROMOTED_COLUMNS
+    con = sqlite3.connect(args.db)
+    t0 = time.perf_counter()
+    con.execute('BEGIN')  # so a dry run also rolls back the ALTER TABLEs
+    total, report = write_promoted_columns(con, spec=spec)
+    if args.write:
+        con.commit()
+    else:
+        con.rollback()
+    report_promoted_columns(report, total)
+    print(f"{'wrote' if args.write else 'dry run over'} {total} parcels in {time.perf_counter() - t0:.2f}s")
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
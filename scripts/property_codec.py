@@ -0,0 +1,235 @@
+"""
+Shared key dictionary encoding for the parcels properties column.
+
+Every properties blob repeats the same 100+ Kobo keys (Recto_AF1_URL,
+Quel_est_le_nombre_d_affectata, ...), and the keys are most of its bytes.
+Here each distinct key list (in order) is stored once in property_schemas, and
+a parcel keeps
+    properties_schema   id of its key list
+    properties_values   JSON array of the values, in key order
+Decoding is json.loads on the (much shorter) array plus dict(zip(keys, ...)),
+and gives back the original dict, key order included.
+
+generate_prebuilt_db.py --properties both|compact fills the columns after the
+stages that read the JSON text (promote, fts, stats); 'compact' then sets
+properties to NULL (not for the app bundle, which reads the JSON text).
+Consumers should go through load_properties(), which falls back to the JSON
+text for older databases. Schema ids are kept across --incremental runs and
+unused schemas are dropped.
+
+Usage:
+    python scripts/property_codec.py verify <parcelapp.db>
+    python scripts/property_codec.py report <parcelapp.db>   # size / decode latency, JSON vs schema
+    python scripts/property_codec.py write <parcelapp.db>    # backfill the columns (keeps the JSON text)
+"""
+
+import json
+import sqlite3
+import sys
+import time
+
+SCHEMAS_TABLE = 'property_schemas'
+PROPERTIES_FORMATS = ('json', 'both', 'compact')
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def has_compact_properties(con):
+    """True if the parcels table has the properties_schema / properties_values columns."""
+    return any(r[1] == 'properties_values' for r in con.execute('PRAGMA table_info(parcels)'))
+
+
+def ensure_property_columns(con):
+    con.execute(f'''CREATE TABLE IF NOT EXISTS {SCHEMAS_TABLE} (
+        id INTEGER PRIMARY KEY,
+        keys TEXT NOT NULL UNIQUE,
+        key_count INTEGER NOT NULL
+    );''')
+    existing = {r[1] for r in con.execute('PRAGMA table_info(parcels)')}
+    if 'properties_schema' not in existing:
+        con.execute('ALTER TABLE parcels ADD COLUMN properties_schema INTEGER')
+    if 'properties_values' not in existing:
+        con.execute('ALTER TABLE parcels ADD COLUMN properties_values TEXT')
+
+
+def load_schemas(con):
+    """{schema id: key tuple} from property_schemas ({} when the table is missing)."""
+    try:
+        return {sid: tuple(json.loads(keys)) for sid, keys in con.execute(f'SELECT id, keys FROM {SCHEMAS_TABLE}')}
+    except sqlite3.OperationalError:
+        return {}
+
+
+class SchemaRegistry:
+    """Key tuple -> schema id map backed by property_schemas; new key lists get the next id."""
+
+    def __init__(self, con):
+        self.con = con
+        self.ids = {keys: sid for sid, keys in load_schemas(con).items()}
+        self.added = 0
+
+    def id_for(self, keys):
+        sid = self.ids.get(keys)
+        if sid is None:
+            sid = self.con.execute(f'INSERT INTO {SCHEMAS_TABLE} (keys, key_count) VALUES (?, ?)',
+                                   (_dumps(list(keys)), len(keys))).lastrowid
+            self.ids[keys] = sid
+            self.added += 1
+        return sid
+
+
+def encode_properties(properties, registry):
+    """(schema id, values JSON array) for a properties dict."""
+    return registry.id_for(tuple(properties)), _dumps(list(properties.values()))
+
+
+def decode_properties(keys, values):
+    """Properties dict from a schema key tuple and the values JSON array."""
+    return dict(zip(keys, json.loads(values)))
+
+
+def load_properties(text=None, schema_id=None, values=None, schemas=None):
+    """Return a properties dict from the schema-encoded columns when present, else from the JSON text.
+
+    Missing or unparsable properties give {}.
+    """
+    keys = schemas.get(schema_id) if schemas and schema_id is not None else None
+    try:
+        if keys is not None and values is not None:
+            return decode_properties(keys, values)
+        value = json.loads(text) if text else {}
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def write_compact_properties(con, ids=None, keep_json=True):
+    """Encode properties for all parcels (or only `ids`) into the schema columns.
+
+    Rows whose JSON text is NULL (already compact) are left as they are. With
+    keep_json=False the JSON text is set to NULL. Unused schemas are dropped.
+    Returns the number of rows encoded.
+    """
+    ensure_property_columns(con)
+    registry = SchemaRegistry(con)
+    if ids is None:
+        rows = con.execute('SELECT id, properties FROM parcels WHERE properties IS NOT NULL')
+    else:
+        rows = con.execute('SELECT id, properties FROM parcels WHERE properties IS NOT NULL '
+                           'AND id IN (SELECT value FROM json_each(?))', (json.dumps(list(ids)),))
+    updates = []
+    for pid, text in rows.fetchall():
+        try:
+            properties = json.loads(text)
+        except ValueError:
+            properties = None
+        if not isinstance(properties, dict):
+            # Kept as text only (the decoder falls back to it)
+            updates.append((None, None, text, pid))
+            continue
+        schema_id, values = encode_properties(properties, registry)
+        updates.append((schema_id, values, None if not keep_json else text, pid))
+    con.executemany('UPDATE parcels SET properties_schema = ?, properties_values = ?, properties = ? WHERE id = ?',
+                    updates)
+    con.execute(f'''DELETE FROM {SCHEMAS_TABLE} WHERE id NOT IN
+        (SELECT DISTINCT properties_schema FROM parcels WHERE properties_schema IS NOT NULL)''')
+    return len(updates)
+
+
+def format_sizes(con):
+    """{'parcels', 'json_bytes', 'values_bytes', 'schema_bytes', 'schemas'} for the current DB.
+
+    json_bytes is the JSON text as stored (re-serialized from the values when
+    the text was dropped).
+    """
+    schemas = load_schemas(con)
+    schema_bytes = sum(len(json.dumps(list(k), ensure_ascii=False).encode('utf-8')) for k in schemas.values())
+    json_bytes = values_bytes = parcels = 0
+    for text, sid, values in con.execute('SELECT properties, properties_schema, properties_values FROM parcels'):
+        parcels += 1
+        if values is not None:
+            values_bytes += len(values.encode('utf-8'))
+        if text is None and values is not None:
+            text = json.dumps(load_properties(None, sid, values, schemas))
+        json_bytes += len(text.encode('utf-8')) if text else 0
+    return {'parcels': parcels, 'json_bytes': json_bytes, 'values_bytes': values_bytes,
+            'schema_bytes': schema_bytes, 'schemas': len(schemas)}
+
+
+def verify(path):
+    """Decode every encoded row and compare with its JSON text (rows kept as both)."""
+    con = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    if not has_compact_properties(con):
+        print(f'{path} has no properties_values column (build with --properties both|compact)')
+        con.close()
+        return False
+    schemas = load_schemas(con)
+    total = same = text_only = 0
+    for text, sid, values in con.execute('SELECT properties, properties_schema, properties_values FROM parcels'):
+        if values is None:
+            text_only += 1
+            continue
+        total += 1
+        if text is None or load_properties(None, sid, values, schemas) == json.loads(text):
+            same += 1
+    con.close()
+    print(f'{total} encoded rows, {same} identical to the JSON text (or compact only), '
+          f'{text_only} kept as text only, {len(schemas)} schemas')
+    return same == total
+
+
+def report(path, repeat=5):
+    """Print stored bytes and decode latency for JSON text vs schema + values."""
+    con = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    if not has_compact_properties(con):
+        print(f'{path} has no properties_values column (build with --properties both|compact)')
+        con.close()
+        return
+    sizes = format_sizes(con)
+    schemas = load_schemas(con)
+    rows = con.execute('''SELECT properties, properties_schema, properties_values FROM parcels
+        WHERE properties_values IS NOT NULL''').fetchall()
+    con.close()
+    texts = [t if t is not None else json.dumps(load_properties(None, s, v, schemas)) for t, s, v in rows]
+    encoded = [(schemas[s], v) for _, s, v in rows]
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for t in texts:
+            json.loads(t)
+    t_json = (time.perf_counter() - t0) / repeat
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for keys, values in encoded:
+            decode_properties(keys, values)
+    t_schema = (time.perf_counter() - t0) / repeat
+
+    compact = sizes['values_bytes'] + sizes['schema_bytes']
+    n = len(rows) or 1
+    print(f"{sizes['parcels']} parcels, {len(rows)} encoded, {sizes['schemas']} schemas")
+    print(f"  JSON text        {sizes['json_bytes']:>12} bytes  {sizes['json_bytes'] / (sizes['parcels'] or 1):9.0f} B/row")
+    print(f"  schema + values  {compact:>12} bytes  {compact / (sizes['parcels'] or 1):9.0f} B/row "
+          f"({100.0 * compact / (sizes['json_bytes'] or 1):.1f}%, schemas {sizes['schema_bytes']} bytes)")
+    print(f'  decode           json.loads {t_json / n * 1e6:.1f} us/row, '
+          f'decode_properties {t_schema / n * 1e6:.1f} us/row ({t_json / (t_schema or 1e-9):.2f}x)')
+
+
+def write(path):
+    con = sqlite3.connect(path)
+    t0 = time.perf_counter()
+    rows = write_compact_properties(con)
+    con.commit()
+    print(f'encoded {rows} parcels, {len(load_schemas(con))} schemas in {time.perf_counter() - t0:.2f}s')
+    con.close()
+
+
+if __name__ == '__main__':
+    commands = {'verify': verify, 'report': report, 'write': write}
+    if len(sys.argv) != 3 or sys.argv[1] not in commands:
+        print('Usage: python scripts/property_codec.py verify|report|write <parcelapp.db>', file=sys.stderr)
+        sys.exit(1)
+    result = commands[sys.argv[1]](sys.argv[2])
+    if sys.argv[1] == 'verify':
+        sys.exit(0 if result else 1)
@@ -1,26 +1,21 @@
-import sqlite3
 from pathlib import Path
 
+from parcelstore import ParcelStore
+
 def query_db(path_str, parcel_num):
     p = Path(path_str)
     if not p.exists():
         print(f"DB not found: {p}")
         return
-    con = sqlite3.connect(str(p))
-    cur = con.cursor()
     try:
-        cur.execute("PRAGMA table_info(parcels)")
-        schema = cur.fetchall()
-        print(f"\nDB: {p} -- schema columns: {[c[1] for c in schema]}")
-        cur.execute("SELECT id, num_parcel, parcel_type, village, properties FROM parcels WHERE num_parcel = ?", (parcel_num,))
-        rows = cur.fetchall()
-        print(f"Found {len(rows)} rows for {parcel_num} in {p}")
-        for r in rows[:5]:
-            print(r)
+        with ParcelStore(p) as store:
+            print(f"\nDB: {p} -- schema columns: {list(store.columns)}")
+            rows = store.find(parcel_num, columns=('id', 'num_parcel', 'parcel_type', 'village'))
+            print(f"Found {len(rows)} rows for {parcel_num} in {p}")
+            for r in rows[:5]:
+                print((r.id, r.num_parcel, r.parcel_type, r.village, r.raw_properties))
     except Exception as e:
         print("Query error:", e)
-    finally:
-        con.close()
 
 if __name__ == '__main__':
     parcel = '0522010205945'
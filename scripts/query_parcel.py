@@ -1,23 +1,19 @@
-import sqlite3, json, sys, os
-root = os.path.dirname(os.path.dirname(__file__))
-db = os.path.join(root, 'prebuilt', 'parcelapp.db')
+import json, sys
+
+from parcelstore import DEFAULT_DB, ParcelStore
+
+if len(sys.argv) > 1 and sys.argv[1] == '--ids':
+    # Many numbers at once: JSONL with geometry and properties, one join for the whole list
+    import bulk_lookup
+    bulk_lookup.main([str(DEFAULT_DB), '--format', 'jsonl', '--geometry', '--properties', '--ids'] + sys.argv[2:3])
+    sys.exit(0)
+
 num = sys.argv[1] if len(sys.argv) > 1 else '0522010201354'
-con = sqlite3.connect(db)
-con.row_factory = sqlite3.Row
-cur = con.cursor()
-cur.execute('SELECT id, num_parcel, parcel_type, geometry, properties FROM parcels WHERE num_parcel = ? LIMIT 1', (num,))
-row = cur.fetchone()
-if not row:
-    print('Not found')
-else:
-    out = dict(row)
-    try:
-        out['properties'] = json.loads(out['properties'])
-    except Exception:
-        pass
-    try:
-        out['geometry'] = json.loads(out['geometry'])
-    except Exception:
-        pass
-    print(json.dumps(out, ensure_ascii=False, indent=2))
-con.close()
+with ParcelStore() as store:
+    parcel = store.get_by_num(num, columns=('id', 'num_parcel', 'parcel_type'))
+    if not parcel:
+        print('Not found')
+    else:
+        out = {'id': parcel.id, 'num_parcel': parcel.num_parcel, 'parcel_type': parcel.parcel_type,
+               'geometry': parcel.geometry, 'properties': parcel.properties}
+        print(json.dumps(out, ensure_ascii=False, indent=2))
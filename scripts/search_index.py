@@ -0,0 +1,176 @@
+"""
+FTS5 search index over parcel owners, mandataires, denomination and village.
+
+generate_prebuilt_db.py fills parcels_fts (rowid = parcels.id) after the rows
+are written. Text is lowercased and stripped of diacritics before indexing,
+and queries are folded the same way, so "Séne" finds "SENE". The trigram
+tokenizer gives the same substring semantics as the app's LIKE '%q%' search.
+
+search_parcels() reproduces the ordering of searchParcels in
+src/data/database.ts: exact num_parcel, num_parcel prefix, num_parcel
+substring, owner/mandataire name, then everything else; ties by id.
+
+Usage:
+    python scripts/search_index.py <db> <query> [--limit 50] [--offset 0]
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+import unicodedata
+
+FTS_TABLE = 'parcels_fts'
+
+# Per-person keys of the collectives Kobo form (affectataires, mandataires, exploitant)
+PERSON_KEY_GLOBS = (
+    'Prenom_[0-9][0-9][0-9]',
+    'Nom_[0-9][0-9][0-9]',
+    'Denom_[0-9][0-9][0-9]',
+    'Pren_expl',
+    'Nom_expl',
+)
+
+# Separates joined fields so substring matches cannot span two of them
+FIELD_SEP = '\x1f'
+
+
+def fold_text(value):
+    """Lowercase and strip diacritics; None stays None."""
+    if value is None:
+        return None
+    text = unicodedata.normalize('NFKD', str(value))
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def fold_fields(*values):
+    """fold_text of the non-null values joined with FIELD_SEP."""
+    return fold_text(FIELD_SEP.join(str(v) for v in values if v is not None))
+
+
+def _register_functions(con):
+    con.create_function('fold', 1, fold_text, deterministic=True)
+    con.create_function('fold_fields', -1, fold_fields, deterministic=True)
+
+
+def create_search_index(con):
+    con.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        num_parcel,
+        names,
+        denominat,
+        village,
+        persons,
+        tokenize = 'trigram'
+    );''')
+
+
+def _populate_sql(where):
+    person_filter = ' OR '.join(f"j.key GLOB '{g}'" for g in PERSON_KEY_GLOBS)
+    return f'''INSERT INTO {FTS_TABLE} (rowid, num_parcel, names, denominat, village, persons)
+        SELECT p.id,
+            fold(p.num_parcel),
+            fold_fields(p.prenom, p.nom, p.prenom_m, p.nom_m),
+            fold(p.denominat),
+            fold(p.village),
+            (SELECT fold(group_concat(j.value, char(31))) FROM json_each(p.properties) j
+                WHERE j.type = 'text' AND ({person_filter}))
+        FROM parcels p {where}'''
+
+
+def build_search_index(con, ids=None, deleted_ids=()):
+    """(Re)build parcels_fts from parcels; with ids only those rows are refreshed.
+
+    Returns the number of rows indexed.
+    """
+    _register_functions(con)
+    create_search_index(con)
+    if ids is None:
+        con.execute(f'DELETE FROM {FTS_TABLE}')
+        return con.execute(_populate_sql('')).rowcount
+    stale = [(pid,) for pid in list(ids) + list(deleted_ids)]
+    con.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = ?', stale)
+    written = 0
+    for (pid,) in stale:
+        written += con.execute(_populate_sql('WHERE p.id = ?'), (pid,)).rowcount
+    return written
+
+
+def has_search_index(con):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)).fetchone() is not None
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+SEARCH_COLUMNS = ('id', 'num_parcel', 'parcel_type', 'prenom', 'nom', 'prenom_m', 'nom_m', 'denominat', 'village')
+
+
+def search_parcels(con, query, limit=50, offset=0):
+    """Search parcels like the app does, through parcels_fts.
+
+    Returns (rows, total) where rows are dicts with SEARCH_COLUMNS plus
+    relevance_rank. Queries of 3+ characters use the trigram index; shorter
+    ones fall back to a LIKE scan of the (small) FTS table.
+    """
+    clean = (query or '').strip()
+    if not clean:
+        return [], 0
+    folded = fold_text(clean)
+    like_any = f'%{_escape_like(folded)}%'
+    like_prefix = f'{_escape_like(folded)}%'
+
+    if len(folded) >= 3:
+        where = f'{FTS_TABLE} MATCH ?'
+        where_params = ['"' + folded.replace('"', '""') + '"']
+    else:
+        where = ' OR '.join(f"f.{c} LIKE ? ESCAPE '\\'" for c in ('num_parcel', 'names', 'denominat', 'village', 'persons'))
+        where_params = [like_any] * 5
+
+    total = con.execute(f'SELECT COUNT(*) FROM {FTS_TABLE} f WHERE {where}', where_params).fetchone()[0]
+    if not total:
+        return [], 0
+
+    select = ', '.join(f'p.{c}' for c in SEARCH_COLUMNS)
+    sql = f'''SELECT {select},
+            CASE
+                WHEN f.num_parcel = ? THEN 0
+                WHEN f.num_parcel LIKE ? ESCAPE '\\' THEN 1
+                WHEN f.num_parcel LIKE ? ESCAPE '\\' THEN 2
+                WHEN f.names LIKE ? ESCAPE '\\' THEN 3
+                ELSE 4
+            END AS relevance_rank
+        FROM {FTS_TABLE} f JOIN parcels p ON p.id = f.rowid
+        WHERE {where}
+        ORDER BY relevance_rank, p.id
+        LIMIT ? OFFSET ?'''
+    params = [folded, like_prefix, like_any, like_any] + where_params + [limit, offset]
+    names = SEARCH_COLUMNS + ('relevance_rank',)
+    rows = [dict(zip(names, r)) for r in con.execute(sql, params)]
+    return rows, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search parcels through the parcels_fts index.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('query')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--offset', type=int, default=0)
+    args = parser.parse_args()
+
+    con = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    if not has_search_index(con):
+        print(f'{args.db} has no {FTS_TABLE}; rebuild it with scripts/generate_prebuilt_db.py')
+        sys.exit(1)
+    t0 = time.perf_counter()
+    rows, total = search_parcels(con, args.query, args.limit, args.offset)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    print(f'{total} matches in {elapsed_ms:.2f} ms')
+    for r in rows:
+        print(f"[{r['relevance_rank']}] {r['id']} {r['num_parcel']} {r['parcel_type']} "
+              f"{r['prenom'] or r['prenom_m'] or ''} {r['nom'] or r['nom_m'] or ''} {r['village'] or ''}")
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,410 @@
+"""
+Per-commune (or per-arrondissement / department) database packs.
+
+A pack is a self-contained parcelapp.db holding the parcels of one commune,
+with the schema and indexes of the full build: every table, index, view and
+virtual table of the source is recreated, then
+  - parcels is filtered on the pack column (parcel ids are kept, so they stay
+    unique across packs);
+  - tables keyed by parcel (parcel_id / neighbor_id columns, the split layout
+    side tables) and the R*Tree / FTS virtual tables keep the pack's rows;
+    neighbor edges to parcels of another pack are dropped;
+  - parcel_stats and parcel_prefix_stats are rebuilt from the pack's parcels;
+  - other tables (meta, property_schemas) are copied whole; meta gets the
+    pack's counts, version and digest under the usual keys.
+Packs are written in parallel, finalized (ANALYZE, VACUUM INTO, integrity
+check) and replaced atomically. Parcels without a value for the pack column
+go to an 'unassigned' pack.
+
+catalog.db next to the packs lists one row per pack: version, dataset digest,
+fingerprint, counts, bbox, file size and SHA-256. The fingerprint covers
+everything a pack is made from: the source schema (tables, indexes, promoted
+and compact columns) and build settings in meta, the digest (the build
+manifest hashes of its parcels) and the pack's rows of the derived
+parcel-keyed tables (neighbor edges, LOD geometries), which can change with
+parcels of other packs. A pack's version only changes with its fingerprint,
+and packs whose fingerprint and file are unchanged since the previous
+catalog are not rewritten.
+
+generate_prebuilt_db.py --packs commune builds them after the main DB.
+
+Usage:
+    python scripts/shard_packs.py [db] [--level commune|arrondissement|department] [--out-dir prebuilt/packs]
+                                  [--workers N] [--no-finalize] [--full]
+    python scripts/shard_packs.py --list [prebuilt/packs/catalog.db]
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+
+from dataset_stats import build_parcel_stats, has_parcel_stats, parcel_counts
+from finalize_db import DEFAULT_PAGE_SIZE, finalize_db
+from parcel_numbers import build_prefix_stats, has_prefix_stats
+from table_layout import SIDE_TABLES
+
+PACK_LEVELS = ('commune', 'arrondissement', 'department')
+DEFAULT_LEVEL = 'commune'
+CATALOG_NAME = 'catalog.db'
+UNASSIGNED = 'unassigned'
+# Rebuilt from the pack's parcels instead of copied
+AGGREGATE_TABLES = ('parcel_stats', 'parcel_prefix_stats')
+# meta keys write_pack sets per pack (left out of the source fingerprint)
+PACK_META_KEYS = ('version', 'generated_at', 'dataset_digest', 'count_total', 'count_individuel', 'count_collectif',
+                  'pack_id', 'pack_level', 'pack_value', 'pack_fingerprint', 'source_version')
+
+CATALOG_SCHEMA = '''CREATE TABLE packs (
+    pack_id TEXT PRIMARY KEY,
+    level TEXT NOT NULL,
+    value TEXT,
+    file TEXT NOT NULL,
+    version TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    parcel_count INTEGER NOT NULL,
+    count_individuel INTEGER NOT NULL,
+    count_collectif INTEGER NOT NULL,
+    min_lat REAL,
+    min_lng REAL,
+    max_lat REAL,
+    max_lng REAL,
+    bytes INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);'''
+CATALOG_COLUMNS = ('pack_id', 'level', 'value', 'file', 'version', 'digest', 'fingerprint', 'parcel_count', 'count_individuel',
+                   'count_collectif', 'min_lat', 'min_lng', 'max_lat', 'max_lng', 'bytes', 'sha256')
+
+
+def slugify(value):
+    text = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii').lower()
+    return re.sub(r'[^a-z0-9]+', '-', text).strip('-') or 'x'
+
+
+def plan_packs(con, level):
+    """[(pack_id, value, parcel count)] for every distinct value of `level` (None: unassigned parcels)."""
+    columns = {r[1] for r in con.execute('PRAGMA table_info(parcels)')}
+    if level not in columns:
+        raise ValueError(f'parcels has no {level} column (promoted_columns.py adds it)')
+    if con.execute("SELECT 1 FROM sqlite_master WHERE name = 'build_manifest'").fetchone() is None:
+        raise ValueError('no build_manifest table: packs need a DB built by generate_prebuilt_db.py')
+    packs, used = [], set()
+    for value, n in con.execute(f'SELECT {level}, COUNT(*) FROM parcels GROUP BY {level} ORDER BY {level}'):
+        slug = slugify(value) if value is not None else UNASSIGNED
+        # 'Arrondissement 0111' -> arrondissement-0111, not arrondissement-arrondissement-0111
+        slug = slug.removeprefix(f'{level}-')
+        pack_id = f'{level}-{slug}'
+        if pack_id in used:  # two values folding to the same slug
+            pack_id += '-' + hashlib.blake2b(value.encode('utf-8'), digest_size=3).hexdigest()
+        used.add(pack_id)
+        packs.append((pack_id, value, n))
+    return packs
+
+
+def pack_digest(con, level, value):
+    """Digest of the pack's parcels; equal to generate_prebuilt_db.dataset_digest() run on the pack."""
+    h = hashlib.blake2b(digest_size=16)
+    for (digest,) in con.execute(f'''SELECT m.content_hash FROM build_manifest m JOIN parcels p ON p.id = m.parcel_id
+            WHERE p.{level} IS ? ORDER BY m.parcel_type, m.num_parcel, m.seq''', (value,)):
+        h.update(digest.encode('ascii'))
+    return h.hexdigest()
+
+
+def source_fingerprint(con):
+    """Digest of the source schema and of its meta settings (all keys but PACK_META_KEYS)."""
+    h = hashlib.blake2b(digest_size=16)
+    for row in con.execute("SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY name"):
+        h.update(repr(row).encode('utf-8'))
+    try:
+        rows = con.execute(f"SELECT key, value FROM meta WHERE key NOT IN ({', '.join('?' * len(PACK_META_KEYS))}) "
+                           "ORDER BY key", PACK_META_KEYS).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    h.update(repr(rows).encode('utf-8'))
+    return h.hexdigest()
+
+
+def derived_tables(con):
+    """Parcel-keyed tables (parcel_id column) whose pack rows are not covered by the build manifest."""
+    names = [r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")]
+    return [name for name in names if name != 'build_manifest'
+            and any(r[1] == 'parcel_id' for r in con.execute(f'PRAGMA table_info("{name}")'))]
+
+
+def pack_fingerprint(con, level, value, digest, source, tables):
+    """Digest of everything the pack is written from: source fingerprint, parcel digest and derived rows."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f'{source}:{digest}'.encode('ascii'))
+    pack = f'SELECT id FROM parcels WHERE {level} IS ?'
+    for name in tables:
+        columns = [r[1] for r in con.execute(f'PRAGMA table_info("{name}")')]
+        where, params = f'parcel_id IN ({pack})', (value,)
+        if 'neighbor_id' in columns:  # edges leaving the pack are not copied (_copy_table)
+            where, params = where + f' AND neighbor_id IN ({pack})', (value, value)
+        order = ', '.join(str(i + 1) for i in range(len(columns)))
+        h.update(name.encode('utf-8'))
+        for row in con.execute(f'SELECT * FROM "{name}" WHERE {where} ORDER BY {order}', params):
+            h.update(repr(row).encode('utf-8'))
+    return h.hexdigest()
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _schema(con):
+    """(tables, virtual tables, indexes / views / triggers) of the attached source, as CREATE statements."""
+    rows = con.execute("SELECT type, name, sql FROM src.sqlite_master WHERE sql IS NOT NULL ORDER BY rowid").fetchall()
+    virtual = [name for kind, name, sql in rows if kind == 'table' and sql.upper().startswith('CREATE VIRTUAL')]
+    tables, virtual_sql, rest = [], [], []
+    for kind, name, sql in rows:
+        if name.startswith('sqlite_') or any(name.startswith(v + '_') for v in virtual):
+            continue  # internal or shadow tables, created with their owner
+        if kind == 'table':
+            (virtual_sql if name in virtual else tables).append((name, sql))
+        else:
+            rest.append((name, sql))
+    return tables, virtual_sql, rest
+
+
+def _copy_table(con, name):
+    columns = [r[1] for r in con.execute(f'PRAGMA src.table_info("{name}")')]
+    column_list = ', '.join(f'"{c}"' for c in columns)
+    if 'parcel_id' in columns:
+        where = 'WHERE parcel_id IN (SELECT id FROM temp.pack_ids)'
+        if 'neighbor_id' in columns:
+            where += ' AND neighbor_id IN (SELECT id FROM temp.pack_ids)'
+    elif name in SIDE_TABLES:
+        where = 'WHERE id IN (SELECT id FROM temp.pack_ids)'
+    else:
+        where = ''
+    con.execute(f'INSERT INTO main."{name}" ({column_list}) SELECT {column_list} FROM src."{name}" {where}')
+
+
+def _copy_virtual_table(con, name, sql):
+    columns = [r[1] for r in con.execute(f'PRAGMA src.table_info("{name}")')]
+    if 'USING RTREE' in sql.upper():
+        key, column_list = columns[0], ', '.join(f'"{c}"' for c in columns)  # the first column is the rowid
+        con.execute(f'INSERT INTO main."{name}" ({column_list}) SELECT {column_list} FROM src."{name}" '
+                    f'WHERE "{key}" IN (SELECT id FROM temp.pack_ids)')
+    else:
+        column_list = ', '.join(['rowid'] + [f'"{c}"' for c in columns])
+        con.execute(f'INSERT INTO main."{name}" ({column_list}) SELECT {column_list} FROM src."{name}" '
+                    f'WHERE rowid IN (SELECT id FROM temp.pack_ids)')
+
+
+def write_pack(task):
+    """Write one pack (a task tuple from build_packs) and return its catalog row as a dict."""
+    source, path, pack_id, level, value, digest, fingerprint, version, finalize, page_size = task
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    if tmp.exists():
+        tmp.unlink()
+    con = sqlite3.connect(str(tmp), uri=True)
+    con.execute('PRAGMA journal_mode = OFF')
+    con.execute('PRAGMA synchronous = OFF')
+    con.execute(f'PRAGMA page_size = {page_size if page_size != "auto" else DEFAULT_PAGE_SIZE}')
+    con.execute('ATTACH DATABASE ? AS src', (f'file:{Path(source).as_posix()}?mode=ro',))
+    tables, virtual, rest = _schema(con)
+    con.execute('CREATE TEMP TABLE pack_ids (id INTEGER PRIMARY KEY)')
+    con.execute(f'INSERT INTO temp.pack_ids SELECT id FROM src.parcels WHERE {level} IS ?', (value,))
+    for name, sql in tables + virtual:
+        con.execute(sql)
+    con.execute(f'INSERT INTO main.parcels SELECT * FROM src.parcels WHERE {level} IS ? ORDER BY id', (value,))
+    for name, _sql in tables:
+        if name != 'parcels' and name not in AGGREGATE_TABLES:
+            _copy_table(con, name)
+    for name, sql in virtual:
+        _copy_virtual_table(con, name, sql)
+    # Indexes after the rows, as in the full build
+    for _name, sql in rest:
+        con.execute(sql)
+    con.commit()
+    con.execute('DETACH DATABASE src')
+
+    if has_parcel_stats(con):
+        build_parcel_stats(con)
+    if has_prefix_stats(con):
+        build_prefix_stats(con)
+    counts = parcel_counts(con)
+    bbox = con.execute('SELECT MIN(min_lat), MIN(min_lng), MAX(max_lat), MAX(max_lng) FROM parcels').fetchone()
+    source_version = con.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    con.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', [
+        ('version', version),
+        ('generated_at', version[:10]),
+        ('dataset_digest', digest),
+        ('count_total', str(counts['total'])),
+        ('count_individuel', str(counts['individuel'])),
+        ('count_collectif', str(counts['collectif'])),
+        ('pack_id', pack_id),
+        ('pack_level', level),
+        ('pack_value', value or ''),
+        ('pack_fingerprint', fingerprint),
+        ('source_version', source_version[0] if source_version else ''),
+    ])
+    con.commit()
+    con.close()
+    if finalize:
+        finalize_db(tmp, page_size)
+    os.replace(tmp, path)
+    return {'pack_id': pack_id, 'level': level, 'value': value, 'file': path.name, 'version': version,
+            'digest': digest, 'fingerprint': fingerprint, 'parcel_count': counts['total'], 'count_individuel': counts['individuel'],
+            'count_collectif': counts['collectif'], 'min_lat': bbox[0], 'min_lng': bbox[1], 'max_lat': bbox[2],
+            'max_lng': bbox[3], 'bytes': path.stat().st_size, 'sha256': file_sha256(path)}
+
+
+def read_catalog(path):
+    """{pack_id: row dict} of an existing catalog.db, {} if there is none."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    con = sqlite3.connect(f'file:{path.as_posix()}?mode=ro', uri=True)
+    con.row_factory = sqlite3.Row
+    try:
+        return {row['pack_id']: dict(row) for row in con.execute('SELECT * FROM packs')}
+    except sqlite3.DatabaseError:
+        return {}
+    finally:
+        con.close()
+
+
+def write_catalog(path, entries, level, source_version):
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    if tmp.exists():
+        tmp.unlink()
+    con = sqlite3.connect(str(tmp))
+    con.execute(CATALOG_SCHEMA)
+    con.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+    con.executemany(f"INSERT INTO packs ({', '.join(CATALOG_COLUMNS)}) VALUES ({', '.join('?' * len(CATALOG_COLUMNS))})",
+                    [tuple(e[c] for c in CATALOG_COLUMNS) for e in entries])
+    con.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+        ('level', level),
+        ('source_version', source_version or ''),
+        ('generated_at', date.today().isoformat()),
+        ('pack_count', str(len(entries))),
+        ('parcel_count', str(sum(e['parcel_count'] for e in entries))),
+    ])
+    con.commit()
+    con.close()
+    os.replace(tmp, path)
+
+
+def build_packs(db, out_dir=None, level=DEFAULT_LEVEL, workers=1, finalize=True, page_size=DEFAULT_PAGE_SIZE,
+                full=False):
+    """Write one pack per `level` value of `db` into out_dir (default: packs/ next to db) and catalog.db.
+
+    Returns {'packs', 'written', 'unchanged', 'removed', 'parcels', 'bytes', 'seconds'}.
+    """
+    t0 = time.perf_counter()
+    if level not in PACK_LEVELS:
+        raise ValueError(f'unknown pack level {level!r} (expected one of {", ".join(PACK_LEVELS)})')
+    db = Path(db)
+    out_dir = Path(out_dir) if out_dir else db.parent / 'packs'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    catalog_path = out_dir / CATALOG_NAME
+    previous = {} if full else read_catalog(catalog_path)
+
+    con = sqlite3.connect(f'file:{db.as_posix()}?mode=ro', uri=True)
+    packs = plan_packs(con, level)
+    row = con.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    source_version = row[0] if row else None
+    source = source_fingerprint(con)
+    tables = derived_tables(con)
+    today = date.today().isoformat()
+    entries, tasks = {}, []
+    for pack_id, value, _n in packs:
+        digest = pack_digest(con, level, value)
+        fingerprint = pack_fingerprint(con, level, value, digest, source, tables)
+        old = previous.get(pack_id)
+        path = out_dir / f'{pack_id}.db'
+        same = old and old.get('fingerprint') == fingerprint
+        if (same and old['level'] == level and path.exists()
+                and path.stat().st_size == old['bytes'] and file_sha256(path) == old['sha256']):
+            entries[pack_id] = old
+            continue
+        version = old['version'] if same else f'{today}-{fingerprint[:8]}'
+        tasks.append((str(db), str(path), pack_id, level, value, digest, fingerprint, version, finalize, page_size))
+    con.close()
+
+    if workers <= 1 or len(tasks) <= 1:
+        written = [write_pack(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            written = list(pool.map(write_pack, tasks))
+    for entry in written:
+        entries[entry['pack_id']] = entry
+    ordered = [entries[pack_id] for pack_id, _value, _n in packs]
+    write_catalog(catalog_path, ordered, level, source_version)
+
+    # Packs of the previous catalog that no longer exist (e.g. a renamed commune)
+    removed = 0
+    for pack_id, old in previous.items():
+        if pack_id not in entries and (out_dir / old['file']).exists():
+            (out_dir / old['file']).unlink()
+            removed += 1
+    return {'packs': len(ordered), 'written': len(written), 'unchanged': len(ordered) - len(written),
+            'removed': removed, 'parcels': sum(e['parcel_count'] for e in ordered),
+            'bytes': sum(e['bytes'] for e in ordered), 'seconds': time.perf_counter() - t0, 'catalog': catalog_path}
+
+
+def print_catalog(path):
+    entries = read_catalog(path)
+    if not entries:
+        print(f'{path}: no packs')
+        return
+    print(f"{'pack':<36} {'version':<20} {'parcels':>8} {'indiv':>6} {'coll':>6} {'KB':>8}  bbox")
+    for e in entries.values():
+        bbox = (f"{e['min_lat']:.4f},{e['min_lng']:.4f} {e['max_lat']:.4f},{e['max_lng']:.4f}"
+                if e['min_lat'] is not None else '-')
+        print(f"{e['pack_id']:<36} {e['version']:<20} {e['parcel_count']:>8} {e['count_individuel']:>6} "
+              f"{e['count_collectif']:>6} {e['bytes'] / 1024:8.0f}  {bbox}")
+    print(f"{len(entries)} packs, {sum(e['parcel_count'] for e in entries.values())} parcels, "
+          f"{sum(e['bytes'] for e in entries.values()) / 1048576:.1f} MB")
+
+
+def print_summary(summary):
+    print(f"Packs: {summary['packs']} ({summary['written']} written, {summary['unchanged']} unchanged, "
+          f"{summary['removed']} removed), {summary['parcels']} parcels, {summary['bytes'] / 1048576:.1f} MB "
+          f"in {summary['seconds']:.2f}s; catalog {summary['catalog']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Split a built parcelapp.db into per-area packs with a catalog.')
+    parser.add_argument('db', nargs='?', help='source DB (default prebuilt/parcelapp.db), or the catalog with --list')
+    parser.add_argument('--level', choices=PACK_LEVELS, default=DEFAULT_LEVEL, help='one pack per value of this column')
+    parser.add_argument('--out-dir', help='pack directory (default: packs/ next to the DB)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--no-finalize', action='store_true', help='skip ANALYZE / VACUUM INTO / integrity check')
+    parser.add_argument('--page-size', default=str(DEFAULT_PAGE_SIZE), help="page size of the packs, or 'auto'")
+    parser.add_argument('--full', action='store_true', help='rewrite every pack, even unchanged ones')
+    parser.add_argument('--list', action='store_true', help='print a catalog.db')
+    args = parser.parse_args()
+    if args.list:
+        print_catalog(args.db or f'prebuilt/packs/{CATALOG_NAME}')
+        return
+    db = Path(args.db or 'prebuilt/parcelapp.db')
+    if not db.exists():
+        parser.error(f'{db} not found')
+    page_size = args.page_size if args.page_size == 'auto' else int(args.page_size)
+    try:
+        summary = build_packs(db, args.out_dir, args.level, args.workers, not args.no_finalize, page_size, args.full)
+    except ValueError as e:
+        print(f'ERROR: {e}')
+        sys.exit(1)
+    print_summary(summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+Bounding boxes and the parcels_rtree spatial index for parcelapp.db.
+
+generate_prebuilt_db.py normalizes each geometry once while ingesting (see
+normalize_geometry): lat/lon input is rewritten to lon/lat, 3D positions are
+cut to 2D, and what was done is recorded in parcels.geom_flags. The bbox
+comes out of the same pass, and parcels_rtree is filled from the bbox
+columns once the rows are written, so no separate add_bboxes pass is needed.
+
+Usage (query helper):
+    python scripts/spatial_index.py <db> --parcel 0522010201354 [--expand 0.01]
+    python scripts/spatial_index.py <db> --bbox <min_lat> <min_lng> <max_lat> <max_lng>
+"""
+
+import argparse
+import sqlite3
+import sys
+import time
+
+# Plausible lat/lng window for Senegal, used to detect swapped coordinate order
+SENEGAL_LAT_RANGE = (4.0, 20.0)
+SENEGAL_LNG_RANGE = (-20.0, -4.0)
+
+RTREE_TABLE = 'parcels_rtree'
+
+# parcels.geom_flags bits, set by normalize_geometry at ingest
+GEOM_FLAG_SWAPPED = 1       # stored lat/lon, rewritten to lon/lat
+GEOM_FLAG_3D = 2            # had Z (or more) ordinates, cut to 2D
+GEOM_FLAG_OUT_OF_RANGE = 4  # neither order falls inside the Senegal window; kept as lon/lat
+GEOM_FLAG_INVALID = 8       # missing or malformed coordinates; stored as received
+
+# Nesting depth of positions in GeoJSON coordinates
+_POSITION_DEPTH = {
+    'Point': 0,
+    'LineString': 1,
+    'MultiPoint': 1,
+    'Polygon': 2,
+    'MultiLineString': 2,
+    'MultiPolygon': 3,
+}
+
+
+def _plausible_bbox(min_lat, min_lng, max_lat, max_lng):
+    lat_lo, lat_hi = SENEGAL_LAT_RANGE
+    lng_lo, lng_hi = SENEGAL_LNG_RANGE
+    return (lat_lo <= min_lat <= lat_hi and lat_lo <= max_lat <= lat_hi
+            and lng_lo <= min_lng <= lng_hi and lng_lo <= max_lng <= lng_hi)
+
+
+def _outer_rings(geom):
+    t = geom.get('type')
+    c = geom.get('coordinates')
+    if not isinstance(c, list) or not c:
+        return []
+    if t == 'Polygon':
+        return [c[0]]
+    if t == 'MultiPolygon':
+        return [poly[0] for poly in c if isinstance(poly, list) and poly and isinstance(poly[0], list)]
+    return []
+
+
+def geometry_bbox(geom):
+    """Return (min_lat, min_lng, max_lat, max_lng) for a GeoJSON Polygon/MultiPolygon, or None.
+
+    Coordinates are assumed to be [lon, lat]; if that bbox falls outside the
+    Senegal window but the swapped one fits, the swapped bbox is used (same
+    rule as scripts/add_bboxes.py and the app).
+    """
+    if not isinstance(geom, dict):
+        return None
+    xs = []
+    ys = []
+    try:
+        for ring in _outer_rings(geom):
+            for p in ring:
+                if isinstance(p, (list, tuple)) and len(p) >= 2:
+                    xs.append(float(p[0]))
+                    ys.append(float(p[1]))
+    except (TypeError, ValueError):
+        return None
+    if not xs:
+        return None
+    min_x, max_x = min(xs), max(xs)
+    min_y, max_y = min(ys), max(ys)
+    # try assume lon,lat
+    if _plausible_bbox(min_y, min_x, max_y, max_x):
+        return (min_y, min_x, max_y, max_x)
+    # try swapped (lat,lon)
+    if _plausible_bbox(min_x, min_y, max_x, max_y):
+        return (min_x, min_y, max_x, max_y)
+    # fallback to first assumption
+    return (min_y, min_x, max_y, max_x)
+
+
+def _positions(coords, depth, out):
+    """Append every position of a coordinates tree to out; False if the tree is malformed."""
+    if depth == 0:
+        if (not isinstance(coords, (list, tuple)) or len(coords) < 2
+                or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in coords)):
+            return False
+        out.append(coords)
+        return True
+    if not isinstance(coords, list):
+        return False
+    return all(_positions(c, depth - 1, out) for c in coords)
+
+
+def _rebuild(coords, depth, swap):
+    if depth == 0:
+        return [coords[1], coords[0]] if swap else [coords[0], coords[1]]
+    return [_rebuild(c, depth - 1, swap) for c in coords]
+
+
+def normalize_geometry(geom):
+    """Return (geometry, geom_flags, bbox) with the geometry in canonical 2D lon/lat.
+
+    Positions are checked once against the Senegal window: if only the
+    swapped order fits, every position is rewritten to lon/lat, and Z (or
+    further) ordinates are dropped. bbox is (min_lat, min_lng, max_lat,
+    max_lng) of the result. Geometries that cannot be read are returned
+    unchanged with GEOM_FLAG_INVALID and a None bbox.
+    """
+    depth = _POSITION_DEPTH.get(geom.get('type')) if isinstance(geom, dict) else None
+    positions = []
+    if depth is None or not _positions(geom.get('coordinates'), depth, positions) or not positions:
+        return geom, GEOM_FLAG_INVALID, None
+
+    flags = 0
+    if any(len(p) > 2 for p in positions):
+        flags |= GEOM_FLAG_3D
+    xs = [p[0] for p in positions]
+    ys = [p[1] for p in positions]
+    min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+    swap = False
+    if not _plausible_bbox(min_y, min_x, max_y, max_x):
+        if _plausible_bbox(min_x, min_y, max_x, max_y):
+            swap = True
+            flags |= GEOM_FLAG_SWAPPED
+        else:
+            flags |= GEOM_FLAG_OUT_OF_RANGE
+    if flags & (GEOM_FLAG_SWAPPED | GEOM_FLAG_3D):
+        out = dict(geom)
+        out['coordinates'] = _rebuild(geom['coordinates'], depth, swap)
+        geom = out
+    if swap:
+        return geom, flags, (float(min_x), float(min_y), float(max_x), float(max_y))
+    return geom, flags, (float(min_y), float(min_x), float(max_y), float(max_x))
+
+
+def has_canonical_geometry(con):
+    """True if the parcels geometries were normalized at ingest (geom_flags column present)."""
+    return any(r[1] == 'geom_flags' for r in con.execute('PRAGMA table_info(parcels)'))
+
+
+def outer_rings_latlng(geom, canonical=False):
+    """Outer rings of a Polygon/MultiPolygon as lists of (lat, lng), in the order geometry_bbox picks.
+
+    With canonical=True the geometry is known to be lon/lat (normalize_geometry)
+    and the order check is skipped.
+    """
+    if not isinstance(geom, dict):
+        return []
+    rings = []
+    try:
+        for ring in _outer_rings(geom):
+            pts = [(float(p[1]), float(p[0])) for p in ring if isinstance(p, (list, tuple)) and len(p) >= 2]
+            if pts:
+                rings.append(pts)
+    except (TypeError, ValueError):
+        return []
+    if not rings or canonical:
+        return rings
+    lats = [lat for ring in rings for lat, _ in ring]
+    lngs = [lng for ring in rings for _, lng in ring]
+    if (not _plausible_bbox(min(lats), min(lngs), max(lats), max(lngs))
+            and _plausible_bbox(min(lngs), min(lats), max(lngs), max(lats))):
+        rings = [[(lng, lat) for lat, lng in ring] for ring in rings]
+    return rings
+
+
+def geometry_centroid(geom, canonical=False):
+    """(lat, lng) vertex mean of the first outer ring, or None.
+
+    Same rule as getNeighborParcels in src/data/database.ts: lon/lat first,
+    swapped when only the swapped centroid falls inside Senegal (skipped when
+    canonical=True).
+    """
+    rings = _outer_rings(geom) if isinstance(geom, dict) else []
+    if not rings:
+        return None
+    try:
+        pts = [(float(p[0]), float(p[1])) for p in rings[0] if isinstance(p, (list, tuple)) and len(p) >= 2]
+    except (TypeError, ValueError):
+        return None
+    if not pts:
+        return None
+    a = sum(p[0] for p in pts) / len(pts)
+    b = sum(p[1] for p in pts) / len(pts)
+    if not canonical and not _plausible_bbox(b, a, b, a) and _plausible_bbox(a, b, a, b):
+        return (a, b)
+    return (b, a)
+
+
+def create_rtree(con):
+    """Create the R*Tree virtual table keyed by parcels.id."""
+    con.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(
+        id,
+        min_lng, max_lng,
+        min_lat, max_lat
+    );''')
+
+
+def populate_rtree(con, ids=None, deleted_ids=()):
+    """Fill parcels_rtree from the bbox columns of parcels.
+
+    With ids=None the whole table is (re)loaded; otherwise only the given
+    parcel ids are refreshed and deleted_ids are removed. Returns the number
+    of rows written.
+    """
+    create_rtree(con)
+    select = '''SELECT id, min_lng, max_lng, min_lat, max_lat FROM parcels
+        WHERE min_lat IS NOT NULL AND min_lng IS NOT NULL AND max_lat IS NOT NULL AND max_lng IS NOT NULL'''
+    if ids is None:
+        con.execute(f'DELETE FROM {RTREE_TABLE}')
+        return con.execute(f'INSERT INTO {RTREE_TABLE} {select}').rowcount
+    stale = [(pid,) for pid in list(ids) + list(deleted_ids)]
+    con.executemany(f'DELETE FROM {RTREE_TABLE} WHERE id = ?', stale)
+    written = 0
+    for (pid,) in stale:
+        written += con.execute(f'INSERT INTO {RTREE_TABLE} {select} AND id = ?', (pid,)).rowcount
+    return written
+
+
+def has_rtree(con):
+    return con.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (RTREE_TABLE,)).fetchone() is not None
+
+
+def bbox_candidates(con, min_lat, min_lng, max_lat, max_lng):
+    """Return ids of parcels whose bbox intersects the given bbox.
+
+    Uses parcels_rtree when present (the R*Tree stores float32 boxes rounded
+    outwards, so the result is a superset that callers may refine with the
+    exact bbox columns); falls back to a scan of the bbox columns otherwise.
+    """
+    if has_rtree(con):
+        sql = f'''SELECT id FROM {RTREE_TABLE}
+            WHERE max_lng >= ? AND min_lng <= ? AND max_lat >= ? AND min_lat <= ?'''
+        return [r[0] for r in con.execute(sql, (min_lng, max_lng, min_lat, max_lat))]
+    sql = '''SELECT id FROM parcels
+        WHERE min_lat IS NOT NULL AND NOT (max_lat < ? OR min_lat > ? OR max_lng < ? OR min_lng > ?)'''
+    return [r[0] for r in con.execute(sql, (min_lat, max_lat, min_lng, max_lng))]
+
+
+def parcel_bbox(con, num_parcel):
+    row = con.execute('SELECT min_lat, min_lng, max_lat, max_lng FROM parcels WHERE num_parcel = ? LIMIT 1',
+                      (num_parcel,)).fetchone()
+    if not row or any(v is None for v in row):
+        return None
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query parcel ids by bounding box using parcels_rtree.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--parcel', help='use the bbox of this num_parcel')
+    group.add_argument('--bbox', nargs=4, type=float, metavar=('MIN_LAT', 'MIN_LNG', 'MAX_LAT', 'MAX_LNG'))
+    parser.add_argument('--expand', type=float, default=0.0, help='grow the bbox by this many degrees on each side')
+    args = parser.parse_args()
+
+    con = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    if args.parcel:
+        bbox = parcel_bbox(con, args.parcel)
+        if not bbox:
+            print(f'parcel {args.parcel} not found or has no bbox')
+            sys.exit(1)
+    else:
+        bbox = args.bbox
+    min_lat, min_lng, max_lat, max_lng = bbox
+    e = args.expand
+    t0 = time.perf_counter()
+    ids = bbox_candidates(con, min_lat - e, min_lng - e, max_lat + e, max_lng + e)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    print(f"{len(ids)} candidates in {elapsed_ms:.3f} ms ({'rtree' if has_rtree(con) else 'column scan'})")
+    for pid in ids[:50]:
+        print(pid)
+    con.close()
+
+
+if __name__ == '__main__':
+    main()
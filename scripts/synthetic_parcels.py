@@ -0,0 +1,378 @@
+"""
+Synthetic parcel datasets (GeoJSONL) at any scale, for load testing the pipeline.
+
+Parcels are laid out village by village as jittered grids: neighboring parcels
+share their corner vertices and the extra vertices along their common edge
+exactly, as in the surveyed data, with a few cells left empty (tracks, gaps
+between surveys). Rows are generated one at a time, so memory use does not
+grow with the dataset size.
+
+Properties follow the Kobo schema of a template GeoJSONL (by default
+src/GeojsonL_to_normalise/Parcels_Collectives.geojsonl): its key list, in
+order, and per-key null rates and categorical values. Names, ID numbers,
+dates, photo and signature files and URLs are generated, never copied.
+Collectives have 2 or more persons (Quel_est_le_nombre_d_affectata, person
+blocks Prenom_001, Nom_002, ... filled up to that count). Individuals also get
+Typ_pers / Prenom / Nom. Villages can use renamed variant keys (Vocation,
+typeusage, village_name, ...) the way different export batches do, so the
+canonicalize_properties aliases are exercised.
+
+Usage:
+    python scripts/synthetic_parcels.py --scale 10 [--out-dir synthetic] [--seed 1]
+    python scripts/synthetic_parcels.py --count 2000000 --collective-share 0.2 --out-dir /data/synthetic
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import time
+from pathlib import Path
+
+# Parcels in the current survey (individuels + collectives), the unit of --scale
+BASELINE_PARCELS = 2056
+# Share of collective parcels in the current survey (254 of 2,056)
+DEFAULT_COLLECTIVE_SHARE = 0.124
+DEFAULT_TEMPLATE = Path(__file__).resolve().parents[1] / 'src' / 'GeojsonL_to_normalise' / 'Parcels_Collectives.geojsonl'
+OUTPUT_NAMES = {'individuel': 'Parcels_Individuels.geojsonl', 'collectif': 'Parcels_Collectives.geojsonl'}
+# Template features read for the schema and value pools
+TEMPLATE_SAMPLE = 5000
+
+# Village grids
+PARCELS_PER_VILLAGE = (150, 650)
+CELL_SIZE_M = (60.0, 200.0)
+NODE_JITTER = 0.25          # of a cell, per axis
+EDGE_VERTICES = (0, 3)      # extra vertices per shared edge
+EDGE_OFFSET = 0.06          # of a cell, perpendicular to the edge
+GAP_SHARE = 0.05            # empty grid cells
+VILLAGES_PER_COMMUNE = 10
+# Villages are placed on a lattice over Senegal (lon, lat), filled row by row northwards
+LATTICE_ORIGIN = (-16.8, 12.4)
+LATTICE_WIDTH_DEG = 5.2
+LATTICE_SPACING_M = 4500.0
+METERS_PER_DEGREE = 111320.0
+
+# Share of villages exported with renamed keys, and the renames (template key -> variant key)
+DEFAULT_VARIANT_SHARE = 0.3
+KEY_VARIANTS = (
+    {'Vocation_1': 'Vocation', 'type_usa': 'typeusage'},
+    {'type_usa': 'type_usag1', 'Village': 'village_name'},
+    {'Vocation_1': 'vocation_1', 'type_usa': 'Type_Usage', 'Village': 'Village_Sene'},
+)
+INDIVIDUAL_KEYS = ('Typ_pers', 'Prenom', 'Nom', 'Denominat')
+
+FIRST_NAMES = ('Oumou', 'Djiby', 'Awa', 'Mamadou', 'Fatou', 'Ibrahima', 'Aminata', 'Moussa', 'Khady', 'Cheikh',
+               'Mariama', 'Ousmane', 'Ndeye', 'Abdoulaye', 'Coumba', 'Samba', 'Aissatou', 'Modou', 'Binta', 'Alioune')
+LAST_NAMES = ('NDIAYE', 'DIOP', 'FALL', 'SOW', 'BA', 'DIALLO', 'GAYE', 'SARR', 'CISSE', 'KANE', 'MBAYE', 'FAYE',
+              'NDEMANE', 'DIOUF', 'SECK', 'TOURE', 'CAMARA', 'SY', 'WADE', 'THIAM')
+SYLLABLES = ('ba', 'di', 'ko', 'ar', 'ma', 'ne', 'sa', 'lo', 'ou', 'fa', 'ta', 'gui', 'ndi', 'sou', 'ke', 'la', 'mb',
+             'to', 'dia', 'kou')
+
+# Person blocks: Prenom_001, Nom_002, Date_nais3, Recto_AF4_URL, ...
+_PERSON_KEY = re.compile(r'^(Prenom|Nom|Sexe|Date_nais|Dat_naiss|Dat_nais|Nature_ID|Natur_ID|Dat_deliv|Dat_deli|'
+                         r'Dat_dliv|Num_piece|Num_piec|Recto_AF|Verso_AF|Parnt_af|Residence|Residenc|Signature|'
+                         r'Signatur)_?0*(\d+)(_URL)?$')
+_ADMIN_KEYS = ('grappeSenegal', 'regionSenegal', 'departmentSenegal', 'arrondissementSenegal', 'communeSenegal')
+
+
+def _value_kind(key):
+    """How a non-null value of `key` is produced: generated for personal / unique data, else 'pool'."""
+    if key.endswith('_URL'):
+        return 'url'
+    if re.match(r'(Recto|Verso|Signat|Photo)', key):
+        return 'photo'
+    if re.match(r'(Prenom|Pren_)', key) or key == 'geomaticien':
+        return 'first_name'
+    if re.match(r'Nom(_|$)', key):
+        return 'last_name'
+    if key == 'Topographe':
+        return 'full_name'
+    if re.match(r'(Num_piec|Numero_|Tel_m_|Num_Expl|Num_appr|num_decis)', key):
+        return 'number'
+    if key == 'today' or re.match(r'Dat', key):
+        return 'date'
+    if re.match(r'(Residenc|Lieu_nais)', key):
+        return 'place'
+    return 'pool'
+
+
+class Template:
+    """Key list, null rates and categorical value pools of a template GeoJSONL."""
+
+    def __init__(self, path, sample=TEMPLATE_SAMPLE):
+        counts, pools, self.keys, rows = {}, {}, None, 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                props = (json.loads(line).get('properties') or {})
+                if self.keys is None:
+                    self.keys = list(props)
+                rows += 1
+                for key, value in props.items():
+                    if value is not None:
+                        counts[key] = counts.get(key, 0) + 1
+                        pool = pools.setdefault(key, [])
+                        if len(pool) < 200:
+                            pool.append(value)
+                if rows >= sample:
+                    break
+        if not self.keys:
+            raise ValueError(f'{path} has no features')
+        self.rates = {key: counts.get(key, 0) / rows for key in self.keys}
+        self.pools = pools
+        self.max_persons = max([int(m.group(2)) for m in map(_PERSON_KEY.match, self.keys) if m] or [1])
+        self.person_counts = [n for n in (_int(v) for v in pools.get('Quel_est_le_nombre_d_affectata', ())) if n]
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class DatasetGenerator:
+    """Streams synthetic parcels; see the module docstring."""
+
+    def __init__(self, template, seed=1, collective_share=DEFAULT_COLLECTIVE_SHARE,
+                 variant_share=DEFAULT_VARIANT_SHARE):
+        self.template = template
+        self.rng = random.Random(seed)
+        self.collective_share = collective_share
+        self.variant_share = variant_share
+        self.plans = {}
+        self.fid = 0
+        self._commune = None
+
+    # -- properties ---------------------------------------------------------------
+
+    def _plan(self, parcel_type, variant):
+        """[(output key, template key, kind, person index or None, non-null rate)] per parcel type and key variant, cached."""
+        cache_key = (parcel_type, variant)
+        if cache_key not in self.plans:
+            renames = KEY_VARIANTS[variant] if variant is not None else {}
+            keys = list(self.template.keys)
+            if parcel_type == 'individuel':
+                at = keys.index('Quel_est_le_nombre_d_affectata') + 1 if 'Quel_est_le_nombre_d_affectata' in keys else len(keys)
+                keys[at:at] = [k for k in INDIVIDUAL_KEYS if k not in keys]
+            plan = []
+            for key in keys:
+                match = _PERSON_KEY.match(key)
+                rate = self.template.rates.get(key, 1.0)
+                if match:
+                    # Null rate of the same field for the first person
+                    first = next((k for k in self.template.keys if (m := _PERSON_KEY.match(k))
+                                  and m.group(1) == match.group(1) and m.group(3) == match.group(3)
+                                  and int(m.group(2)) == 1), None)
+                    rate = self.template.rates.get(first, rate) if first else rate
+                plan.append((renames.get(key, key), key, _value_kind(key), int(match.group(2)) if match else None, rate))
+            self.plans[cache_key] = plan
+        return self.plans[cache_key]
+
+    def _date(self, start_year=1950, end_year=2026):
+        return f'{self.rng.randint(start_year, end_year)}-{self.rng.randint(1, 12):02d}-{self.rng.randint(1, 28):02d}'
+
+    def _value(self, key, kind, village):
+        rng = self.rng
+        if kind == 'pool':
+            pool = self.template.pools.get(key)
+            return rng.choice(pool) if pool else None
+        if kind == 'first_name':
+            return rng.choice(FIRST_NAMES)
+        if kind == 'last_name':
+            return rng.choice(LAST_NAMES)
+        if kind == 'full_name':
+            return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        if kind == 'number':
+            return str(rng.randrange(10 ** 12, 10 ** 13))
+        if kind == 'date':
+            return self._date(2025 if key == 'today' else 1950)
+        if kind == 'photo':
+            return f'{rng.randrange(1_700_000_000_000, 1_800_000_000_000)}.jpg'
+        if kind == 'url':
+            return f'https://kf.kobotoolbox.org/api/v2/assets/synthetic/data/{rng.randrange(10 ** 9)}/attachments/{rng.randrange(16 ** 12):012x}/'
+        if kind == 'place':
+            return village['title']
+        return None
+
+    def properties(self, parcel_type, village, num_parcel):
+        self.fid += 1
+        rng = self.rng
+        if parcel_type == 'collectif':
+            counts = self.template.person_counts
+            persons = min(max(2, rng.choice(counts) if counts else rng.randint(2, 4)), self.template.max_persons)
+        else:
+            persons = 1
+        props = {}
+        for key, source, kind, person, rate in self._plan(parcel_type, village['variant']):
+            if person is not None:
+                props[key] = self._value(source, kind, village) if person <= persons and rng.random() < rate else None
+            elif rng.random() < rate:
+                props[key] = self._value(source, kind, village)
+            else:
+                props[key] = None
+        props.update({
+            'fid': self.fid, 'Num_parcel': num_parcel,
+            'Quel_est_le_nombre_d_affectata': str(persons),
+        })
+        for key in _ADMIN_KEYS:
+            if key in props:
+                props[key] = village[key]
+        village_key = KEY_VARIANTS[village['variant']].get('Village', 'Village') if village['variant'] is not None else 'Village'
+        props[village_key] = village['name']
+        if parcel_type == 'individuel':
+            if 'Cas_de_Personne_001' in props:
+                props['Cas_de_Personne_001'] = 'Une_Personne_Physique'
+            props.update({'Typ_pers': 'Personne_Physique', 'Prenom': rng.choice(FIRST_NAMES),
+                          'Nom': rng.choice(LAST_NAMES), 'Denominat': None})
+        return props
+
+    # -- villages and geometry ----------------------------------------------------
+
+    def _name(self, parts=(2, 3)):
+        return ''.join(self.rng.choice(SYLLABLES) for _ in range(self.rng.randint(*parts)))
+
+    def village(self, index):
+        """Location, grid and administrative names of village `index` (lattice position + random offset)."""
+        rng = self.rng
+        commune = index // VILLAGES_PER_COMMUNE
+        if index % VILLAGES_PER_COMMUNE == 0:
+            region, dept, arr = commune % 14, (commune // 14) % 3, (commune // 42) % 4
+            self._commune = {
+                'code': f'{region + 1:02d}{dept + 1}{arr + 1:02d}{(commune // 168) % 1000:03d}',
+                'grappeSenegal': f'GRAPPE_{region + 1:02d}', 'regionSenegal': f'REGION_{region + 1:02d}',
+                'departmentSenegal': f'DEPARTEMENT_{region + 1:02d}{dept + 1}',
+                'arrondissementSenegal': f'ARRONDISSEMENT_{region + 1:02d}{dept + 1}{arr + 1}',
+                'communeSenegal': self._name().upper(),
+            }
+        per_row = max(1, int(LATTICE_WIDTH_DEG * METERS_PER_DEGREE * math.cos(math.radians(14)) / LATTICE_SPACING_M))
+        lat = LATTICE_ORIGIN[1] + (index // per_row) * LATTICE_SPACING_M / METERS_PER_DEGREE
+        m_per_deg_lon = METERS_PER_DEGREE * math.cos(math.radians(lat))
+        lon = LATTICE_ORIGIN[0] + (index % per_row) * LATTICE_SPACING_M / m_per_deg_lon
+        target = rng.randint(*PARCELS_PER_VILLAGE)
+        side = math.ceil(math.sqrt(target / (1 - GAP_SHARE)))
+        # Keep the whole grid (with jitter) inside its lattice cell
+        cell = min(rng.uniform(*CELL_SIZE_M), LATTICE_SPACING_M * 0.8 / (side + 1))
+        name = self._name((2, 4))
+        variant = rng.randrange(len(KEY_VARIANTS)) if rng.random() < self.variant_share else None
+        return dict(self._commune, name=name, title=name.replace('_', ' ').title(), variant=variant,
+                    lon=lon, lat=lat, dx=cell / m_per_deg_lon, dy=cell / METERS_PER_DEGREE,
+                    cols=side, rows=math.ceil(target / side / (1 - GAP_SHARE)), target=target)
+
+    def _node(self, v, i, j):
+        rng = self.rng
+        return (v['lon'] + (i + rng.uniform(-NODE_JITTER, NODE_JITTER)) * v['dx'],
+                v['lat'] + (j + rng.uniform(-NODE_JITTER, NODE_JITTER)) * v['dy'])
+
+    def _edge(self, v, a, b):
+        """Extra vertices strictly between nodes a and b, in a -> b order."""
+        rng = self.rng
+        n = rng.randint(*EDGE_VERTICES)
+        if not n:
+            return []
+        ex, ey = b[0] - a[0], b[1] - a[1]
+        # Unit normal in cell units, so the offset is isotropic on the ground
+        nx, ny = -ey / v['dy'], ex / v['dx']
+        norm = math.hypot(nx, ny) or 1.0
+        out = []
+        for t in sorted(rng.uniform(0.15, 0.85) for _ in range(n)):
+            off = rng.uniform(-EDGE_OFFSET, EDGE_OFFSET) / norm
+            out.append((a[0] + t * ex + off * nx * v['dx'], a[1] + t * ey + off * ny * v['dy']))
+        return out
+
+    def village_cells(self, v):
+        """Yield (i, j, exterior ring) for the cells of village grid `v`, row by row (south to north).
+
+        Rings are counterclockwise lon/lat, closed; adjacent cells share
+        nodes and edge vertices exactly.
+        """
+        cols, rows = v['cols'], v['rows']
+        nodes = [self._node(v, i, 0) for i in range(cols + 1)]
+        bottom = [self._edge(v, nodes[i], nodes[i + 1]) for i in range(cols)]
+        for j in range(rows):
+            top_nodes = [self._node(v, i, j + 1) for i in range(cols + 1)]
+            top = [self._edge(v, top_nodes[i], top_nodes[i + 1]) for i in range(cols)]
+            sides = [self._edge(v, nodes[i], top_nodes[i]) for i in range(cols + 1)]
+            for i in range(cols):
+                ring = ([nodes[i]] + bottom[i] + [nodes[i + 1]] + sides[i + 1] + [top_nodes[i + 1]]
+                        + top[i][::-1] + [top_nodes[i]] + sides[i][::-1] + [nodes[i]])
+                yield i, j, ring
+            nodes, bottom = top_nodes, top
+
+    def features(self, count):
+        """Yield (parcel type, GeoJSON Feature) for `count` parcels."""
+        produced = village_index = 0
+        while produced < count:
+            v = self.village(village_index)
+            village_index += 1
+            seq = 0
+            for _i, _j, ring in self.village_cells(v):
+                if produced >= count or seq >= v['target']:
+                    break
+                if self.rng.random() < GAP_SHARE:
+                    continue
+                seq += 1
+                produced += 1
+                parcel_type = 'collectif' if self.rng.random() < self.collective_share else 'individuel'
+                num_parcel = f"{v['code']}{(village_index - 1) % VILLAGES_PER_COMMUNE}{seq:04d}"
+                yield parcel_type, {
+                    'type': 'Feature',
+                    'properties': self.properties(parcel_type, v, num_parcel),
+                    # 3D positions with Z = 0, like the Kobo exports
+                    'geometry': {'type': 'Polygon',
+                                 'coordinates': [[[round(x, 7), round(y, 7), 0.0] for x, y in ring]]},
+                }
+
+
+def generate_dataset(count, out_dir, seed=1, collective_share=DEFAULT_COLLECTIVE_SHARE,
+                     variant_share=DEFAULT_VARIANT_SHARE, template=DEFAULT_TEMPLATE):
+    """Write the individuels / collectives GeoJSONL pair for `count` parcels into out_dir.
+
+    Returns {'paths': {parcel type: Path}, 'counts': {...}, 'bytes': {...}, 'seconds': float}.
+    """
+    t0 = time.perf_counter()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    generator = DatasetGenerator(Template(template), seed, collective_share, variant_share)
+    paths = {t: out_dir / name for t, name in OUTPUT_NAMES.items()}
+    counts = dict.fromkeys(paths, 0)
+    files = {t: open(p, 'w', encoding='utf-8') for t, p in paths.items()}
+    try:
+        for parcel_type, feature in generator.features(count):
+            files[parcel_type].write(json.dumps(feature, ensure_ascii=False) + '\n')
+            counts[parcel_type] += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return {'paths': paths, 'counts': counts, 'bytes': {t: p.stat().st_size for t, p in paths.items()},
+            'seconds': time.perf_counter() - t0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic parcel dataset (GeoJSONL) for benchmarks.')
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--count', type=int, help='number of parcels')
+    size.add_argument('--scale', type=float, default=1.0,
+                      help=f'number of parcels as a multiple of the current survey ({BASELINE_PARCELS})')
+    parser.add_argument('--out-dir', default='synthetic')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--collective-share', type=float, default=DEFAULT_COLLECTIVE_SHARE)
+    parser.add_argument('--variant-share', type=float, default=DEFAULT_VARIANT_SHARE,
+                        help='share of villages exported with renamed (variant) keys')
+    parser.add_argument('--template', default=str(DEFAULT_TEMPLATE), help='GeoJSONL whose Kobo schema is reproduced')
+    args = parser.parse_args()
+    if not Path(args.template).exists():
+        parser.error(f'template not found: {args.template}')
+
+    count = args.count if args.count is not None else round(args.scale * BASELINE_PARCELS)
+    result = generate_dataset(count, args.out_dir, args.seed, args.collective_share, args.variant_share, args.template)
+    for parcel_type, path in result['paths'].items():
+        print(f"{path}: {result['counts'][parcel_type]} {parcel_type} parcels, {result['bytes'][parcel_type]} bytes")
+    print(f"Generated {count} parcels in {result['seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Vertical partitioning of the parcels table.
+
+Search and list queries only filter and display scalar columns, but in the
+wide layout every parcels row also carries the multi-KB geometry and
+properties text, so a scan or a page of results reads mostly geometry pages.
+The split layout (generate_prebuilt_db.py --layout split) keeps the scalar
+columns in parcels and moves
+    geometry, geometry_bin                                 -> parcel_geometry
+    properties, properties_schema, properties_values       -> parcel_properties
+into side tables keyed by the parcel id. The view parcels_wide joins them back
+into the old row shape for readers that need it; joins by id are primary-key
+lookups. The app bundle stays wide until its queries read parcels_wide.
+
+Incremental builds merge a split DB back (merge_parcels) before applying the
+diff and split it again at the end.
+
+Usage:
+    python scripts/table_layout.py split|merge <parcelapp.db>
+"""
+
+import re
+import sqlite3
+import sys
+import time
+
+LAYOUTS = ('wide', 'split')
+COMPAT_VIEW = 'parcels_wide'
+
+# Side table -> (column, declared type) moved out of parcels
+SIDE_TABLES = {
+    'parcel_geometry': (('geometry', 'TEXT'), ('geometry_bin', 'BLOB')),
+    'parcel_properties': (('properties', 'TEXT'), ('properties_schema', 'INTEGER'), ('properties_values', 'TEXT')),
+}
+SIDE_COLUMNS = {column: table for table, columns in SIDE_TABLES.items() for column, _ in columns}
+
+_SIDE_COLUMN_RE = re.compile(r'\b(' + '|'.join(SIDE_COLUMNS) + r')\b')
+
+
+def is_split(con):
+    """True if parcels has been split into parcels + side tables (parcels_wide exists)."""
+    return con.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?", (COMPAT_VIEW,)).fetchone() is not None
+
+
+def mentions_side_columns(*sql_parts):
+    """True if any of the SQL fragments names a column that split_parcels moves out of parcels."""
+    return any(_SIDE_COLUMN_RE.search(part or '') for part in sql_parts)
+
+
+def parcel_source(con, *sql_parts):
+    """Table to read parcels from: parcels_wide when split and the SQL mentions a moved column."""
+    return COMPAT_VIEW if mentions_side_columns(*sql_parts) and is_split(con) else 'parcels'
+
+
+def _joins(columns, side_tables, alias):
+    exprs, joins = {}, []
+    for column in columns:
+        table = SIDE_COLUMNS.get(column)
+        if table not in side_tables:
+            exprs[column] = f'{alias}.{column}'
+            continue
+        exprs[column] = f'_{table}.{column}'
+        join = f' LEFT JOIN {table} _{table} ON _{table}.id = {alias}.id'
+        if join not in joins:
+            joins.append(join)
+    return exprs, ''.join(joins)
+
+
+def side_joins(con, columns, alias='p'):
+    """({column: qualified expression}, JOIN clause) to read `columns` next to parcels `alias`.
+
+    Moved columns come from LEFT JOINs on their side table by id when the DB
+    is split; otherwise everything is read from `alias`.
+    """
+    return _joins(columns, SIDE_TABLES if is_split(con) else (), alias)
+
+
+def _columns(con, table):
+    return [r[1] for r in con.execute(f'PRAGMA table_info({table})')]
+
+
+def split_parcels(con, wide_order=None):
+    """Move the geometry / properties columns into side tables and create parcels_wide.
+
+    `wide_order` is the column order of the view (default: the current
+    parcels order, i.e. the wide table as built). Returns the number of rows
+    moved.
+    """
+    if is_split(con):
+        return 0
+    columns = _columns(con, 'parcels')
+    wide_order = [c for c in (wide_order or columns) if c in columns]
+    rows = con.execute('SELECT COUNT(*) FROM parcels').fetchone()[0]
+    for table, side in SIDE_TABLES.items():
+        present = [(c, t) for c, t in side if c in columns]
+        if not present:
+            continue
+        con.execute(f'DROP TABLE IF EXISTS {table}')
+        con.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, {', '.join(f'{c} {t}' for c, t in present)})")
+        names = ', '.join(c for c, _ in present)
+        con.execute(f'INSERT INTO {table} (id, {names}) SELECT id, {names} FROM parcels ORDER BY id')
+        # Each DROP COLUMN rewrites parcels: empty the columns first so only one rewrite moves the big rows
+        con.execute(f"UPDATE parcels SET {', '.join(f'{c} = NULL' for c, _ in present)}")
+        for column, _ in present:
+            con.execute(f'ALTER TABLE parcels DROP COLUMN {column}')
+    exprs, joins = _joins(wide_order, SIDE_TABLES, 'p')
+    select = ', '.join(f'{expr} AS {column}' for column, expr in exprs.items())
+    con.execute(f'CREATE VIEW {COMPAT_VIEW} AS SELECT {select} FROM parcels p{joins}')
+    return rows
+
+
+def merge_parcels(con):
+    """Undo split_parcels: move the side columns back into parcels and drop the side tables.
+
+    Returns the wide column order (the view's), to pass back to split_parcels.
+    """
+    if not is_split(con):
+        return None
+    wide_order = _columns(con, COMPAT_VIEW)
+    tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    con.execute(f'DROP VIEW {COMPAT_VIEW}')
+    for table, side in SIDE_TABLES.items():
+        if table not in tables:
+            continue
+        present = [(c, t) for c, t in side if c in _columns(con, table)]
+        for column, ctype in present:
+            con.execute(f'ALTER TABLE parcels ADD COLUMN {column} {ctype}')
+        assignments = ', '.join(f'{c} = s.{c}' for c, _ in present)
+        con.execute(f'UPDATE parcels SET {assignments} FROM {table} s WHERE s.id = parcels.id')
+        con.execute(f'DROP TABLE {table}')
+    return wide_order
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] not in ('split', 'merge'):
+        print('Usage: python scripts/table_layout.py split|merge <parcelapp.db>', file=sys.stderr)
+        sys.exit(1)
+    con = sqlite3.connect(sys.argv[2])
+    t0 = time.perf_counter()
+    if sys.argv[1] == 'split':
+        rows = split_parcels(con)
+        print(f'split {rows} parcels into parcels + {", ".join(SIDE_TABLES)} ({COMPAT_VIEW} view) '
+              f'in {time.perf_counter() - t0:.2f}s')
+    else:
+        merge_parcels(con)
+        print(f'merged the side tables back into parcels in {time.perf_counter() - t0:.2f}s')
+    con.commit()
+    con.execute('VACUUM')
+    con.close()
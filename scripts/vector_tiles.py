@@ -0,0 +1,550 @@
+"""
+Offline vector tile pyramid (MBTiles) of the parcels in parcelapp.db.
+
+Every parcel polygon is projected once to Web Mercator, then for each zoom
+in [minzoom, maxzoom] and each tile its bbox touches it is clipped to the
+tile (plus a TILE_BUFFER margin), quantized to the TILE_EXTENT grid (which
+drops the vertices closer than a tile pixel) and encoded as a Mapbox Vector
+Tile (layer 'parcels', feature id = parcels.id, attributes num_parcel,
+parcel_type, village). Tiles are gzip-compressed into an MBTiles 1.3 file, so
+a viewport costs one tile read whatever the number of parcels in view.
+The protobuf encoding is written out here (stdlib only).
+
+Tiles are encoded on a process pool. The MBTiles file keeps a tile_parcels
+table (parcel id, content hash, bbox); the next run only re-encodes the tiles
+covering the old or new bbox of parcels that were added, changed or deleted.
+A zoom range change or --full rebuilds everything.
+
+Usage:
+    python scripts/vector_tiles.py [db] [--out prebuilt/parcels.mbtiles] [--minzoom 10] [--maxzoom 16]
+                                   [--workers N] [--full]
+    python scripts/vector_tiles.py --out prebuilt/parcels.mbtiles --inspect 14/7402/7356
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from geometry_codec import load_geometry
+from spatial_index import has_canonical_geometry, normalize_geometry
+from table_layout import COMPAT_VIEW, is_split
+
+LAYER_NAME = 'parcels'
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+DEFAULT_MINZOOM = 10
+DEFAULT_MAXZOOM = 16
+FEATURE_ATTRIBUTES = ('num_parcel', 'parcel_type', 'village')
+# Tiles per worker task
+TILES_PER_TASK = 256
+
+STATE_TABLE = 'tile_parcels'
+
+_EARTH_RADIUS = 6378137.0
+_ORIGIN = math.pi * _EARTH_RADIUS
+_MAX_LAT = 85.0511287798
+
+
+# -- projection and tile math ---------------------------------------------------
+
+def mercator(lng, lat):
+    lat = max(-_MAX_LAT, min(_MAX_LAT, lat))
+    return (_EARTH_RADIUS * math.radians(lng),
+            _EARTH_RADIUS * math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)))
+
+
+def tile_range(bounds, z, buffer=TILE_BUFFER / TILE_EXTENT):
+    """(x0, y0, x1, y1) XYZ tiles whose buffered extent meets the mercator `bounds` (minx, miny, maxx, maxy)."""
+    n = 1 << z
+    size = 2 * _ORIGIN / n
+    pad = buffer * size
+    minx, miny, maxx, maxy = bounds
+    x0 = int((minx - pad + _ORIGIN) // size)
+    x1 = int((maxx + pad + _ORIGIN) // size)
+    y0 = int((_ORIGIN - maxy - pad) // size)
+    y1 = int((_ORIGIN - miny + pad) // size)
+    return max(0, x0), max(0, y0), min(n - 1, x1), min(n - 1, y1)
+
+
+def tile_bounds_lnglat(z, x, y):
+    n = 1 << z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+# -- parcels --------------------------------------------------------------------
+
+def _polygons(geom):
+    if geom.get('type') == 'Polygon':
+        return [geom.get('coordinates') or []]
+    if geom.get('type') == 'MultiPolygon':
+        return geom.get('coordinates') or []
+    return []
+
+
+def load_parcels(con):
+    """{id: (attributes tuple, content hash, mercator bounds, polygons as mercator rings)}."""
+    source = COMPAT_VIEW if is_split(con) else 'parcels'
+    columns = {r[1] for r in con.execute(f'PRAGMA table_info({source})')}
+    blob = 'geometry_bin' if 'geometry_bin' in columns else 'NULL'
+    canonical = has_canonical_geometry(con)
+    parcels = {}
+    sql = f"SELECT id, {', '.join(FEATURE_ATTRIBUTES)}, geometry, {blob} FROM {source} ORDER BY id"
+    for row in con.execute(sql):
+        pid, attrs, text, data = row[0], row[1:1 + len(FEATURE_ATTRIBUTES)], row[-2], row[-1]
+        try:
+            geom = load_geometry(text, data)
+        except (ValueError, KeyError):
+            continue
+        if not isinstance(geom, dict):
+            continue
+        if not canonical:
+            geom, _flags, _bbox = normalize_geometry(geom)
+        polygons = []
+        try:
+            for poly in _polygons(geom):
+                rings = [[mercator(float(p[0]), float(p[1])) for p in ring] for ring in poly]
+                if rings and len(rings[0]) >= 3:
+                    polygons.append(rings)
+        except (TypeError, ValueError, IndexError):
+            continue
+        if not polygons:
+            continue
+        xs = [p[0] for poly in polygons for p in poly[0]]
+        ys = [p[1] for poly in polygons for p in poly[0]]
+        digest = hashlib.blake2b(json.dumps([attrs, geom], sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+        parcels[pid] = (tuple('' if a is None else str(a) for a in attrs), digest,
+                        (min(xs), min(ys), max(xs), max(ys)), polygons)
+    return parcels
+
+
+# -- clipping / quantization ----------------------------------------------------
+
+def _clip_ring(ring, lo, hi):
+    """Sutherland-Hodgman clip of an open ring against the square [lo, hi]^2."""
+    for axis, bound, keep_above in ((0, lo, True), (0, hi, False), (1, lo, True), (1, hi, False)):
+        if not ring:
+            break
+        out = []
+        prev = ring[-1]
+        prev_in = prev[axis] >= bound if keep_above else prev[axis] <= bound
+        for cur in ring:
+            cur_in = cur[axis] >= bound if keep_above else cur[axis] <= bound
+            if cur_in != prev_in:
+                t = (bound - prev[axis]) / (cur[axis] - prev[axis])
+                other = 1 - axis
+                cross = [0.0, 0.0]
+                cross[axis] = bound
+                cross[other] = prev[other] + t * (cur[other] - prev[other])
+                out.append(tuple(cross))
+            if cur_in:
+                out.append(cur)
+            prev, prev_in = cur, cur_in
+        ring = out
+    return ring
+
+
+def _ring_area2(ring):
+    """Twice the signed area in tile coordinates (positive = clockwise on screen, an MVT exterior ring)."""
+    return sum(ring[i - 1][0] * ring[i][1] - ring[i][0] * ring[i - 1][1] for i in range(len(ring)))
+
+
+def tile_polygons(polygons, z, x, y, extent=TILE_EXTENT, buffer=TILE_BUFFER):
+    """Polygons clipped and quantized to tile (z, x, y): list of [exterior, holes...] integer rings, wound for MVT."""
+    size = 2 * _ORIGIN / (1 << z)
+    minx = -_ORIGIN + x * size
+    maxy = _ORIGIN - y * size
+    scale = extent / size
+    out = []
+    for poly in polygons:
+        rings = []
+        for r, ring in enumerate(poly):
+            pts = [((px - minx) * scale, (maxy - py) * scale) for px, py in ring]
+            if len(pts) > 1 and pts[0] == pts[-1]:
+                pts.pop()
+            pts = _clip_ring(pts, -buffer, extent + buffer)
+            q = []
+            for px, py in pts:
+                p = (int(round(px)), int(round(py)))
+                if not q or q[-1] != p:
+                    q.append(p)
+            if len(q) > 1 and q[0] == q[-1]:
+                q.pop()
+            area = _ring_area2(q) if len(q) >= 3 else 0
+            if not area:
+                if r == 0:
+                    break  # exterior gone: the holes go with it
+                continue
+            # Exterior rings positive, holes negative
+            if (area > 0) != (r == 0):
+                q.reverse()
+            rings.append(q)
+        if rings:
+            out.append(rings)
+    return out
+
+
+# -- MVT encoding -----------------------------------------------------------------
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def _field(number, wire_type, payload=b''):
+    key = _varint((number << 3) | wire_type)
+    if wire_type == 0:
+        return key + _varint(payload)
+    return key + _varint(len(payload)) + payload
+
+
+def encode_polygon_commands(polygons):
+    """MVT geometry command integers for a (multi)polygon of integer rings."""
+    cmds = []
+    cx = cy = 0
+    for rings in polygons:
+        for ring in rings:
+            x0, y0 = ring[0]
+            cmds += [(1 << 3) | 1, _zigzag(x0 - cx), _zigzag(y0 - cy)]  # MoveTo(1)
+            cx, cy = x0, y0
+            cmds.append(((len(ring) - 1) << 3) | 2)  # LineTo(n)
+            for px, py in ring[1:]:
+                cmds += [_zigzag(px - cx), _zigzag(py - cy)]
+                cx, cy = px, py
+            cmds.append((1 << 3) | 7)  # ClosePath
+    return cmds
+
+
+def encode_tile(features, extent=TILE_EXTENT, layer=LAYER_NAME, keys=FEATURE_ATTRIBUTES):
+    """Protobuf bytes of a one-layer vector tile; features are (id, attribute values, polygons)."""
+    values, value_index = [], {}
+    body = bytearray()
+    for fid, attrs, polygons in features:
+        tags = []
+        for k, value in enumerate(attrs):
+            if value == '':
+                continue
+            if value not in value_index:
+                value_index[value] = len(values)
+                values.append(value)
+            tags += [k, value_index[value]]
+        feature = _field(1, 0, fid)
+        if tags:
+            feature += _field(2, 2, b''.join(_varint(t) for t in tags))
+        feature += _field(3, 0, 3)  # POLYGON
+        feature += _field(4, 2, b''.join(_varint(c) for c in encode_polygon_commands(polygons)))
+        body += _field(2, 2, feature)
+    out = _field(15, 0, 2) + _field(1, 2, layer.encode('utf-8')) + bytes(body)
+    out += b''.join(_field(3, 2, k.encode('utf-8')) for k in keys)
+    out += b''.join(_field(4, 2, _field(1, 2, v.encode('utf-8'))) for v in values)
+    out += _field(5, 0, extent)
+    return _field(3, 2, out)
+
+
+def _read_varint(buf, pos):
+    shift = result = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(buf):
+    pos = 0
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(buf, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        else:
+            raise ValueError(f'unsupported wire type {wire_type}')
+        yield number, value
+
+
+def decode_tile(data):
+    """{layer name: [{'id', 'properties', 'rings'}]} for a (possibly gzipped) tile; rings in tile coordinates."""
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    layers = {}
+    for number, layer_buf in _fields(data):
+        if number != 3:
+            continue
+        name, keys, values, raw = '', [], [], []
+        for n, v in _fields(layer_buf):
+            if n == 1:
+                name = v.decode('utf-8')
+            elif n == 2:
+                raw.append(v)
+            elif n == 3:
+                keys.append(v.decode('utf-8'))
+            elif n == 4:
+                values.append(next((x.decode('utf-8') for k, x in _fields(v) if k == 1), None))
+        features = []
+        for fbuf in raw:
+            fid, tags, geometry = None, [], []
+            for n, v in _fields(fbuf):
+                if n == 1:
+                    fid = v
+                elif n in (2, 4):
+                    ints, pos = [], 0
+                    while pos < len(v):
+                        i, pos = _read_varint(v, pos)
+                        ints.append(i)
+                    if n == 2:
+                        tags = ints
+                    else:
+                        geometry = ints
+            rings, ring, cx, cy, i = [], [], 0, 0, 0
+            while i < len(geometry):
+                cmd, count = geometry[i] & 7, geometry[i] >> 3
+                i += 1
+                if cmd == 7:
+                    rings.append(ring)
+                    ring = []
+                    continue
+                for _ in range(count):
+                    dx, dy = geometry[i], geometry[i + 1]
+                    i += 2
+                    cx += (dx >> 1) ^ -(dx & 1)
+                    cy += (dy >> 1) ^ -(dy & 1)
+                    ring.append((cx, cy))
+            props = {keys[tags[j]]: values[tags[j + 1]] for j in range(0, len(tags), 2)}
+            features.append({'id': fid, 'properties': props, 'rings': rings})
+        layers[name] = features
+    return layers
+
+
+# -- workers ------------------------------------------------------------------------
+
+_WORKER_PARCELS = None
+
+
+def _init_worker(parcels):
+    global _WORKER_PARCELS
+    _WORKER_PARCELS = parcels
+
+
+def encode_tiles(task, parcels=None):
+    """[(z, x, y, gzipped tile or None when empty)] for `task` = [(z, x, y, parcel ids)]."""
+    parcels = parcels if parcels is not None else _WORKER_PARCELS
+    out = []
+    for z, x, y, ids in task:
+        features = []
+        for pid in ids:
+            attrs, _digest, _bounds, polygons = parcels[pid]
+            clipped = tile_polygons(polygons, z, x, y)
+            if clipped:
+                features.append((pid, attrs, clipped))
+        out.append((z, x, y, gzip.compress(encode_tile(features), 6) if features else None))
+    return out
+
+
+# -- MBTiles ------------------------------------------------------------------------
+
+def open_mbtiles(path):
+    con = sqlite3.connect(str(path))
+    con.execute('CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)')
+    con.execute('''CREATE TABLE IF NOT EXISTS tiles (
+        zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+        PRIMARY KEY (zoom_level, tile_column, tile_row)
+    ) WITHOUT ROWID''')
+    con.execute(f'''CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+        parcel_id INTEGER PRIMARY KEY, content_hash TEXT NOT NULL,
+        minx REAL NOT NULL, miny REAL NOT NULL, maxx REAL NOT NULL, maxy REAL NOT NULL
+    )''')
+    return con
+
+
+def _metadata(con):
+    return dict(con.execute('SELECT name, value FROM metadata'))
+
+
+def dirty_bounds(con, parcels, full):
+    """Mercator bounds whose tiles must be re-encoded, or None for every tile.
+
+    Returns (bounds list, added, changed, deleted).
+    """
+    previous = {pid: (digest, (a, b, c, d)) for pid, digest, a, b, c, d in con.execute(f'SELECT * FROM {STATE_TABLE}')}
+    if full or not previous:
+        return None, len(parcels), 0, 0
+    bounds, added, changed = [], 0, 0
+    for pid, (_attrs, digest, box, _polys) in parcels.items():
+        old = previous.get(pid)
+        if old is None:
+            added += 1
+            bounds.append(box)
+        elif old[0] != digest:
+            changed += 1
+            bounds += [box, old[1]]
+    deleted = [old[1] for pid, old in previous.items() if pid not in parcels]
+    return bounds + deleted, added, changed, len(deleted)
+
+
+def build_tiles(db, out, minzoom=DEFAULT_MINZOOM, maxzoom=DEFAULT_MAXZOOM, workers=1, full=False):
+    """Create or update the MBTiles file `out` from parcelapp.db `db`. Returns a summary dict."""
+    t0 = time.perf_counter()
+    src = sqlite3.connect(f'file:{Path(db).as_posix()}?mode=ro', uri=True)
+    parcels = load_parcels(src)
+    version = None
+    try:
+        version = (src.execute("SELECT value FROM meta WHERE key = 'version'").fetchone() or (None,))[0]
+    except sqlite3.OperationalError:
+        pass
+    src.close()
+    t_load = time.perf_counter() - t0
+
+    con = open_mbtiles(out)
+    meta = _metadata(con)
+    same_zooms = meta.get('minzoom') == str(minzoom) and meta.get('maxzoom') == str(maxzoom)
+    bounds, added, changed, deleted = dirty_bounds(con, parcels, full or not same_zooms)
+
+    # Tiles to (re)encode, each with the parcels whose buffered bbox meets it
+    tiles = {}
+    dirty = None
+    if bounds is not None:
+        dirty = set()
+        for z in range(minzoom, maxzoom + 1):
+            for box in bounds:
+                x0, y0, x1, y1 = tile_range(box, z)
+                dirty.update((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    for pid, (_attrs, _digest, box, _polys) in parcels.items():
+        for z in range(minzoom, maxzoom + 1):
+            x0, y0, x1, y1 = tile_range(box, z)
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    if dirty is None or (z, x, y) in dirty:
+                        tiles.setdefault((z, x, y), []).append(pid)
+    # Dirty tiles that are now empty are deleted below
+    for key in dirty or ():
+        tiles.setdefault(key, [])
+    ordered = sorted(tiles)
+    tasks = [[(z, x, y, tiles[(z, x, y)]) for z, x, y in ordered[i:i + TILES_PER_TASK]]
+             for i in range(0, len(ordered), TILES_PER_TASK)]
+
+    t1 = time.perf_counter()
+    if workers <= 1 or len(tasks) <= 1:
+        results = (encode_tiles(task, parcels) for task in tasks)
+        written = _store_tiles(con, results, dirty is None)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(parcels,)) as pool:
+            written = _store_tiles(con, pool.map(encode_tiles, tasks), dirty is None)
+    t_encode = time.perf_counter() - t1
+
+    con.execute(f'DELETE FROM {STATE_TABLE}')
+    con.executemany(f'INSERT INTO {STATE_TABLE} VALUES (?, ?, ?, ?, ?, ?)',
+                    ((pid, digest, *box) for pid, (_a, digest, box, _p) in parcels.items()))
+    _write_metadata(con, parcels, minzoom, maxzoom, version)
+    con.commit()
+    con.close()
+    return {'parcels': len(parcels), 'added': added, 'changed': changed, 'deleted': deleted,
+            'tiles_encoded': len(ordered), 'tiles_written': written, 'full': dirty is None,
+            'load_s': t_load, 'encode_s': t_encode}
+
+
+def _store_tiles(con, results, full):
+    if full:
+        con.execute('DELETE FROM tiles')
+    written = 0
+    for chunk in results:
+        for z, x, y, data in chunk:
+            row = (1 << z) - 1 - y  # MBTiles rows are TMS (south up)
+            if data is None:
+                con.execute('DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?', (z, x, row))
+            else:
+                con.execute('INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)', (z, x, row, data))
+                written += 1
+    return written
+
+
+def _write_metadata(con, parcels, minzoom, maxzoom, version):
+    boxes = [p[2] for p in parcels.values()]
+    if boxes:
+        inv = lambda mx, my: (math.degrees(mx / _EARTH_RADIUS),
+                              math.degrees(2 * math.atan(math.exp(my / _EARTH_RADIUS)) - math.pi / 2))
+        west, south = inv(min(b[0] for b in boxes), min(b[1] for b in boxes))
+        east, north = inv(max(b[2] for b in boxes), max(b[3] for b in boxes))
+    else:
+        west = south = east = north = 0.0
+    layer = {'id': LAYER_NAME, 'minzoom': minzoom, 'maxzoom': maxzoom,
+             'fields': {name: 'String' for name in FEATURE_ATTRIBUTES}}
+    entries = {
+        'name': 'parcels', 'format': 'pbf', 'type': 'overlay', 'version': '2',
+        'minzoom': str(minzoom), 'maxzoom': str(maxzoom),
+        'bounds': f'{west:.6f},{south:.6f},{east:.6f},{north:.6f}',
+        'center': f'{(west + east) / 2:.6f},{(south + north) / 2:.6f},{minzoom}',
+        'json': json.dumps({'vector_layers': [layer]}),
+    }
+    if version:
+        entries['parcelapp_version'] = version
+    con.executemany('INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)', entries.items())
+
+
+def inspect_tile(out, zxy):
+    z, x, y = (int(v) for v in zxy.split('/'))
+    con = sqlite3.connect(f'file:{Path(out).as_posix()}?mode=ro', uri=True)
+    row = con.execute('SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+                      (z, x, (1 << z) - 1 - y)).fetchone()
+    con.close()
+    if not row:
+        print(f'no tile {zxy}')
+        return
+    for name, features in decode_tile(row[0]).items():
+        vertices = sum(len(r) for f in features for r in f['rings'])
+        print(f'{zxy}: {len(row[0])} bytes, layer {name}: {len(features)} features, {vertices} vertices')
+        for f in features[:10]:
+            print(f"  {f['id']} {f['properties'].get('num_parcel')} rings={len(f['rings'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build an MBTiles vector tile pyramid of the parcels.')
+    parser.add_argument('db', nargs='?', default='prebuilt/parcelapp.db')
+    parser.add_argument('--out', default='prebuilt/parcels.mbtiles')
+    parser.add_argument('--minzoom', type=int, default=DEFAULT_MINZOOM)
+    parser.add_argument('--maxzoom', type=int, default=DEFAULT_MAXZOOM)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--full', action='store_true', help='re-encode every tile instead of the changed ones')
+    parser.add_argument('--inspect', metavar='Z/X/Y', help='decode one XYZ tile of --out and print a summary')
+    args = parser.parse_args()
+
+    if args.inspect:
+        inspect_tile(args.out, args.inspect)
+        return
+    if not 0 <= args.minzoom <= args.maxzoom <= 22:
+        parser.error('expected 0 <= minzoom <= maxzoom <= 22')
+    summary = build_tiles(args.db, args.out, args.minzoom, args.maxzoom, args.workers, args.full)
+    mode = 'full build' if summary['full'] else (f"{summary['added']} added, {summary['changed']} changed, "
+                                                 f"{summary['deleted']} deleted parcels")
+    print(f"{summary['parcels']} parcels ({mode}): {summary['tiles_encoded']} tiles encoded, "
+          f"{summary['tiles_written']} written; load {summary['load_s']:.2f}s, encode {summary['encode_s']:.2f}s")
+    print(f'Wrote {args.out} ({Path(args.out).stat().st_size} bytes)')
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,15 @@ import { createClient, SupabaseClient } from '@supabase/supabase-js';
 // Tunable constants for neighbor queries and caching
 const DEFAULT_NEIGHBOR_LIMIT = 6; // number of neighbor parcels to return per query
 const NEIGHBOR_CACHE_TTL_MS = 2 * 60 * 1000; // cache TTL for neighbor queries (2 minutes)
+// Tables the DB generator keys by parcels.id (or derives from parcels). They only match
+// the parcels of the bundle they shipped with.
+const BUNDLED_PARCEL_TABLES = ['build_manifest', 'parcel_neighbors', 'parcels_rtree', 'parcels_fts', 'parcel_geometry_lod', 'parcel_stats', 'parcel_prefix_stats'];
+// Precomputed nearest-neighbor graph of the prebuilt DB (scripts/neighbor_graph.py)
+const NEIGHBOR_GRAPH_TABLE = 'parcel_neighbors';
+const NEIGHBOR_WITHIN_METERS = 1000;
+// Parcel count the generator stores in meta, and its per-dimension counts table (scripts/dataset_stats.py)
+const PARCEL_COUNT_META_KEY = 'count_total';
+const PARCEL_STATS_TABLE = 'parcel_stats';
 
 type SQLiteDatabase = ReturnType<typeof SQLite.openDatabaseSync>;
 
@@ -27,6 +36,8 @@ class DatabaseManager {
   private seedingListeners: Set<(p: { inserted: number; total: number } | null) => void> = new Set();
   private preparedStatements: Map<string, any> = new Map();
   private queryCache: Map<string, { timestamp: number, result: any }> = new Map();
+  private parcelColumns: Set<string> | null = null;
+  private neighborGraph: boolean | null = null;
   // In-memory map to track sends in progress per remote id (or local id)
   private sendingMap: Map<string, boolean> = new Map();
 
@@ -146,6 +157,7 @@ class DatabaseManager {
             '{"Prenom_M":"Aissatou", "Nom_M":"Diop", "regionSenegal":"Louga", "departmentSenegal":"Louga", "communeSenegal":"Louga", "Cas_de_Personne_001":"Présidente", "Quel_est_le_nombre_d_affectata":"15", "Prenom_001":"Mariama", "Nom_001":"Fall"}')
         `);
 
+        this.invalidateLocalParcelCount();
         console.log("Test data inserted successfully");
       } else {
         console.log(`Parcels table already has ${count} rows, skipping test data insertion`);
@@ -328,6 +340,8 @@ class DatabaseManager {
         }
 
         this.db = SQLite.openDatabaseSync(dbName);
+        this.parcelColumns = null;
+        this.neighborGraph = null;
 
         // Immediately query the native sqlite database_list to discover the actual
         // file paths the native layer attached. Write them to a debug file so we
@@ -478,6 +492,8 @@ class DatabaseManager {
             // Ignore close errors
           }
           this.db = null;
+          this.parcelColumns = null;
+          this.neighborGraph = null;
         }
 
         // If we've reached max attempts, throw the error
@@ -552,6 +568,29 @@ class DatabaseManager {
     }
   }
 
+  // Number of local parcels without scanning the table: the meta count (the bundle's own,
+  // or the refresh's), else the parcel_stats totals, else COUNT(*).
+  private getLocalParcelCount(): number {
+    const stored = this.getLocalMetaValue(PARCEL_COUNT_META_KEY);
+    if (stored != null && stored.trim() !== '' && Number.isFinite(Number(stored))) return Number(stored);
+
+    const statsTable: any = this.safeGetFirstSync(`SELECT count(*) as count FROM sqlite_master WHERE type='table' AND name='${PARCEL_STATS_TABLE}'`);
+    if (statsTable && Number(statsTable.count ?? 0) > 0) {
+      const statsRow: any = this.safeGetFirstSync(`SELECT SUM(parcel_count) as count FROM ${PARCEL_STATS_TABLE} WHERE dimension = 'type'`);
+      if (statsRow && statsRow.count != null) return Number(statsRow.count);
+    }
+
+    const countRow: any = this.safeGetFirstSync('SELECT COUNT(*) as count FROM parcels');
+    return countRow ? Number(countRow.count ?? 0) : 0;
+  }
+
+  // Parcels were rewritten outside the bundled refresh: the stored counts no longer hold.
+  private invalidateLocalParcelCount() {
+    if (!this.db) return;
+    try { this.db.runSync('DELETE FROM meta WHERE key = ?', [PARCEL_COUNT_META_KEY]); } catch (e) { /* no meta table */ }
+    try { this.db.execSync(`DROP TABLE IF EXISTS ${PARCEL_STATS_TABLE}`); } catch (e) { /* ignore */ }
+  }
+
   private async copyBundledDbToSQLiteDir(destName: string): Promise<string | null> {
     try {
       const sqliteDir = `${FileSystem.documentDirectory}SQLite`;
@@ -593,13 +632,20 @@ class DatabaseManager {
 
     const localVersion = this.getLocalMetaValue('prebuilt_version');
 
-    const countRow = this.safeGetFirstSync('SELECT COUNT(*) as count FROM parcels');
-    const localTotal = countRow ? Number((countRow as any).count ?? 0) : 0;
+    const localTotal = this.getLocalParcelCount();
 
     // Refresh if the bundled version changed OR local data looks incomplete.
     const needsRefresh = localVersion !== bundledVersion || (bundledTotal > 0 && localTotal < bundledTotal);
     if (!needsRefresh) return;
 
+    // On first launch the working DB is a copy of the bundled file: when it still carries
+    // the bundle's own version, its parcels (and id-keyed tables) already match.
+    if (this.getLocalMetaValue('version') === bundledVersion && (bundledTotal === 0 || localTotal >= bundledTotal)) {
+      this.setLocalMetaValue('prebuilt_version', bundledVersion);
+      if (bundledTotal > 0) this.setLocalMetaValue('prebuilt_parcels_total', String(bundledTotal));
+      return;
+    }
+
     console.log('[DB] Refreshing parcels from bundled DB', {
       localVersion,
       bundledVersion,
@@ -621,9 +667,15 @@ class DatabaseManager {
       const bundledCountRow = ((): any => {
         try {
           // Use a tiny inline query helper against the bundled DB.
-          return (bundledDb as any)?.getFirstSync
-            ? (bundledDb as any).getFirstSync('SELECT COUNT(*) as count FROM parcels')
-            : null;
+          if (!(bundledDb as any)?.getFirstSync) return null;
+          // The generator materializes the count in meta; older bundles fall back to COUNT(*).
+          try {
+            const row = (bundledDb as any).getFirstSync("SELECT value as count FROM meta WHERE key = 'count_total'");
+            if (row && row.count != null) return row;
+          } catch (e) {
+            // no meta table
+          }
+          return (bundledDb as any).getFirstSync('SELECT COUNT(*) as count FROM parcels');
         } catch (e) {
           return null;
         }
@@ -636,6 +688,24 @@ class DatabaseManager {
         return;
       }
 
+      // Copy every column both parcels tables have, so the generator's promoted
+      // commune / department / ... columns (and their indexes) stay usable.
+      const baseColumns = ['num_parcel', 'parcel_type', 'typ_pers', 'prenom', 'nom', 'prenom_m', 'nom_m', 'denominat', 'village', 'geometry', 'properties'];
+      const columnNames = (rows: any[] | null | undefined): string[] => (rows || []).map((c: any) => String(c?.name || '')).filter(Boolean);
+      const localColumns = new Set(columnNames(this.safeGetAllSync('PRAGMA table_info(parcels)')).map((c) => c.toLowerCase()));
+      let bundledColumns: string[] = [];
+      try {
+        bundledColumns = columnNames((bundledDb as any)?.getAllSync ? (bundledDb as any).getAllSync('PRAGMA table_info(parcels)') : []);
+      } catch (e) {
+        bundledColumns = [];
+      }
+      // Parcel ids are copied too, so they stay the ids the generator assigned.
+      let columns = bundledColumns.filter((c) => localColumns.has(c.toLowerCase()));
+      if (!columns.length) columns = baseColumns;
+      const keepIds = columns.some((c) => c.toLowerCase() === 'id');
+      const insertSql = `INSERT INTO parcels (${columns.join(', ')}) VALUES (${columns.map(() => '?').join(', ')})`;
+      let inserted = 0;
+
       // Clear and re-import parcels while preserving complaints.
       this.db.execSync('BEGIN;');
       try {
@@ -643,23 +713,27 @@ class DatabaseManager {
 
         let insertStmt: any = null;
         try {
-          insertStmt = this.db.prepareSync(
-            'INSERT INTO parcels (num_parcel, parcel_type, typ_pers, prenom, nom, prenom_m, nom_m, denominat, village, geometry, properties) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
-          );
+          insertStmt = this.db.prepareSync(insertSql);
         } catch (e) {
           insertStmt = null;
         }
 
         const pageSize = 300;
         let offset = 0;
+        let lastId = -1;
         while (true) {
           let rows: any[] = [];
           try {
             if ((bundledDb as any)?.getAllSync) {
-              rows = (bundledDb as any).getAllSync(
-                'SELECT num_parcel, parcel_type, typ_pers, prenom, nom, prenom_m, nom_m, denominat, village, geometry, properties FROM parcels LIMIT ? OFFSET ?'
-                , [pageSize, offset]
-              ) as any[];
+              rows = keepIds
+                ? (bundledDb as any).getAllSync(
+                  `SELECT ${columns.join(', ')} FROM parcels WHERE id > ? ORDER BY id LIMIT ?`
+                  , [lastId, pageSize]
+                ) as any[]
+                : (bundledDb as any).getAllSync(
+                  `SELECT ${columns.join(', ')} FROM parcels LIMIT ? OFFSET ?`
+                  , [pageSize, offset]
+                ) as any[];
             } else if ((bundledDb as any)?.execSync) {
               // Worst-case fallback: execSync shape differs; bail out.
               rows = [];
@@ -671,30 +745,16 @@ class DatabaseManager {
           if (!rows || rows.length === 0) break;
 
           for (const r of rows) {
-            const vals = [
-              r.num_parcel ?? null,
-              r.parcel_type ?? null,
-              r.typ_pers ?? null,
-              r.prenom ?? null,
-              r.nom ?? null,
-              r.prenom_m ?? null,
-              r.nom_m ?? null,
-              r.denominat ?? null,
-              r.village ?? null,
-              r.geometry ?? null,
-              r.properties ?? null,
-            ];
+            const vals = columns.map((c) => r[c] ?? null);
             if (insertStmt?.executeSync) {
               insertStmt.executeSync(vals);
             } else {
-              this.db.runSync(
-                'INSERT INTO parcels (num_parcel, parcel_type, typ_pers, prenom, nom, prenom_m, nom_m, denominat, village, geometry, properties) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                vals
-              );
+              this.db.runSync(insertSql, vals);
             }
           }
 
           offset += rows.length;
+          if (keepIds) lastId = Number(rows[rows.length - 1].id);
         }
 
         try {
@@ -704,13 +764,27 @@ class DatabaseManager {
         }
 
         this.db.execSync('COMMIT;');
+        inserted = offset;
       } catch (e) {
         try { this.db.execSync('ROLLBACK;'); } catch (e2) { /* ignore */ }
         throw e;
+      } finally {
+        this.parcelColumns = null;
+        this.neighborGraph = null;
+      }
+
+      // With the generator's ids kept, its neighbor graph matches the new parcels: copy it.
+      // The other id-keyed tables came with the previous bundle and no longer match the
+      // new parcels; the app does not read them, so drop them (the graph too if not copied).
+      const graphCopied = keepIds && this.copyBundledNeighborGraph(bundledDb);
+      for (const table of BUNDLED_PARCEL_TABLES) {
+        if (graphCopied && table === NEIGHBOR_GRAPH_TABLE) continue;
+        try { this.db.execSync(`DROP TABLE IF EXISTS ${table}`); } catch (e) { /* e.g. fts5/rtree module unavailable */ }
       }
 
       this.setLocalMetaValue('prebuilt_version', bundledVersion);
       if (bundledTotal > 0) this.setLocalMetaValue('prebuilt_parcels_total', String(bundledTotal));
+      this.setLocalMetaValue(PARCEL_COUNT_META_KEY, String(inserted));
       console.log('[DB] Parcels refresh complete');
     } finally {
       try { bundledDb?.closeSync?.(); } catch (e) { /* ignore */ }
@@ -718,6 +792,71 @@ class DatabaseManager {
     }
   }
 
+  // Replace the local parcel_neighbors with the bundled DB's; false (nothing changed) if the
+  // bundle has no graph or the copy failed.
+  private copyBundledNeighborGraph(bundledDb: any): boolean {
+    if (!this.db || !bundledDb?.getAllSync || !bundledDb?.getFirstSync) return false;
+    let createSql: string | null = null;
+    try {
+      const row = bundledDb.getFirstSync(`SELECT sql FROM sqlite_master WHERE type = 'table' AND name = '${NEIGHBOR_GRAPH_TABLE}'`);
+      createSql = row?.sql ? String(row.sql) : null;
+    } catch (e) {
+      createSql = null;
+    }
+    if (!createSql) return false;
+
+    const insertSql = `INSERT INTO ${NEIGHBOR_GRAPH_TABLE} (parcel_id, neighbor_id, distance_m, touches) VALUES (?, ?, ?, ?)`;
+    this.db.execSync('BEGIN;');
+    try {
+      this.db.execSync(`DROP TABLE IF EXISTS ${NEIGHBOR_GRAPH_TABLE};`);
+      this.db.execSync(createSql);
+
+      let insertStmt: any = null;
+      try {
+        insertStmt = this.db.prepareSync(insertSql);
+      } catch (e) {
+        insertStmt = null;
+      }
+
+      // Keyset paging on the (parcel_id, neighbor_id) primary key
+      const pageSize = 2000;
+      let lastParcel = -1;
+      let lastNeighbor = -1;
+      while (true) {
+        const rows: any[] = bundledDb.getAllSync(
+          `SELECT parcel_id, neighbor_id, distance_m, touches FROM ${NEIGHBOR_GRAPH_TABLE} WHERE (parcel_id, neighbor_id) > (?, ?) ORDER BY parcel_id, neighbor_id LIMIT ?`
+          , [lastParcel, lastNeighbor, pageSize]
+        ) || [];
+        if (!rows.length) break;
+        for (const r of rows) {
+          const vals = [r.parcel_id, r.neighbor_id, r.distance_m ?? null, r.touches ?? 0];
+          if (insertStmt?.executeSync) {
+            insertStmt.executeSync(vals);
+          } else {
+            this.db.runSync(insertSql, vals);
+          }
+        }
+        const last = rows[rows.length - 1];
+        lastParcel = Number(last.parcel_id);
+        lastNeighbor = Number(last.neighbor_id);
+      }
+
+      try {
+        if (insertStmt?.finalizeSync) insertStmt.finalizeSync();
+      } catch (e) {
+        // ignore
+      }
+      this.db.execSync('COMMIT;');
+      return true;
+    } catch (e) {
+      try { this.db.execSync('ROLLBACK;'); } catch (e2) { /* ignore */ }
+      console.warn('[DB] Could not copy the neighbor graph from the bundled DB', e);
+      return false;
+    } finally {
+      this.neighborGraph = null;
+    }
+  }
+
   private getComplaintParcelNumber(complaint: any): string | null {
     const norm = (v: any) => {
       if (v === undefined || v === null) return null;
@@ -902,6 +1041,25 @@ class DatabaseManager {
     }
   }
 
+  // Columns of the parcels table (the prebuilt DB adds indexed commune/department/... columns)
+  private hasParcelColumn(name: string): boolean {
+    if (!this.parcelColumns) {
+      const cols = this.safeGetAllSync('PRAGMA table_info(parcels)') || [];
+      if (!cols.length) return false;
+      this.parcelColumns = new Set(cols.map((c: any) => String(c?.name || '').toLowerCase()));
+    }
+    return this.parcelColumns.has(name.toLowerCase());
+  }
+
+  // True if the DB has the generator's parcel_neighbors graph (its ids match parcels.id)
+  private hasNeighborGraph(): boolean {
+    if (this.neighborGraph === null) {
+      const row: any = this.safeGetFirstSync(`SELECT count(*) as count FROM sqlite_master WHERE type='table' AND name='${NEIGHBOR_GRAPH_TABLE}'`);
+      this.neighborGraph = !!row && Number(row.count ?? 0) > 0;
+    }
+    return this.neighborGraph;
+  }
+
   private safeGetAllSync(sql: string, params?: any[]) {
     try {
       if (!this.db) return [];
@@ -1085,6 +1243,7 @@ class DatabaseManager {
       }
 
       console.log("Database is empty or force reload requested, starting data seeding...");
+      this.invalidateLocalParcelCount();
 
       let insertStatement: any = null;
       try {
@@ -2564,9 +2723,19 @@ class DatabaseManager {
 
     try {
       // Load the parcel row
-      const parcel: any = this.safeGetFirstSync('SELECT geometry, properties, min_lat, min_lng, max_lat, max_lng FROM parcels WHERE num_parcel = ?', [parcelNum]);
+      const parcel: any = this.safeGetFirstSync('SELECT id, geometry, properties, min_lat, min_lng, max_lat, max_lng FROM parcels WHERE num_parcel = ?', [parcelNum]);
       if (!parcel) { console.warn(`Parcel with number ${parcelNum} not found`); return []; }
 
+      // Precomputed neighbor graph: one indexed read, nearest first
+      if (parcel.id != null && this.hasNeighborGraph()) {
+        const rows: any[] = this.safeGetAllSync(`SELECT p.*, n.distance_m AS __neighbor_distance_m FROM ${NEIGHBOR_GRAPH_TABLE} n JOIN parcels p ON p.id = n.neighbor_id WHERE n.parcel_id = ? ORDER BY n.distance_m, n.neighbor_id LIMIT ${DEFAULT_NEIGHBOR_LIMIT}`, [parcel.id]) || [];
+        if (rows.length) {
+          const result = rows.map((r: any) => ({ ...r, __neighbor_within_1km: r.__neighbor_distance_m != null && Number(r.__neighbor_distance_m) <= NEIGHBOR_WITHIN_METERS }));
+          this.queryCache.set(cacheKey, { timestamp: Date.now(), result });
+          return result;
+        }
+      }
+
       // Parse geometry if present
       let geometry: any = null;
       try { geometry = parcel.geometry ? JSON.parse(String(parcel.geometry)) : null; } catch (e) { geometry = null; }
@@ -2584,7 +2753,11 @@ class DatabaseManager {
           const lk = String(k).toLowerCase(); if (parsedProps && parsedProps[lk]) { communeName = String(parsedProps[lk]).trim(); break; }
         }
         if (communeName) {
-          const rows = this.safeGetAllSync(`SELECT * FROM parcels WHERE num_parcel != ? AND properties LIKE ? LIMIT ${DEFAULT_NEIGHBOR_LIMIT}`, [parcelNum, `%${communeName}%`]) || [];
+          // Index seek on the promoted commune column when present; LIKE scan over properties otherwise
+          let rows: any[] = this.hasParcelColumn('commune')
+            ? this.safeGetAllSync(`SELECT * FROM parcels WHERE num_parcel != ? AND commune = ? LIMIT ${DEFAULT_NEIGHBOR_LIMIT}`, [parcelNum, communeName]) || []
+            : [];
+          if (!rows.length) rows = this.safeGetAllSync(`SELECT * FROM parcels WHERE num_parcel != ? AND properties LIKE ? LIMIT ${DEFAULT_NEIGHBOR_LIMIT}`, [parcelNum, `%${communeName}%`]) || [];
           if (rows.length) candidateRows = candidateRows.concat(rows.slice(0, DEFAULT_NEIGHBOR_LIMIT));
         }
       } catch (e) { /* ignore */ }
@@ -2599,7 +2772,10 @@ class DatabaseManager {
           const lk = String(k).toLowerCase(); if (parsedProps && parsedProps[lk]) { deptName = String(parsedProps[lk]).trim(); break; }
         }
         if (deptName) {
-          const rows = this.safeGetAllSync(`SELECT * FROM parcels WHERE num_parcel != ? AND properties LIKE ? LIMIT ${DEFAULT_NEIGHBOR_LIMIT * 5}`, [parcelNum, `%${deptName}%`]) || [];
+          let rows: any[] = this.hasParcelColumn('department')
+            ? this.safeGetAllSync(`SELECT * FROM parcels WHERE num_parcel != ? AND department = ? LIMIT ${DEFAULT_NEIGHBOR_LIMIT * 5}`, [parcelNum, deptName]) || []
+            : [];
+          if (!rows.length) rows = this.safeGetAllSync(`SELECT * FROM parcels WHERE num_parcel != ? AND properties LIKE ? LIMIT ${DEFAULT_NEIGHBOR_LIMIT * 5}`, [parcelNum, `%${deptName}%`]) || [];
           if (rows.length) candidateRows = candidateRows.concat(rows.slice(0, DEFAULT_NEIGHBOR_LIMIT));
         }
       } catch (e) { /* ignore */ }
@@ -2671,7 +2847,7 @@ class DatabaseManager {
         return 6371000 * c;
       };
 
-      const MAX_DIST_METERS = 1000;
+      const MAX_DIST_METERS = NEIGHBOR_WITHIN_METERS;
       const plausibleCentroid = (lat: number, lng: number) => (isFinite(lat) && isFinite(lng) && lat >= 4.0 && lat <= 20.0 && lng >= -20.0 && lng <= -4.0);
 
       // If centroid is invalid, try extracting from properties once more
@@ -0,0 +1,227 @@
+// Mock native expo modules and the bundled DB assets before importing DatabaseManager
+jest.mock('expo-file-system/legacy', () => ({
+  documentDirectory: '/tmp/',
+  getInfoAsync: () => Promise.resolve({ exists: true, size: 0 }),
+  makeDirectoryAsync: () => Promise.resolve(true),
+  deleteAsync: () => Promise.resolve(true),
+  copyAsync: () => Promise.resolve(true),
+}));
+
+jest.mock('expo-asset', () => ({
+  Asset: { fromModule: () => ({ downloadAsync: () => Promise.resolve(true), localUri: 'file:///tmp/parcelapp.db', uri: 'file:///tmp/parcelapp.db' }) }
+}));
+
+// The refresh opens the bundled copy through openDatabaseSync
+let mockBundledDb: any = null;
+jest.mock('expo-sqlite', () => ({
+  openDatabaseSync: () => mockBundledDb,
+}));
+
+jest.mock('react-native', () => ({ Platform: { OS: 'android' } }));
+
+jest.mock('../prebuilt/parcelapp.meta.json', () => ({ version: 'bundle-v2', counts: { total: 3 } }));
+jest.mock('../prebuilt/parcelapp.db', () => 1);
+
+import DatabaseManager from '../src/data/database';
+
+const GEOMETRY = JSON.stringify({ type: 'Polygon', coordinates: [[[0, 0], [0.001, 0], [0.001, 0.001], [0, 0.001], [0, 0]]] });
+const BUNDLED_PARCELS = [1, 2, 3].map((id) => ({ id, num_parcel: `B-${id}`, geometry: GEOMETRY, properties: '{}' }));
+const BUNDLED_EDGES = [
+  { parcel_id: 1, neighbor_id: 2, distance_m: 0, touches: 1 },
+  { parcel_id: 1, neighbor_id: 3, distance_m: 12.5, touches: 0 },
+  { parcel_id: 2, neighbor_id: 1, distance_m: 0, touches: 1 },
+];
+const PARCEL_COLUMNS = ['id', 'num_parcel', 'geometry', 'properties'].map((name) => ({ name }));
+
+// expo-sqlite accepts both spread and array params
+const args = (p: any[]) => (p.length === 1 && Array.isArray(p[0]) ? p[0] : p);
+
+// statsTotal: parcel_stats type totals (undefined: no parcel_stats table)
+function makeLocalDb(meta: { [k: string]: string }, parcelCount: number, statsTotal?: number) {
+  const db: any = {
+    meta: { ...meta },
+    queries: [] as string[],
+    exec: [] as string[],
+    inserts: {} as { [sql: string]: any[][] },
+    getFirstSync: (sql: string, ...p: any[]) => {
+      db.queries.push(sql);
+      if (sql.includes('sqlite_master') && sql.includes('parcel_stats')) return { count: statsTotal == null ? 0 : 1 };
+      if (sql.includes('SUM(parcel_count)')) return { count: statsTotal };
+      if (sql.includes('FROM meta WHERE key')) {
+        const v = db.meta[args(p)[0]];
+        return v == null ? null : { value: v };
+      }
+      if (sql.includes('COUNT(*)') && sql.includes('FROM parcels')) return { count: parcelCount };
+      return null;
+    },
+    getAllSync: (sql: string) => (sql.includes('PRAGMA table_info(parcels)') ? PARCEL_COLUMNS : []),
+    execSync: (sql: string) => { db.exec.push(sql); },
+    runSync: (sql: string, ...p: any[]) => {
+      const [key, value] = args(p);
+      if (sql.includes('INTO meta')) db.meta[key] = value;
+      if (sql.includes('DELETE FROM meta')) delete db.meta[key];
+    },
+    prepareSync: (sql: string) => {
+      db.inserts[sql] = [];
+      return { executeSync: (vals: any[]) => { db.inserts[sql].push(vals); }, finalizeSync: () => { } };
+    },
+    closeSync: () => { },
+  };
+  return db;
+}
+
+function makeBundledDb() {
+  return {
+    getFirstSync: (sql: string) => {
+      if (sql.includes("key = 'count_total'")) return { count: BUNDLED_PARCELS.length };
+      if (sql.includes('sqlite_master') && sql.includes('parcel_neighbors')) {
+        return { sql: 'CREATE TABLE parcel_neighbors (parcel_id INTEGER NOT NULL, neighbor_id INTEGER NOT NULL, distance_m REAL NOT NULL, touches INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (parcel_id, neighbor_id)) WITHOUT ROWID' };
+      }
+      return null;
+    },
+    getAllSync: (sql: string, ...p: any[]) => {
+      const a = args(p);
+      if (sql.includes('PRAGMA table_info(parcels)')) return PARCEL_COLUMNS;
+      if (sql.includes('FROM parcels WHERE id > ?')) return BUNDLED_PARCELS.filter((r) => r.id > a[0]).slice(0, a[1]);
+      if (sql.includes('FROM parcel_neighbors WHERE (parcel_id, neighbor_id) > (?, ?)')) {
+        return BUNDLED_EDGES.filter((e) => e.parcel_id > a[0] || (e.parcel_id === a[0] && e.neighbor_id > a[1])).slice(0, a[2]);
+      }
+      return [];
+    },
+    closeSync: () => { },
+  };
+}
+
+describe('Bundled neighbor graph', () => {
+  let origDb: any;
+
+  beforeEach(() => {
+    origDb = (DatabaseManager as any).db;
+    (DatabaseManager as any).neighborGraph = null;
+    mockBundledDb = null;
+  });
+
+  afterEach(() => {
+    (DatabaseManager as any).db = origDb;
+    (DatabaseManager as any).neighborGraph = null;
+  });
+
+  it('reads neighbors from parcel_neighbors joined on parcels.id', async () => {
+    const queries: string[] = [];
+    (DatabaseManager as any).db = {
+      getFirstSync: (sql: string) => {
+        if (sql.includes('sqlite_master')) return { count: 1 };
+        return { id: 1, geometry: GEOMETRY };
+      },
+      getAllSync: (sql: string, ...p: any[]) => {
+        queries.push(sql);
+        if (sql.includes('FROM parcel_neighbors n JOIN parcels p ON p.id = n.neighbor_id') && args(p)[0] === 1) {
+          return [{ num_parcel: 'B-2', __neighbor_distance_m: 0 }, { num_parcel: 'B-3', __neighbor_distance_m: 12.5 }];
+        }
+        return [];
+      },
+      prepareSync: () => { throw new Error('spatial query should not run'); },
+      execSync: () => { },
+    };
+
+    const neighbors = await (DatabaseManager as any).getNeighborParcels('GRAPH-1');
+    expect(neighbors.map((n: any) => n.num_parcel)).toEqual(['B-2', 'B-3']);
+    expect(neighbors[1].__neighbor_distance_m).toBe(12.5);
+    expect(neighbors[1].__neighbor_within_1km).toBe(true);
+    expect(queries.filter((sql) => sql.includes('parcel_neighbors'))).toHaveLength(1);
+    expect(queries.some((sql) => sql.includes('num_parcel !='))).toBe(false);
+  });
+
+  it('skips the refresh on first launch when the working DB is the bundled copy', async () => {
+    const local = makeLocalDb({ version: 'bundle-v2' }, 3);
+    (DatabaseManager as any).db = local;
+
+    await (DatabaseManager as any).maybeRefreshParcelsFromBundledDb();
+
+    expect(local.exec).toEqual([]);
+    expect(Object.keys(local.inserts)).toEqual([]);
+    expect(local.meta.prebuilt_version).toBe('bundle-v2');
+    expect(local.meta.prebuilt_parcels_total).toBe('3');
+  });
+
+  it('keeps the generator ids and copies parcel_neighbors when refreshing', async () => {
+    const local = makeLocalDb({ version: 'bundle-v1', prebuilt_version: 'bundle-v1' }, 2);
+    (DatabaseManager as any).db = local;
+    mockBundledDb = makeBundledDb();
+
+    await (DatabaseManager as any).maybeRefreshParcelsFromBundledDb();
+
+    const parcelInsert = Object.keys(local.inserts).find((sql) => sql.startsWith('INSERT INTO parcels'));
+    expect(parcelInsert).toContain('(id, num_parcel, geometry, properties)');
+    expect(local.inserts[parcelInsert as string].map((v: any[]) => v[0])).toEqual([1, 2, 3]);
+
+    const graphInsert = Object.keys(local.inserts).find((sql) => sql.startsWith('INSERT INTO parcel_neighbors'));
+    expect(local.inserts[graphInsert as string]).toEqual(BUNDLED_EDGES.map((e) => [e.parcel_id, e.neighbor_id, e.distance_m, e.touches]));
+    expect(local.exec).toContain('DROP TABLE IF EXISTS parcel_neighbors;');
+
+    // Tables keyed by the previous bundle's ids are dropped, the copied graph is kept
+    const dropped = local.exec.filter((sql: string) => /^DROP TABLE IF EXISTS \w+$/.test(sql));
+    expect(dropped).toEqual(expect.arrayContaining(['DROP TABLE IF EXISTS parcels_rtree', 'DROP TABLE IF EXISTS parcels_fts', 'DROP TABLE IF EXISTS parcel_stats']));
+    expect(dropped).not.toContain('DROP TABLE IF EXISTS parcel_neighbors');
+    expect(local.meta.prebuilt_version).toBe('bundle-v2');
+    expect(local.meta.count_total).toBe('3');
+  });
+
+  it('drops parcel_neighbors when the bundle has no graph', async () => {
+    const local = makeLocalDb({ prebuilt_version: 'bundle-v1' }, 2);
+    (DatabaseManager as any).db = local;
+    mockBundledDb = { ...makeBundledDb(), getFirstSync: (sql: string) => (sql.includes("key = 'count_total'") ? { count: 3 } : null) };
+
+    await (DatabaseManager as any).maybeRefreshParcelsFromBundledDb();
+
+    expect(Object.keys(local.inserts).some((sql) => sql.startsWith('INSERT INTO parcel_neighbors'))).toBe(false);
+    expect(local.exec).toContain('DROP TABLE IF EXISTS parcel_neighbors');
+  });
+});
+
+describe('Local parcel count', () => {
+  let origDb: any;
+  const countQueries = (db: any) => db.queries.filter((sql: string) => sql.includes('COUNT(*) as count FROM parcels'));
+
+  beforeEach(() => {
+    origDb = (DatabaseManager as any).db;
+    mockBundledDb = null;
+  });
+
+  afterEach(() => {
+    (DatabaseManager as any).db = origDb;
+  });
+
+  it('reads the meta count instead of counting parcels', async () => {
+    const local = makeLocalDb({ version: 'bundle-v2', count_total: '3' }, 0);
+    (DatabaseManager as any).db = local;
+
+    await (DatabaseManager as any).maybeRefreshParcelsFromBundledDb();
+
+    expect(countQueries(local)).toHaveLength(0);
+    expect(local.exec).toEqual([]);
+    expect(local.meta.prebuilt_version).toBe('bundle-v2');
+  });
+
+  it('falls back to parcel_stats, then COUNT(*)', () => {
+    const withStats = makeLocalDb({}, 0, 3);
+    (DatabaseManager as any).db = withStats;
+    expect((DatabaseManager as any).getLocalParcelCount()).toBe(3);
+    expect(countQueries(withStats)).toHaveLength(0);
+
+    const bare = makeLocalDb({}, 5);
+    (DatabaseManager as any).db = bare;
+    expect((DatabaseManager as any).getLocalParcelCount()).toBe(5);
+    expect(countQueries(bare)).toHaveLength(1);
+  });
+
+  it('drops the stored counts when parcels are reseeded', () => {
+    const local = makeLocalDb({ count_total: '3' }, 3, 3);
+    (DatabaseManager as any).db = local;
+
+    (DatabaseManager as any).invalidateLocalParcelCount();
+
+    expect(local.meta.count_total).toBeUndefined();
+    expect(local.exec).toContain('DROP TABLE IF EXISTS parcel_stats');
+  });
+});
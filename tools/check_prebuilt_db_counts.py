@@ -9,9 +9,18 @@ cur = con.cursor()
 def q(sql: str) -> int:
     return int(cur.execute(sql).fetchone()[0])
 
+def type_counts() -> dict:
+    # parcel_stats is materialized by scripts/generate_prebuilt_db.py; older DBs are counted
+    try:
+        rows = cur.execute("select parcel_type, parcel_count from parcel_stats where dimension='type'").fetchall()
+    except sqlite3.OperationalError:
+        rows = cur.execute("select parcel_type, count(1) from parcels group by parcel_type").fetchall()
+    return {t: int(n) for t, n in rows}
+
+counts = type_counts()
 print("DB:", p)
-print("parcels:", q("select count(1) from parcels"))
-print("individuel:", q("select count(1) from parcels where parcel_type='individuel'"))
-print("collectif:", q("select count(1) from parcels where parcel_type='collectif'"))
+print("parcels:", sum(counts.values()))
+print("individuel:", counts.get("individuel", 0))
+print("collectif:", counts.get("collectif", 0))
 
 con.close()